@@ -14,6 +14,7 @@ with
     select
       model_id
       , model_name
+      , report_date
       , performance_group
     , count_of_buy_products
       , case
@@ -44,6 +45,7 @@ select
   , b.product_type
   , b.product_system
   , b.brand
+  , p.report_date
 from current_model_performance as p
   inner join model_brand as b
     on p.model_id = b.model_id
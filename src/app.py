@@ -11,13 +11,28 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 log = logging.getLogger(__name__)
 
 
+@app.before_request
+def start_refresher():
+    """Start this worker's dataset refresher (after any fork), once."""
+    search_service.start_refresher()
+
+
 @app.route("/", methods=["GET", "POST"])
 def index():
-    """Main search page and results."""
+    """Main search page and results. An optional `market` field picks the market."""
+    try:
+        market = search_service.resolve_market(request.values.get("market"))
+    except search_service.UnknownMarket as e:
+        return render_template(
+            "index.html",
+            error=str(e),
+            results=search_service.get_popular_results(),
+            query="",
+        ), 400
     if request.method == "POST":
         query = request.form.get("query", "")
         if not query:
-            results_list = search_service.get_popular_results()
+            results_list = search_service.get_popular_results(market=market)
             return render_template(
                 "index.html",
                 error="Please enter a search query.",
@@ -25,21 +40,21 @@ def index():
                 query=query,
             )
         try:
-            results_list = search_service.perform_search(query)
+            results_list = search_service.perform_search(query, market=market)
             mpb_link = f"https://www.mpb.com/en-uk/search?q={query}" if query else ""
             return render_template(
                 "results.html", query=query, results=results_list, mpb_link=mpb_link
             )
         except Exception as e:
             log.error(f"Search error: {e}")
-            results_list = search_service.get_popular_results()
+            results_list = search_service.get_popular_results(market=market)
             return render_template(
                 "index.html",
                 error="An error occurred during search.",
                 results=results_list,
                 query=query,
             )
-    results_list = search_service.get_popular_results()
+    results_list = search_service.get_popular_results(market=market)
     return render_template("index.html", results=results_list, query="")
 
 
@@ -48,10 +63,30 @@ def suggest():
     """AJAX endpoint for search suggestions."""
     data = request.get_json()
     partial = data.get("partial", "")
-    suggestions = search_service.get_suggestions(partial)
+    try:
+        suggestions = search_service.get_suggestions(partial, market=data.get("market"))
+    except search_service.UnknownMarket as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({"suggestions": suggestions})
 
 
+@app.route("/search/batch", methods=["POST"])
+def search_batch():
+    """JSON endpoint scoring many queries in one engine call, in an optional `market`."""
+    data = request.get_json(silent=True) or {}
+    try:
+        queries, top_k = search_service.parse_search_batch(data)
+    except search_service.InvalidRequest as e:
+        return jsonify({"error": str(e)}), e.status
+    try:
+        results = search_service.perform_search_many(
+            queries, top_k=top_k, market=data.get("market")
+        )
+    except search_service.UnknownMarket as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"results": results})
+
+
 @app.errorhandler(500)
 def internal_error(error):
     log.error(f"Internal server error: {error}")
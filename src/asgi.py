@@ -0,0 +1,226 @@
+"""
+ASGI entry point serving the same routes as app.py plus a JSON /search route, built on
+Starlette. Search calls run on a bounded thread pool, so the event loop stays free while
+matchers run in native code. Run from src/:
+
+    uvicorn asgi:app
+
+A search whose client disconnects is cancelled at its next matcher boundary, and
+requests arriving while ASYNC_MAX_PENDING calls are in flight get a 503. Like the Flask
+app, every route allows cross-origin requests from any origin.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import threading
+from pathlib import Path
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+from services import search_service
+from services.executor import BoundedExecutor, ExecutorBusy
+from core.engine import SearchCancelled
+from config.settings import ASYNC_EXECUTOR_WORKERS, ASYNC_MAX_PENDING
+
+log = logging.getLogger(__name__)
+
+SRC_DIR = Path(__file__).parent
+
+templates = Jinja2Templates(directory=SRC_DIR / "templates")
+executor = BoundedExecutor(max_workers=ASYNC_EXECUTOR_WORKERS, max_pending=ASYNC_MAX_PENDING)
+# Routes answering in JSON, errors included
+JSON_ROUTES = {"/suggest", "/search", "/search/batch"}
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before its response is ready."""
+
+
+class SearchResponse(JSONResponse):
+    """JSONResponse that, like Flask's jsonify, writes dates and numpy scalars as text."""
+
+    def render(self, content) -> bytes:
+        return json.dumps(content, default=str).encode()
+
+
+async def _wait_disconnect(request: Request) -> None:
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _json(request: Request):
+    """Parsed JSON body, or None if it is not valid JSON."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def run_search(request: Request, func, *args, **kwargs):
+    """
+    Run a blocking search call on the executor. If the client disconnects first, the
+    search is told to stop at its next matcher boundary and ClientDisconnected is raised.
+    Raises ExecutorBusy if the executor is full.
+    """
+    cancel = threading.Event()
+    work = asyncio.ensure_future(executor.run(func, *args, cancel=cancel, **kwargs))
+    disconnect = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+    if not work.done():
+        cancel.set()
+        work.cancel()
+        raise ClientDisconnected()
+    return work.result()
+
+
+async def _index_page(
+    request: Request, status: int = 200, error: str = None, query: str = "", market=None
+) -> Response:
+    """
+    index.html above the market's popular products. An error page is still rendered,
+    without them, while the executor is full.
+    """
+    try:
+        results_list = await run_search(
+            request, search_service.get_popular_results, market=market
+        )
+    except ExecutorBusy:
+        if error is None:
+            raise
+        results_list = []
+    context = {"error": error, "results": results_list, "query": query}
+    return templates.TemplateResponse(request, "index.html", context, status_code=status)
+
+
+async def index(request: Request) -> Response:
+    """Main search page and results. An optional `market` field picks the market."""
+    form = await request.form() if request.method == "POST" else {}
+    try:
+        market = search_service.resolve_market(
+            form.get("market") or request.query_params.get("market")
+        )
+    except search_service.UnknownMarket as e:
+        return await _index_page(request, 400, error=str(e))
+    if request.method != "POST":
+        return await _index_page(request, market=market)
+    query = form.get("query", "")
+    if not query:
+        return await _index_page(request, error="Please enter a search query.", market=market)
+    try:
+        results_list = await run_search(
+            request, search_service.perform_search, query, market=market
+        )
+    except (ClientDisconnected, ExecutorBusy, SearchCancelled):
+        raise
+    except Exception as e:
+        log.error(f"Search error: {e}")
+        return await _index_page(
+            request, error="An error occurred during search.", query=query, market=market
+        )
+    mpb_link = f"https://www.mpb.com/en-uk/search?q={query}"
+    context = {"query": query, "results": results_list, "mpb_link": mpb_link}
+    return templates.TemplateResponse(request, "results.html", context)
+
+
+async def suggest(request: Request) -> Response:
+    """AJAX endpoint for search suggestions."""
+    data = await _json(request) or {}
+    partial = data.get("partial", "")
+    suggestions = await run_search(
+        request, search_service.get_suggestions, partial, market=data.get("market")
+    )
+    return SearchResponse({"suggestions": suggestions})
+
+
+async def search(request: Request) -> Response:
+    """JSON endpoint for a single query."""
+    data = await _json(request)
+    query, top_k = search_service.parse_search(data)
+    results = await run_search(
+        request, search_service.perform_search, query, top_k=top_k, market=data.get("market")
+    )
+    return SearchResponse({"results": results})
+
+
+async def search_batch(request: Request) -> Response:
+    """JSON endpoint scoring many queries in one engine call."""
+    data = await _json(request)
+    queries, top_k = search_service.parse_search_batch(data)
+    results = await run_search(
+        request,
+        search_service.perform_search_many,
+        queries,
+        top_k=top_k,
+        market=data.get("market"),
+    )
+    return SearchResponse({"results": results})
+
+
+async def _invalid_request(request: Request, exc: search_service.InvalidRequest) -> Response:
+    return SearchResponse({"error": str(exc)}, exc.status)
+
+
+async def _unknown_market(request: Request, exc: search_service.UnknownMarket) -> Response:
+    return SearchResponse({"error": str(exc)}, 400)
+
+
+async def _busy(request: Request, exc: ExecutorBusy) -> Response:
+    log.warning(
+        f"Search executor full ({executor.pending} pending), rejecting {request.url.path}."
+    )
+    return SearchResponse(
+        {"error": "Server busy, retry shortly."}, 503, headers={"Retry-After": "1"}
+    )
+
+
+async def _disconnected(request: Request, exc: Exception) -> Response:
+    # Nobody is left to read it
+    log.debug(f"Client disconnected, abandoned {request.url.path}.")
+    return Response(status_code=499)
+
+
+async def _server_error(request: Request, exc: Exception) -> Response:
+    # Starlette re-raises exc after this, so the server logs the traceback
+    if request.url.path in JSON_ROUTES:
+        return SearchResponse({"error": "Internal server error."}, 500)
+    context = {"error": "Internal server error.", "results": [], "query": ""}
+    return templates.TemplateResponse(request, "index.html", context, status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    search_service.start_refresher()
+    yield
+    executor.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route("/", index, methods=["GET", "POST"]),
+        Route("/suggest", suggest, methods=["POST"]),
+        Route("/search", search, methods=["POST"]),
+        Route("/search/batch", search_batch, methods=["POST"]),
+        Mount("/static", StaticFiles(directory=SRC_DIR / "static"), name="static"),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+    ],
+    exception_handlers={
+        search_service.InvalidRequest: _invalid_request,
+        search_service.UnknownMarket: _unknown_market,
+        ExecutorBusy: _busy,
+        ClientDisconnected: _disconnected,
+        SearchCancelled: _disconnected,
+        500: _server_error,
+    },
+    lifespan=lifespan,
+)
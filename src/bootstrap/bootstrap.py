@@ -12,26 +12,128 @@ from config.settings import (
     RAW_DB_SAVE_PATH,
     PROD_DB_SAVE_PATH,
     RELOAD,
-    MARKET,
+    QUERY_CACHE_PATH,
+    QUERY_CACHE_MAX_BYTES,
+    PIPELINE_CHECKPOINT_DIR,
+    STREAM_BUILD,
+    STREAM_PREFETCH,
+    MARKETS,
+    FUZZY_WORKERS,
+    FUZZY_SCORE_CUTOFF,
+    SEARCH_STRATEGY,
+    PARALLEL_MATCHERS,
+    CANDIDATE_POOLS,
+    EMBEDDING_CACHE_SIZE,
+    ENCODER_BACKEND,
+    ENCODER_MODEL_NAME,
+    ENCODER_MODEL_REVISION,
+    EMBEDDING_STORE_PATH,
+    ONNX_MODEL_DIR,
+    ONNX_QUANTIZED,
+    ONNX_INTRA_OP_THREADS,
+    FAISS_INDEX_SPEC,
 )
 from services.bq_helper import BQHelper
+from services.query_cache import QueryCache
 from core.pipeline import build_pipeline
-from core.matchers import FuzzyMatcher, SemanticMatcher, ExactMatcher, PopularMatcher
-from core.transformers import SentenceTransformerWrapper
+from core.matchers import (
+    FuzzyMatcher,
+    SemanticMatcher,
+    ExactMatcher,
+    PopularMatcher,
+    SubsetMatcher,
+    IndexSpec,
+)
+from core.transformers import (
+    TransformerBase,
+    SentenceTransformerWrapper,
+    OnnxTransformerWrapper,
+)
+from core.embedding_store import EmbeddingStore
 from core.engine import SearchEngine
+from core.completion import PrefixIndex
 import os
+import threading
+from collections.abc import Callable
+from typing import NamedTuple
 import pandas as pd
 import logging
 
-def create_search_engine():
+log = logging.getLogger(__name__)
+
+def create_encoder() -> TransformerBase:
     """
-    Initialize and return the search engine and matcher weights.
-    Returns:
-        tuple: (search_engine, matcher_weights, dataset)
+    Create the query/catalog encoder selected by ENCODER_BACKEND, backed by the
+    persistent embedding store at EMBEDDING_STORE_PATH.
+    """
+    store = EmbeddingStore(EMBEDDING_STORE_PATH) if EMBEDDING_STORE_PATH else None
+    if ENCODER_BACKEND == "onnx":
+        return OnnxTransformerWrapper(
+            model_dir=ONNX_MODEL_DIR,
+            quantized=ONNX_QUANTIZED,
+            intra_op_threads=ONNX_INTRA_OP_THREADS,
+            cache_size=EMBEDDING_CACHE_SIZE,
+            embedding_store=store,
+        )
+    if ENCODER_BACKEND == "torch":
+        return SentenceTransformerWrapper(
+            model_name=ENCODER_MODEL_NAME,
+            cache_size=EMBEDDING_CACHE_SIZE,
+            revision=ENCODER_MODEL_REVISION,
+            embedding_store=store,
+        )
+    raise ValueError(f"Unknown encoder backend '{ENCODER_BACKEND}'.")
+
+
+class EngineState(NamedTuple):
+    """
+    Everything requests are served from, built together from one dataset version.
+    search_engines / completion_indexes: dicts keyed by Market.
+    """
+
+    search_engines: dict
+    matcher_weights: dict
+    dataset: Dataset
+    completion_indexes: dict
+
+
+class EngineHolder:
+    """
+    Holds the live EngineState. A request reads `current` once and uses that state
+    throughout, so it never mixes two versions; swap() replaces the state with a single
+    reference assignment while in-flight requests finish on the old one.
+    """
+
+    def __init__(self, state: EngineState):
+        self.current = state
+        self._listeners: list[Callable[[EngineState], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener: Callable[[EngineState], None]) -> None:
+        """
+        Call listener(new_state) after every swap, e.g. to invalidate caches.
+        """
+        self._listeners.append(listener)
+
+    def swap(self, state: EngineState) -> EngineState:
+        """
+        Make state the live state and return the previous one.
+        """
+        with self._lock:
+            previous, self.current = self.current, state
+        log.info(
+            f"Swapped engine state: dataset {previous.dataset.version} -> {state.dataset.version}."
+        )
+        for listener in self._listeners:
+            listener(state)
+        return previous
+
+
+def create_bq_helper() -> BQHelper:
+    """
+    Create the BigQuery helper used to load and refresh the dataset.
     """
-    # Data and model setup
-    log = logging.getLogger(__name__)
-    bq = BQHelper(
+    return BQHelper(
         billing_project_id=BQ_PROJECT_ID,
         write_project_id=BQ_PROJECT_ID,
         read_project_id=BQ_PROJECT_ID,
@@ -39,69 +141,148 @@ def create_search_engine():
         read_dataset=BQ_DATASET_ID,
         daw_dataset=BQ_DAW_DATASET_ID,
         sql_folder=BQ_SQL_FOLDER,
+        query_cache=(
+            QueryCache(QUERY_CACHE_PATH, max_bytes=QUERY_CACHE_MAX_BYTES)
+            if QUERY_CACHE_PATH is not None
+            else None
+        ),
     )
-    model = SentenceTransformerWrapper(model_name="all-MiniLM-L6-v2")
 
+
+def load_dataset(bq: BQHelper, model: TransformerBase) -> Dataset:
+    """
+    Load the processed dataset of every market from Parquet, or query and process it if
+    there is none yet.
+    """
     if os.path.exists(PROD_DB_SAVE_PATH):
         log.info(f"Loading processed dataset from Parquet: {PROD_DB_SAVE_PATH}")
         df = pd.read_parquet(PROD_DB_SAVE_PATH)
-        dataset = Dataset(QUERY_FILE, bq, RAW_DB_SAVE_PATH, market=MARKET)
+        dataset = Dataset(QUERY_FILE, bq, RAW_DB_SAVE_PATH, market=None)
         dataset._df = df
+    elif STREAM_BUILD:
+        dataset = Dataset(QUERY_FILE, bq, RAW_DB_SAVE_PATH, market=None)
+        dataset.stream_prepare(
+            pipeline=build_pipeline(model=model),
+            save_path=PROD_DB_SAVE_PATH,
+            prefetch=STREAM_PREFETCH,
+        )
+        dataset.summary()
+        log.info("Dataset streamed and processed successfully.")
     else:
-        dataset = Dataset(QUERY_FILE, bq, RAW_DB_SAVE_PATH, market=MARKET)
+        dataset = Dataset(QUERY_FILE, bq, RAW_DB_SAVE_PATH, market=None)
         dataset.load(reload=RELOAD)
         dataset.write(overwrite=True)
         dataset.summary()
-        dataset.prepare(pipeline=build_pipeline(model=model))
+        dataset.prepare(
+            pipeline=build_pipeline(model=model, checkpoint_dir=PIPELINE_CHECKPOINT_DIR)
+        )
         dataset.summary()
         dataset.write(save_path=PROD_DB_SAVE_PATH, overwrite=True)
         log.info("Dataset processing completed successfully.")
+    return dataset
+
 
-    # Instantiate matchers
-    fuzzy_model = FuzzyMatcher(column="model_name", df=dataset.df)
-    fuzzy_brand = FuzzyMatcher(column="brand", df=dataset.df)
-    # fuzzy_blob = FuzzyMatcher(column="blob", df=dataset.df)
+def build_engine_state(dataset: Dataset, model: TransformerBase) -> EngineState:
+    """
+    Build one search engine and completion index per served market from a processed
+    dataset (with embedding columns). The dataset holds every market; matchers (choices,
+    embeddings, FAISS index) are built once over all rows and shared by the market
+    engines through SubsetMatcher views, so a model_name sold in several markets is
+    embedded and indexed once.
+    """
+    # Embeddings as contiguous matrices, so pre-forked workers share them copy-on-write
+    dataset.compact()
+
+    # Instantiate matchers over every market's rows
+    fuzzy_kwargs = {"workers": FUZZY_WORKERS, "score_cutoff": FUZZY_SCORE_CUTOFF}
+    fuzzy_model = FuzzyMatcher(column="model_name", df=dataset.df, **fuzzy_kwargs)
+    fuzzy_brand = FuzzyMatcher(column="brand", df=dataset.df, **fuzzy_kwargs)
+    fuzzy_blob = FuzzyMatcher(column="blob", df=dataset.df, **fuzzy_kwargs)
     semantic_model = SemanticMatcher(
         embedding_column="model_name_embedding",
         encoder=model,
         df=dataset.df,
+        index_spec=IndexSpec(**FAISS_INDEX_SPEC),
+        emb_matrix=dataset.embeddings["model_name_embedding"],
+        key_column="model_name",
     )
     # semantic_blob = SemanticMatcher(
     #     embedding_column="blob_embedding",
     #     encoder=model,
     #     df=dataset.df,
+    #     emb_matrix=dataset.embeddings["blob_embedding"],
+    #     key_column="blob",
     # )
     exact_model = ExactMatcher(column="model_name", df=dataset.df)
     exact_blob = ExactMatcher(column="blob", df=dataset.df)
-    popular = PopularMatcher(
-        popularity_column="count_of_buy_products",
-        df=dataset.df,
-    )
+    shared_matchers = {
+        "fuzzy_model": fuzzy_model,
+        "fuzzy_brand": fuzzy_brand,
+        "fuzzy_blob": fuzzy_blob,
+        "semantic_model": semantic_model,
+        # "semantic_blob": semantic_blob,
+        "exact_model": exact_model,
+        "exact_blob": exact_blob,
+    }
+    # The FAISS indexes hold their own copies of the embeddings
+    dataset.embeddings.clear()
 
-    search_engine = SearchEngine(
-        dataset=dataset,
-        matchers={
-            "fuzzy_model": fuzzy_model,
-            "fuzzy_brand": fuzzy_brand,
-            # "fuzzy_blob": fuzzy_blob,
-            "semantic_model": semantic_model,
-            # "semantic_blob": semantic_blob,
-            "exact_model": exact_model,
-            "exact_blob": exact_blob,
-            "popular": popular,
-        },
-    )
     matcher_weights = {
         "fuzzy_model": 0.5,
         "fuzzy_brand": 0.1,
-        # "fuzzy_blob": 0.2,
+        "fuzzy_blob": 0.2,
         "semantic_model": 0.4,
         # "semantic_blob": 0.4,
         "exact_model": 0.1,
         "exact_blob": 0.1,
         "popular": 0.1,
     }
-    return search_engine, matcher_weights, dataset
 
-# Default singletons for app usage
-search_engine, matcher_weights, dataset = create_search_engine()
+    # Per market: a row-id view of the shared matchers, its own popularity and completions
+    search_engines, completion_indexes = {}, {}
+    for market in MARKETS:
+        view = dataset.market_view(market)
+        if len(view.df) == 0:
+            log.warning(f"No rows for market {market.value}; its searches will be empty.")
+        matchers = {
+            name: SubsetMatcher(matcher, view.row_ids, view.df)
+            for name, matcher in shared_matchers.items()
+        }
+        matchers["popular"] = PopularMatcher(
+            popularity_column="count_of_buy_products",
+            df=view.df,
+        )
+        search_engines[market] = SearchEngine(
+            dataset=view,
+            matchers=matchers,
+            strategy=SEARCH_STRATEGY,
+            candidate_pools=CANDIDATE_POOLS,
+            parallel=PARALLEL_MATCHERS,
+        )
+        completion_indexes[market] = PrefixIndex.from_df(
+            view.df,
+            column="model_name",
+            brand_column="brand",
+            weight_column="count_of_buy_products",
+        )
+    return EngineState(search_engines, matcher_weights, dataset, completion_indexes)
+
+
+def create_search_engine(
+    bq: BQHelper | None = None, model: TransformerBase | None = None
+) -> EngineState:
+    """
+    Initialize and return the engine state: one search engine and completion index per
+    served market, the matcher weights and the dataset.
+    Returns:
+        EngineState: (search_engines, matcher_weights, dataset, completion_indexes)
+    """
+    bq = bq or create_bq_helper()
+    model = model or create_encoder()
+    return build_engine_state(load_dataset(bq, model), model)
+
+
+# Default singletons for app usage. Requests read engine.current; services.refresh swaps it.
+bq_helper = create_bq_helper()
+encoder = create_encoder()
+engine = EngineHolder(create_search_engine(bq_helper, encoder))
@@ -26,11 +26,94 @@ BQ_DAW_DATASET_ID = "dsci_daw"
 BQ_SQL_FOLDER = ROOT / "sql"
 
 QUERY_FILE = "get_raw_model_database"
+# Rows changed since a report_date, used by the background refresher
+DELTA_QUERY_FILE = "get_model_database_delta"
 RAW_DB_SAVE_PATH = ROOT / "data" / "db_raw.parquet"
 PROD_DB_SAVE_PATH = ROOT / "data" / "db_prod.parquet"
 RESULTS_SAVE_PATH = ROOT / "data" / "results.csv"
 LIMIT = None
 RELOAD = True
+# On-disk cache of query results keyed by the rendered SQL and the last-modified times
+# of the tables it reads, so reloads skip unchanged queries (None disables it)
+QUERY_CACHE_PATH = None
+QUERY_CACHE_MAX_BYTES = 2 * 1024**3
+# Seconds between incremental dataset refreshes in each serving worker (None disables).
+# Each worker rebuilds its engine after a refresh, which ends the copy-on-write sharing
+# of the preloaded engine (see gunicorn.conf.py)
+REFRESH_INTERVAL = None
+
+# Threads used by rapidfuzz batch scoring per fuzzy matcher (-1 = all cores)
+FUZZY_WORKERS = -1
+# Fuzzy scores (0-1) below this cutoff are zeroed, letting rapidfuzz skip them early
+FUZZY_SCORE_CUTOFF = 0.0
+
+# Maximum number of query embeddings cached by the encoder
+EMBEDDING_CACHE_SIZE = 4096
+
+# Encoder backend: "torch" (SentenceTransformer) or "onnx" (ONNX Runtime, see
+# OnnxTransformerWrapper.export for producing ONNX_MODEL_DIR)
+ENCODER_BACKEND = "torch"
+ENCODER_MODEL_NAME = "all-MiniLM-L6-v2"
+# Hub revision (commit hash) of ENCODER_MODEL_NAME, None for the latest. Persisted
+# embeddings are keyed by a hash of the loaded weights either way
+ENCODER_MODEL_REVISION = None
+ONNX_MODEL_DIR = ROOT / "models" / "all-MiniLM-L6-v2-onnx"
+ONNX_QUANTIZED = True
+ONNX_INTRA_OP_THREADS = 1
+
+# FAISS index used by semantic matchers, as IndexSpec fields. "flat" is exact; "hnsw",
+# "ivf_flat" and "ivf_pq" are approximate (compare with core.benchmarks.benchmark_index_specs).
+# Dense scoring still scores every row exactly, so only the staged strategy's candidate
+# search gets faster
+FAISS_INDEX_SPEC = {"kind": "flat"}
+
+# Build the dataset by streaming query result pages through the pipeline (bounded
+# memory, overlapped download/transform/embedding) instead of loading it whole, with
+# STREAM_PREFETCH pages queued between stages
+STREAM_BUILD = False
+STREAM_PREFETCH = 2
+# Pipeline step outputs, checkpointed so a rebuild resumes from the first changed step
+# (None disables them)
+PIPELINE_CHECKPOINT_DIR = ROOT / "data" / "checkpoints"
+# Persistent catalog embeddings keyed by (model, text), reused across pipeline builds
+# (None disables it)
+EMBEDDING_STORE_PATH = ROOT / "data" / "embedding_store"
+
+# Default SearchEngine strategy: "dense" scores every row, "staged" reranks a candidate
+# pool drawn from the cheap matchers below
+SEARCH_STRATEGY = "dense"
+# Run the matchers of a query concurrently on a shared thread pool sized to the host
+PARALLEL_MATCHERS = False
+
+# Result caches for /, /suggest: entries per cache, optional TTL (seconds) and size bound
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = None
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Result cache backend: "memory" (per worker process) or "sqlite" (shared by the workers
+# on a node, stored at RESULT_CACHE_PATH)
+RESULT_CACHE_BACKEND = "memory"
+RESULT_CACHE_PATH = ROOT / "data" / "result_cache.sqlite"
+# Seconds a sqlite cache hit leaves an entry's last-read time alone, so hot entries do not
+# take the database write lock on every read (LRU order is kept to this precision)
+RESULT_CACHE_TOUCH_INTERVAL = 60.0
+
+# Largest number of queries accepted by /search/batch in one request
+BATCH_SEARCH_MAX_QUERIES = 1000
+# Largest top_k accepted by the JSON search endpoints
+SEARCH_MAX_TOP_K = 100
+
+# Async (ASGI) server: threads running search calls off the event loop, and the most calls
+# queued or running at once before further requests are turned away with a 503
+ASYNC_EXECUTOR_WORKERS = os.cpu_count() or 1
+ASYNC_MAX_PENDING = 64
+
+# Staged retrieval candidate pool size per matcher
+CANDIDATE_POOLS = {
+    "exact_model": 200,
+    "exact_blob": 200,
+    "semantic_model": 300,
+    "popular": 50,
+}
 
 
 SCHEMA_COLUMNS = [
@@ -57,6 +140,19 @@ TEXT_COLUMNS = [
 
 MARKET_COLUMN = "market"
 
+# Text columns embedded by the pipeline into <column>_embedding
+EMBEDDING_COLUMNS = ["model_name", "blob"]
+
+# Dataset columns returned with each search result, in display order
+DISPLAY_COLUMNS = [
+    "model_name",
+    "primary_category",
+    "secondary_category",
+    "product_type",
+    "product_system",
+    "brand",
+]
+
 NOISE_WORDS = set(
     [
         "camera",
@@ -77,3 +173,6 @@ class Market(Enum):
 
 
 MARKET = Market.UK
+# Markets served by one multi-market engine. Requests pick one with a `market`
+# parameter and default to MARKET
+MARKETS = list(Market)
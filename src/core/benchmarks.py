@@ -0,0 +1,190 @@
+"""
+Offline benchmarks and parity checks used to choose between interchangeable components.
+"""
+import logging
+import time
+import faiss
+import numpy as np
+import pandas as pd
+from .matchers import FaissIndexManager, IndexSpec
+from .transformers import TransformerBase
+from .transforms import (
+    normalise,
+    blob,
+    remove_stopwords,
+    remove_duplicates,
+    normalise_text,
+    strip_stopwords,
+)
+from config.settings import TEXT_COLUMNS, NOISE_WORDS
+
+log = logging.getLogger(__name__)
+
+
+def _normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def _mean_latency_ms(encoder: TransformerBase, queries: list[str]) -> float:
+    # Bypass the query cache so every call pays for a forward pass
+    start = time.perf_counter()
+    for query in queries:
+        encoder.encode([query])
+    return (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+
+
+def encoder_parity(
+    reference: TransformerBase,
+    candidate: TransformerBase,
+    texts: list[str],
+    queries: list[str],
+    k: int = 10,
+    batch_size: int = 64,
+) -> dict:
+    """
+    Compare a candidate encoder (e.g. quantized ONNX) against a reference encoder.
+
+    Reports the cosine similarity between both encoders' embeddings of the catalog texts,
+    recall@k of the candidate's catalog neighbours for each query against the
+    reference's, and the mean single-query encode latency of each encoder.
+    """
+    log.info(f"Encoding {len(texts)} catalog texts with both encoders")
+    ref_catalog = _normalise_rows(reference.encode(texts, batch_size=batch_size))
+    cand_catalog = _normalise_rows(candidate.encode(texts, batch_size=batch_size))
+    cosine = np.sum(ref_catalog * cand_catalog, axis=1)
+
+    ref_queries = _normalise_rows(reference.encode(queries, batch_size=batch_size))
+    cand_queries = _normalise_rows(candidate.encode(queries, batch_size=batch_size))
+    _, ref_ids = FaissIndexManager(ref_catalog).search(ref_queries, k)
+    _, cand_ids = FaissIndexManager(cand_catalog).search(cand_queries, k)
+    recall = [
+        len(set(expected) & set(actual)) / len(expected)
+        for expected, actual in zip(ref_ids.tolist(), cand_ids.tolist())
+    ]
+
+    report = {
+        "texts": len(texts),
+        "queries": len(queries),
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "cosine_delta_max": float(1.0 - cosine.min()),
+        f"recall@{k}": float(np.mean(recall)),
+        "reference_ms": _mean_latency_ms(reference, queries),
+        "candidate_ms": _mean_latency_ms(candidate, queries),
+    }
+    log.info(f"Encoder parity: {report}")
+    return report
+
+
+def benchmark_index_specs(
+    emb_matrix: np.ndarray,
+    specs: list[IndexSpec],
+    queries: np.ndarray | None = None,
+    k: int = 10,
+    n_queries: int = 200,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Measure recall@k and latency of FAISS index specs against exact flat search.
+
+    Each spec is built on the catalog embeddings and searched one query at a time, as in
+    serving. Query embeddings default to a random sample of catalog rows. Returns one
+    row per spec with build time, serialized size, recall@k and latency percentiles.
+    """
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(emb_matrix), size=min(n_queries, len(emb_matrix)), replace=False)
+        queries = emb_matrix[sample]
+    queries = np.asarray(queries, dtype=np.float32)
+    _, expected = FaissIndexManager(emb_matrix).search(queries, k)
+
+    rows = []
+    for spec in specs:
+        start = time.perf_counter()
+        manager = FaissIndexManager(emb_matrix, spec=spec)
+        build_s = time.perf_counter() - start
+        latencies, recall = [], []
+        for query, truth in zip(queries, expected):
+            start = time.perf_counter()
+            _, ids = manager.search(query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recall.append(len(set(truth.tolist()) & set(ids[0].tolist())) / len(truth))
+        rows.append(
+            {
+                "spec": spec.name,
+                "build_s": build_s,
+                "size_mb": faiss.serialize_index(manager.index).nbytes / 1e6,
+                f"recall@{k}": float(np.mean(recall)),
+                "mean_ms": float(np.mean(latencies)),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+            }
+        )
+        log.info(f"Index benchmark: {rows[-1]}")
+    return pd.DataFrame(rows)
+
+
+def _synthetic_catalog(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Catalog-like text columns (TEXT_COLUMNS) with repeated words, stopwords, mixed case
+    and stray whitespace, drawn from a small vocabulary.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(
+        [
+            "Canon", "Sony", "Nikon", "EOS", "R5", "a7", "III", "Mark", "II", "Z",
+            "50mm", "f/1.8", "Lens", "Camera", "Cameras", "Mirrorless", "DSLR", "Body",
+            "Kit", "Brand", "Product", "Full-Frame", "Zoom", "Prime",
+        ]
+    )
+    df = pd.DataFrame(index=range(rows))
+    for col in TEXT_COLUMNS:
+        tokens = words[rng.integers(len(words), size=(rows, 4))]
+        df[col] = [" " + " ".join(row) + "  " for row in tokens.tolist()]
+    return df
+
+
+def _scalar_step(df: pd.DataFrame, step: str) -> pd.Series:
+    # Row-wise reference for the steps that have a scalar form
+    if step == "normalise":
+        return df["model_name"].map(normalise_text)
+    return df["model_name"].map(lambda text: strip_stopwords(text, NOISE_WORDS))
+
+
+def benchmark_transforms(
+    sizes: tuple[int, ...] = (100_000, 1_000_000), seed: int = 0
+) -> pd.DataFrame:
+    """
+    Time the pipeline's text transforms on synthetic catalogs of each size.
+
+    Steps run in pipeline order (remove_stopwords, normalise, blob, remove_duplicates)
+    on a fresh copy per size. For remove_stopwords and normalise, the row-wise scalar
+    form is timed too and its output compared with the transform's. Returns one row per
+    step and size with seconds, rows per second and, where measured, the scalar time and
+    whether both outputs match.
+    """
+    rows = []
+    for size in sizes:
+        df = _synthetic_catalog(size, seed)
+        steps = [
+            ("remove_stopwords", lambda d: remove_stopwords(d, TEXT_COLUMNS, NOISE_WORDS)),
+            ("normalise", lambda d: normalise(d, TEXT_COLUMNS)),
+            ("blob", lambda d: blob(d, TEXT_COLUMNS, "blob")),
+            ("remove_duplicates", lambda d: remove_duplicates(d, ["blob"])),
+        ]
+        for name, step in steps:
+            row = {"step": name, "rows": size}
+            if name in ("remove_stopwords", "normalise"):
+                start = time.perf_counter()
+                expected = _scalar_step(df, name)
+                row["scalar_s"] = time.perf_counter() - start
+            start = time.perf_counter()
+            df = step(df)
+            row["seconds"] = time.perf_counter() - start
+            row["rows_per_s"] = size / row["seconds"]
+            if "scalar_s" in row:
+                row["matches_scalar"] = bool((df["model_name"] == expected).all())
+            rows.append(row)
+            log.info(f"Transform benchmark: {row}")
+    return pd.DataFrame(rows)
@@ -0,0 +1,136 @@
+import logging
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+from .matchers import get_column_safe, top_k_indices
+
+log = logging.getLogger(__name__)
+
+# Sorts after every other code point, so prefix + _MAX_CHAR bounds a prefix range
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def normalise_prefix(text: str) -> str:
+    """
+    Lowercase and collapse whitespace, keeping a single trailing space if the user typed
+    one (it marks the end of a word).
+    """
+    normalised = " ".join(text.lower().split())
+    if normalised and text[-1:].isspace():
+        normalised += " "
+    return normalised
+
+
+class PrefixIndex:
+    """
+    Sorted-array prefix index for autocomplete over completion labels (e.g. model names).
+
+    Every label is indexed under itself, each of its word suffixes ("a7 iii" for
+    "sony a7 iii") and optionally a brand-prefixed form. A prefix lookup is a binary
+    search for the range of keys starting with it; labels in the range are ranked by
+    popularity. The top labels of every prefix up to `cached_prefix_len` characters,
+    whose ranges are the widest, are precomputed at build time.
+    """
+
+    def __init__(
+        self,
+        keys: list[str],
+        key_labels: np.ndarray,
+        labels: list[str],
+        weights: np.ndarray,
+        top_k: int = 10,
+        cached_prefix_len: int = 3,
+    ):
+        """
+        Args:
+            keys (list[str]): Normalised search keys.
+            key_labels (np.ndarray): Label id of each key.
+            labels (list[str]): Completion text of each label id.
+            weights (np.ndarray): Popularity of each label id.
+            top_k (int): Number of completions precomputed per cached prefix.
+            cached_prefix_len (int): Longest prefix whose completions are precomputed.
+        """
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.key_labels = np.asarray(key_labels, dtype=np.int64)[order]
+        self.labels = labels
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.top_k = top_k
+        self.cached_prefix_len = cached_prefix_len
+        self._cache = {}
+        prefixes = {
+            key[:length]
+            for key in self.keys
+            for length in range(1, cached_prefix_len + 1)
+            if len(key) >= length
+        }
+        for prefix in prefixes:
+            self._cache[prefix] = self._rank(prefix, top_k)
+        log.info(
+            f"PrefixIndex built with {len(self.keys)} keys for {len(labels)} labels "
+            f"({len(self._cache)} cached prefixes)."
+        )
+
+    @classmethod
+    def from_df(
+        cls,
+        df: pd.DataFrame,
+        column: str = "model_name",
+        brand_column: str | None = "brand",
+        weight_column: str = "count_of_buy_products",
+        **kwargs,
+    ) -> "PrefixIndex":
+        """
+        Build an index whose completions are the distinct values of `column`, weighted by
+        the highest `weight_column` value among their rows.
+        """
+        values = get_column_safe(df, column).fillna("").astype(str)
+        codes, labels = pd.factorize(values, sort=True)
+        weights = np.zeros(len(labels), dtype=np.float64)
+        np.maximum.at(
+            weights, codes, get_column_safe(df, weight_column).fillna(0).to_numpy(float)
+        )
+        brands = (
+            get_column_safe(df, brand_column).fillna("").astype(str).tolist()
+            if brand_column
+            else [""] * len(df)
+        )
+        keys, key_labels, seen = [], [], set()
+        for label_id, brand in zip(codes, brands):
+            if (label_id, brand) in seen:
+                continue
+            seen.add((label_id, brand))
+            tokens = labels[label_id].lower().split()
+            label_keys = {" ".join(tokens[i:]) for i in range(len(tokens))}
+            brand = " ".join(brand.lower().split())
+            if brand and tokens and not " ".join(tokens).startswith(brand):
+                label_keys.add(f"{brand} {' '.join(tokens)}")
+            keys.extend(label_keys)
+            key_labels.extend([label_id] * len(label_keys))
+        return cls(keys, np.array(key_labels), list(labels), weights, **kwargs)
+
+    def _rank(self, prefix: str, top_k: int) -> np.ndarray:
+        """
+        Label ids completing the prefix, most popular first.
+        """
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _MAX_CHAR, lo)
+        label_ids = np.unique(self.key_labels[lo:hi])
+        return label_ids[top_k_indices(self.weights[label_ids], top_k)]
+
+    def complete(self, prefix: str, top_k: int = 10) -> list[str]:
+        """
+        Return up to top_k completions for the prefix, most popular first.
+        Args:
+            prefix (str): The partial query typed so far.
+            top_k (int): Maximum number of completions.
+        Returns:
+            list[str]: Completion labels (empty if nothing starts with the prefix).
+        """
+        prefix = normalise_prefix(prefix)
+        if not prefix:
+            return []
+        label_ids = self._cache.get(prefix) if top_k <= self.top_k else None
+        if label_ids is None:
+            label_ids = self._rank(prefix, top_k)
+        return [self.labels[i] for i in label_ids[:top_k]]
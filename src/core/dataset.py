@@ -1,8 +1,10 @@
 import os
+import hashlib
 import logging
+import numpy as np
 import pandas as pd
 from services.bq_helper import BQHelper
-from config.settings import Market, LIMIT
+from config.settings import Market, LIMIT, MARKET_COLUMN
 from .pipeline import Pipeline
 
 log = logging.getLogger(__name__)
@@ -18,11 +20,19 @@ class Dataset:
         query_file: str,
         bq_helper: BQHelper,
         save_path: str,
-        market: Market,
+        market: Market | None,
     ):
+        """
+        market: the market whose rows are loaded, or None to load every market.
+        """
         self.query_file = query_file
         self.bq_helper = bq_helper
         self._df: pd.DataFrame | None = None
+        self._version: str | None = None
+        # Contiguous embedding matrices moved out of the DataFrame by compact()
+        self.embeddings: dict[str, np.ndarray] = {}
+        # Rows of the parent dataset held by a market_view(), None for a loaded dataset
+        self.row_ids: np.ndarray | None = None
         self.save_path = save_path
         self.market = market
 
@@ -32,6 +42,18 @@ class Dataset:
             raise ValueError("DataFrame is not loaded. Call load() first.")
         return self._df
 
+    @property
+    def version(self) -> str:
+        """
+        Short content hash of the loaded data (embedding columns excluded). Changes
+        whenever the data does, so it can tag caches built from this dataset.
+        """
+        if self._version is None:
+            columns = [c for c in self.df.columns if not c.endswith("_embedding")]
+            hashed = pd.util.hash_pandas_object(self.df[columns], index=False)
+            self._version = hashlib.sha256(hashed.to_numpy().tobytes()).hexdigest()[:16]
+        return self._version
+
     def load(self, reload: bool = False) -> pd.DataFrame:
         """
         Loads the dataset from a CSV file if it exists, otherwise queries BigQuery.
@@ -46,9 +68,10 @@ class Dataset:
                 )
             log.info(f"Querying BigQuery using file: {self.query_file}")
             df = self.bq_helper.get(self.query_file)
-            self._df = df[df["market"] == self.market.value][:LIMIT].reset_index(
-                drop=True
-            )
+            if self.market is not None:
+                df = df[df[MARKET_COLUMN] == self.market.value]
+            self._df = df[:LIMIT].reset_index(drop=True)
+        self._version = None
         log.info(f"Dataset loaded with shape: {self._df.shape}")
         return self._df
 
@@ -90,3 +113,69 @@ class Dataset:
 
     def prepare(self, pipeline: Pipeline) -> pd.DataFrame:
         self._df = pipeline.run(self._df)
+        self._version = None
+
+    def stream_prepare(
+        self, pipeline: Pipeline, save_path: str, prefetch: int = 2
+    ) -> pd.DataFrame:
+        """
+        Stream the query result from BigQuery page by page through the pipeline into
+        save_path (see Pipeline.run_stream), without holding the raw result in memory.
+        The raw dataset is not saved in this mode.
+        """
+        if not self.bq_helper:
+            raise ValueError("bq_helper must be provided to stream data from BigQuery.")
+        log.info(f"Streaming BigQuery results of file: {self.query_file}")
+
+        def frames():
+            remaining = LIMIT
+            for batch in self.bq_helper.iter_batches(self.query_file):
+                df = batch.to_pandas()
+                if self.market is not None:
+                    df = df[df[MARKET_COLUMN] == self.market.value]
+                if remaining is not None:
+                    df = df[:remaining]
+                    remaining -= len(df)
+                yield df.reset_index(drop=True)
+                if remaining == 0:
+                    return
+
+        self._df = pipeline.run_stream(frames(), save_path, prefetch=prefetch)
+        self._version = None
+        log.info(f"Dataset streamed with shape: {self._df.shape}")
+        return self._df
+
+    def market_view(self, market: Market) -> "Dataset":
+        """
+        Dataset holding the rows of one market of a multi-market dataset, in their
+        original order, with `row_ids` mapping them back to this dataset's rows.
+        Matchers built on this dataset can be shared with the view via SubsetMatcher.
+        """
+        row_ids = np.flatnonzero(self.df[MARKET_COLUMN].to_numpy() == market.value)
+        view = Dataset(self.query_file, self.bq_helper, None, market)
+        view._df = self.df.iloc[row_ids].reset_index(drop=True)
+        view.row_ids = row_ids
+        log.info(f"Market view {market.value}: {len(row_ids)} of {len(self.df)} rows.")
+        return view
+
+    def compact(self) -> None:
+        """
+        Move the embedding columns out of the DataFrame into read-only, contiguous float32
+        matrices in `embeddings`, one row per DataFrame row.
+
+        An embedding column holds one Python array object per row; a matrix is a single
+        buffer, so pages inherited by forked workers stay shared instead of being copied
+        on the first refcount or GC touch. Call after write() if the saved file should
+        keep the embedding columns.
+        """
+        if self._df is None:
+            raise ValueError("DataFrame is not loaded. Call load() first.")
+        columns = [col for col in self._df.columns if col.endswith("_embedding")]
+        for column in columns:
+            matrix = np.ascontiguousarray(
+                np.stack(self._df[column].to_numpy()), dtype=np.float32
+            )
+            matrix.setflags(write=False)
+            self.embeddings[column] = matrix
+        self._df = self._df.drop(columns=columns)
+        log.info(f"Compacted embedding columns {columns} into contiguous matrices.")
@@ -0,0 +1,172 @@
+"""
+Persistent, content-addressed store of text embeddings, so rebuilds only encode texts
+whose embedding has never been computed by the same model.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embedding store keyed by a hash of (model fingerprint, text).
+
+    A store directory holds `vectors.f32`, the float32 embeddings one after another,
+    `keys.bin`, the 16-byte key of each row in the same order, and `meta.json` with the
+    dimension. Vectors are read through a memory map, so only the rows looked up are
+    paged in. Rows are only ever appended, never rewritten: a key added twice keeps its
+    first row. Appends from several processes are serialised by a file lock, and rows
+    appended by other processes are picked up on the next lookup.
+    """
+
+    KEY_BYTES = 16
+    VECTORS_FILE = "vectors.f32"
+    KEYS_FILE = "keys.bin"
+    META_FILE = "meta.json"
+    LOCK_FILE = "lock"
+
+    def __init__(self, path: str | Path):
+        """
+        Args:
+            path (str | Path): Store directory, created if missing.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim: int | None = None
+        self._rows: dict[bytes, int] = {}
+        self._vectors: np.ndarray | None = None
+        self._keys_read = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._sync()
+        log.info(f"Embedding store {self.path}: {len(self._rows)} vectors (dim={self.dim}).")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @classmethod
+    def key(cls, fingerprint: str, text: str) -> bytes:
+        """
+        Key of the embedding of text by the model identified by fingerprint.
+        """
+        digest = hashlib.blake2b(digest_size=cls.KEY_BYTES)
+        digest.update(fingerprint.encode())
+        digest.update(b"\0")
+        digest.update(text.encode())
+        return digest.digest()
+
+    def _complete_rows(self) -> int:
+        # A row counts once both its key and its vector are fully on disk
+        keys_path, vectors_path = self.path / self.KEYS_FILE, self.path / self.VECTORS_FILE
+        if self.dim is None or not keys_path.exists() or not vectors_path.exists():
+            return 0
+        return min(
+            keys_path.stat().st_size // self.KEY_BYTES,
+            vectors_path.stat().st_size // (self.dim * 4),
+        )
+
+    def _sync(self) -> None:
+        """
+        Index rows appended since the last sync and remap the vectors. Caller holds _lock.
+        """
+        # Another process may have created the store since this one opened it
+        meta = self.path / self.META_FILE
+        if self.dim is None and meta.exists():
+            self.dim = json.loads(meta.read_text())["dim"]
+        rows = self._complete_rows()
+        if rows == self._keys_read:
+            return
+        with open(self.path / self.KEYS_FILE, "rb") as f:
+            f.seek(self._keys_read * self.KEY_BYTES)
+            keys = f.read((rows - self._keys_read) * self.KEY_BYTES)
+        for i in range(rows - self._keys_read):
+            key = keys[i * self.KEY_BYTES : (i + 1) * self.KEY_BYTES]
+            self._rows.setdefault(key, self._keys_read + i)
+        self._keys_read = rows
+        self._vectors = np.memmap(
+            self.path / self.VECTORS_FILE, dtype=np.float32, mode="r", shape=(rows, self.dim)
+        )
+
+    def _write_meta(self) -> None:
+        # Readers open meta.json without the file lock: replace it whole, never half-written
+        tmp = self.path / f"{self.META_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path / self.META_FILE)
+
+    def get_many(self, fingerprint: str, texts: list[str]) -> dict[str, np.ndarray]:
+        """
+        Look up the stored embeddings of texts.
+        Returns:
+            dict[str, np.ndarray]: Embedding of each text found, keyed by text.
+        """
+        with self._lock:
+            self._sync()
+            found = {}
+            for text in texts:
+                row = self._rows.get(self.key(fingerprint, text))
+                if row is not None:
+                    found[text] = np.array(self._vectors[row])
+            return found
+
+    def add_many(self, fingerprint: str, texts: list[str], embeddings: np.ndarray) -> None:
+        """
+        Append the embeddings of texts not stored yet.
+        Args:
+            fingerprint (str): Identity of the model that produced the embeddings.
+            texts (list[str]): Embedded texts.
+            embeddings (np.ndarray): One embedding per text.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock, open(self.path / self.LOCK_FILE, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Under the file lock, so a store another process created is seen here
+                self._sync()
+                if self.dim is None:
+                    self.dim = embeddings.shape[1]
+                    self._write_meta()
+                if embeddings.shape[1] != self.dim:
+                    raise ValueError(
+                        f"Embedding dimension {embeddings.shape[1]} does not match store "
+                        f"dimension {self.dim}."
+                    )
+                rows = self._complete_rows()
+                # Drop a partial row left by an interrupted append before adding more
+                widths = {self.KEYS_FILE: self.KEY_BYTES, self.VECTORS_FILE: self.dim * 4}
+                for name, width in widths.items():
+                    file = self.path / name
+                    if file.exists() and file.stat().st_size != rows * width:
+                        os.truncate(file, rows * width)
+                new_keys, new_rows = {}, []
+                for i, text in enumerate(texts):
+                    key = self.key(fingerprint, text)
+                    if key not in self._rows and key not in new_keys:
+                        new_keys[key] = None
+                        new_rows.append(i)
+                if not new_keys:
+                    return
+                # Vectors first: a crash before the keys are written leaves no visible row
+                with open(self.path / self.VECTORS_FILE, "ab") as f:
+                    f.write(np.ascontiguousarray(embeddings[new_rows]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self.path / self.KEYS_FILE, "ab") as f:
+                    f.write(b"".join(new_keys))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._sync()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        log.info(f"Added {len(new_keys)} vectors to embedding store {self.path}.")
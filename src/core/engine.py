@@ -1,26 +1,206 @@
+import contextvars
 import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import NamedTuple
 import numpy as np
 import pandas as pd
 from .dataset import Dataset
+from .matchers import SCORE_DTYPE, top_k_indices
 
 log = logging.getLogger(__name__)
 
+# Event a caller sets to abandon a search in progress (e.g. when the client disconnects).
+# Searches check it between matcher calls and raise SearchCancelled once it is set.
+cancel_event: ContextVar[threading.Event | None] = ContextVar("cancel_event", default=None)
+
+
+class SearchCancelled(Exception):
+    """Raised inside a search whose cancel_event has been set."""
+
+
+def check_cancelled() -> None:
+    """
+    Raise SearchCancelled if the current context's cancel_event is set.
+    """
+    event = cancel_event.get()
+    if event is not None and event.is_set():
+        raise SearchCancelled()
+
+
+# Thread pool shared by every parallel SearchEngine in the process, created on first use
+# (so after any pre-fork) and sized to the host
+_matcher_pool: ThreadPoolExecutor | None = None
+_matcher_pool_lock = threading.Lock()
+
+
+def _shared_matcher_pool() -> ThreadPoolExecutor:
+    global _matcher_pool
+    with _matcher_pool_lock:
+        if _matcher_pool is None:
+            _matcher_pool = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 1, thread_name_prefix="matcher"
+            )
+        return _matcher_pool
+
+
+class Ranking(NamedTuple):
+    """
+    Ranked rows produced by a search strategy, before they are turned into results.
+    ids: row ids of the top results, best first.
+    combined: combined score of each row.
+    scores: dict of {matcher_name: scores aligned with ids}.
+    timings: dict of {matcher_name: seconds spent in the matcher's calls}.
+    """
+
+    ids: np.ndarray
+    combined: np.ndarray
+    scores: dict
+    timings: dict | None = None
+
 
 class SearchEngine:
     """
     Search engine system that loads a dataset and supports multiple matching strategies.
-    Matcher classes should implement a `match(query: str, df: pd.DataFrame, top_k: int) -> pd.DataFrame` method.
+    Matcher classes should implement a `match(query: str) -> np.ndarray` method returning
+    one float32 score per dataset row. `match_ids` and `match_top` (see MatcherBase) let
+    the staged strategy rank without dense score vectors.
     """
 
-    def __init__(self, dataset: Dataset, matchers: dict, weights: dict = None):
+    # Strategy name -> ranking method used by SearchEngine.search and search_records
+    STRATEGIES = {"dense": "_rank_dense", "staged": "_rank_staged"}
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        matchers: dict,
+        weights: dict = None,
+        strategy: str = "dense",
+        candidate_pools: dict = None,
+        parallel: bool = False,
+    ):
         """
         dataset: a Dataset instance (already loaded)
         matchers: dict of {matcher_name: matcher_instance}
         weights: dict of {matcher_name: float} for weighted search (optional)
+        strategy: default strategy used by search(), one of SearchEngine.STRATEGIES
+        candidate_pools: dict of {matcher_name: pool_size} used by the staged strategy
+            to generate candidates (optional)
+        parallel: run the matchers of a query concurrently on a shared thread pool.
+            Matchers spend most of their time in native code that releases the GIL, so
+            latency falls toward the slowest matcher. Fusion order is unchanged.
         """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(
+                f"Unknown search strategy '{strategy}'. Expected one of {list(self.STRATEGIES)}."
+            )
         self.dataset = dataset
         self.matchers = matchers
         self.weights = weights or {}
+        self.strategy = strategy
+        self.candidate_pools = candidate_pools or {}
+        self.parallel = parallel
+        # Per-thread score buffers, reused across queries to avoid n-sized allocations
+        self._buffers = threading.local()
+        # Column name -> numpy array of the dataset column, gathered by row id for results
+        self._columns = {}
+
+    def _score_buffers(self, n: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return this thread's (combined, scratch) score buffers, sized to n rows.
+        """
+        buffers = getattr(self._buffers, "arrays", None)
+        if buffers is None or len(buffers[0]) != n:
+            buffers = (np.empty(n, dtype=SCORE_DTYPE), np.empty(n, dtype=SCORE_DTYPE))
+            self._buffers.arrays = buffers
+        return buffers
+
+    def _normalise_weights(self, matcher_weights: dict) -> dict | None:
+        """
+        Normalize matcher weights to sum to 1, dropping unknown matchers.
+        Returns None if the weights sum to zero.
+        """
+        total_weight = sum(matcher_weights.values())
+        if total_weight == 0:
+            log.error("Matcher weights sum to zero. Cannot normalize.")
+            return None
+        norm_weights = {}
+        for matcher, weight in matcher_weights.items():
+            if matcher not in self.matchers:
+                log.warning(f"Matcher '{matcher}' not found, skipping.")
+                continue
+            norm_weights[matcher] = weight / total_weight
+        return norm_weights
+
+    def _run_matchers(
+        self, names: list[str], call: Callable[[str], object]
+    ) -> tuple[dict, dict]:
+        """
+        Call call(matcher_name) for each name, concurrently on the shared pool if the
+        engine is parallel. Results come back keyed in the order of names, never in
+        completion order, so score fusion is deterministic.
+        Returns:
+            tuple: ({matcher_name: result}, {matcher_name: seconds})
+        """
+
+        def timed(name: str):
+            check_cancelled()
+            start = time.perf_counter()
+            result = call(name)
+            return result, time.perf_counter() - start
+
+        if self.parallel and len(names) > 1:
+            pool = _shared_matcher_pool()
+            # Each task runs in a copy of the caller's context, so cancel_event reaches it
+            futures = [pool.submit(contextvars.copy_context().run, timed, name) for name in names]
+            try:
+                outcomes = [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        else:
+            outcomes = [timed(name) for name in names]
+        results = {name: result for name, (result, _) in zip(names, outcomes)}
+        timings = {name: seconds for name, (_, seconds) in zip(names, outcomes)}
+        log.debug(
+            "Matcher timings: "
+            + ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items())
+        )
+        return results, timings
+
+    def search(
+        self, query: str, matcher_weights: dict, top_k: int = 10
+    ) -> pd.DataFrame:
+        """
+        Search with the engine's configured strategy (see SearchEngine.STRATEGIES).
+        """
+        return self._build_results(self._rank(query, matcher_weights, top_k))
+
+    def search_records(
+        self,
+        query: str,
+        matcher_weights: dict,
+        top_k: int = 10,
+        columns: list[str] = None,
+    ) -> list[dict]:
+        """
+        Search with the engine's configured strategy and return compact result records:
+        one dict per hit holding only the requested display columns plus the matcher and
+        combined scores. Values are gathered by row id from cached column arrays, so no
+        DataFrame rows are copied.
+        """
+        return self._project(self._rank(query, matcher_weights, top_k), columns)
+
+    def _rank(self, query: str, matcher_weights: dict, top_k: int) -> Ranking | None:
+        log.info(
+            f"{self.strategy.capitalize()} search for query: '{query}' with weights: {matcher_weights}"
+        )
+        return getattr(self, self.STRATEGIES[self.strategy])(query, matcher_weights, top_k)
 
     def search_multi(
         self, query: str, matcher_weights: dict, top_k: int = 10
@@ -30,41 +210,274 @@ class SearchEngine:
         matcher_weights: dict of {matcher_name: weight}
         Returns a DataFrame of top results with a combined score.
         """
-
         log.info(
             f"Multi-matcher search for query: '{query}' with weights: {matcher_weights}"
         )
+        results = self._build_results(self._rank_dense(query, matcher_weights, top_k))
+        log.info(f"Multi-matcher search complete. Returning {len(results)} results.")
+        return results
+
+    def search_many(
+        self,
+        queries: list[str],
+        matcher_weights: dict,
+        top_k: int = 10,
+        batch_size: int = 64,
+    ) -> list[pd.DataFrame]:
+        """
+        Dense search for many queries in one call. Each matcher scores a batch of queries
+        at once (one transformer batch, one multi-query FAISS search, one fuzzy
+        query x choice matrix) and the weighted fusion runs over the whole batch.
+        batch_size bounds the (batch x rows) score matrices held in memory.
+        Returns one results DataFrame per query, ranked as search_multi would.
+        """
+        return [
+            self._build_results(ranking)
+            for ranking in self._rank_many(queries, matcher_weights, top_k, batch_size)
+        ]
+
+    def search_many_records(
+        self,
+        queries: list[str],
+        matcher_weights: dict,
+        top_k: int = 10,
+        columns: list[str] = None,
+        batch_size: int = 64,
+    ) -> list[list[dict]]:
+        """
+        Batch counterpart of search_records: one list of compact result records per query.
+        """
+        return [
+            self._project(ranking, columns)
+            for ranking in self._rank_many(queries, matcher_weights, top_k, batch_size)
+        ]
+
+    def _rank_many(
+        self, queries: list[str], matcher_weights: dict, top_k: int, batch_size: int
+    ) -> list[Ranking | None]:
+        log.info(
+            f"Batch search for {len(queries)} queries with weights: {matcher_weights}"
+        )
+        norm_weights = self._normalise_weights(matcher_weights)
+        if norm_weights is None:
+            return [None for _ in queries]
         n = len(self.dataset.df)
-        combined_score = np.zeros(n, dtype=float)
-        all_scores = {}
-        # Normalize matcher weights to sum to 1
-        total_weight = sum(matcher_weights.values())
-        if total_weight == 0:
-            log.error("Matcher weights sum to zero. Cannot normalize.")
-            return pd.DataFrame()
-        norm_weights = {k: v / total_weight for k, v in matcher_weights.items()}
-        for matcher, weight in norm_weights.items():
+        rankings = []
+        for start in range(0, len(queries), batch_size):
+            batch = list(queries[start : start + batch_size])
+            combined_score = np.zeros((len(batch), n), dtype=SCORE_DTYPE)
+            scratch = np.empty_like(combined_score)
+            all_scores = {}
+            results, timings = self._run_matchers(
+                list(norm_weights), lambda matcher: self.matchers[matcher].match_many(batch)
+            )
+            for matcher, weight in norm_weights.items():
+                scores = np.asarray(results[matcher], dtype=SCORE_DTYPE)
+                if scores.shape != (len(batch), n):
+                    log.warning(
+                        f"Matcher '{matcher}' did not return a valid score matrix, skipping."
+                    )
+                    continue
+                all_scores[matcher] = scores
+                np.multiply(scores, weight, out=scratch)
+                combined_score += scratch
+            for row in range(len(batch)):
+                if not combined_score[row].any():
+                    rankings.append(None)
+                    continue
+                top_idx = top_k_indices(combined_score[row], top_k)
+                rankings.append(
+                    Ranking(
+                        top_idx,
+                        combined_score[row, top_idx],
+                        {matcher: scores[row, top_idx] for matcher, scores in all_scores.items()},
+                        timings,
+                    )
+                )
+        log.info(f"Batch search complete for {len(queries)} queries.")
+        return rankings
+
+    def search_staged(
+        self,
+        query: str,
+        matcher_weights: dict,
+        top_k: int = 10,
+        candidate_pools: dict = None,
+    ) -> pd.DataFrame:
+        """
+        Two-stage retrieval. Stage one unions the top candidates of cheap matchers
+        (lexical hits, FAISS neighbours, popularity head), sized per matcher by
+        candidate_pools (defaults to the engine's). Stage two scores only those rows
+        with the full weighted matcher mix, so per-query cost follows the pool size
+        rather than the catalog size. Use recall_at_k to measure what the pools miss.
+        """
+        log.info(
+            f"Staged search for query: '{query}' with weights: {matcher_weights}"
+        )
+        results = self._build_results(
+            self._rank_staged(query, matcher_weights, top_k, candidate_pools)
+        )
+        log.info(f"Staged search complete. Returning {len(results)} results.")
+        return results
+
+    def recall_at_k(
+        self,
+        queries: list[str],
+        matcher_weights: dict,
+        top_k: int = 10,
+        candidate_pools: dict = None,
+    ) -> pd.DataFrame:
+        """
+        Diagnostic comparing staged retrieval against a full dense scan.
+        Returns one row per query with the candidate pool size and the fraction of the
+        dense top_k that staged retrieval also returned.
+        """
+        rows = []
+        for query in queries:
+            expected = self._rank_dense(query, matcher_weights, top_k)
+            pool = self.candidate_ids(query, candidate_pools)
+            actual = self._rank_staged(query, matcher_weights, top_k, candidate_pools)
+            if expected is None or len(expected.ids) == 0:
+                recall = np.nan
+            else:
+                found = np.isin(expected.ids, actual.ids) if actual is not None else False
+                recall = float(np.mean(found))
+            rows.append({"query": query, "candidates": len(pool), f"recall@{top_k}": recall})
+        report = pd.DataFrame(rows)
+        log.info(
+            f"Staged recall@{top_k} over {len(queries)} queries: "
+            f"{report[f'recall@{top_k}'].mean():.3f} "
+            f"(mean pool {report['candidates'].mean():.0f} rows)"
+        )
+        return report
+
+    def candidate_ids(self, query: str, candidate_pools: dict = None) -> np.ndarray:
+        """
+        Stage one of staged retrieval: union of each pool matcher's top rows with a
+        positive score.
+        """
+        candidate_pools = candidate_pools or self.candidate_pools
+        if not candidate_pools:
+            raise ValueError("No candidate pools configured for staged retrieval.")
+        names = []
+        for matcher in candidate_pools:
             if matcher not in self.matchers:
-                log.warning(f"Matcher '{matcher}' not found, skipping.")
+                log.warning(f"Candidate matcher '{matcher}' not found, skipping.")
                 continue
-            scores = self.matchers[matcher].match(query)
-            if not isinstance(scores, list) or len(scores) != n:
+            names.append(matcher)
+        results, _ = self._run_matchers(
+            names,
+            lambda matcher: self.matchers[matcher].match_top(query, candidate_pools[matcher]),
+        )
+        pools = [c.ids[c.scores > 0] for c in results.values()]
+        if not pools:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(pools))
+
+    def _rank_dense(
+        self, query: str, matcher_weights: dict, top_k: int
+    ) -> Ranking | None:
+        n = len(self.dataset.df)
+        combined_score, scratch = self._score_buffers(n)
+        combined_score.fill(0.0)
+        all_scores = {}
+        norm_weights = self._normalise_weights(matcher_weights)
+        if norm_weights is None:
+            return None
+        results, timings = self._run_matchers(
+            list(norm_weights), lambda matcher: self.matchers[matcher].match(query)
+        )
+        for matcher, weight in norm_weights.items():
+            scores = np.asarray(results[matcher], dtype=SCORE_DTYPE)
+            if scores.shape != (n,):
                 log.warning(
-                    f"Matcher '{matcher}' did not return a valid score list, skipping."
+                    f"Matcher '{matcher}' did not return a valid score array, skipping."
                 )
                 continue
-            all_scores[matcher + "_score"] = np.array(scores)
-            combined_score += weight * np.array(scores)
-        if np.all(combined_score == 0):
+            all_scores[matcher] = scores
+            np.multiply(scores, weight, out=scratch)
+            combined_score += scratch
+        if not combined_score.any():
+            log.error("No valid matcher results to combine.")
+            return None
+        top_idx = top_k_indices(combined_score, top_k)
+        return Ranking(
+            top_idx,
+            combined_score[top_idx],
+            {matcher: scores[top_idx] for matcher, scores in all_scores.items()},
+            timings,
+        )
+
+    def _rank_staged(
+        self,
+        query: str,
+        matcher_weights: dict,
+        top_k: int,
+        candidate_pools: dict = None,
+    ) -> Ranking | None:
+        ids = self.candidate_ids(query, candidate_pools)
+        norm_weights = self._normalise_weights(matcher_weights)
+        if norm_weights is None:
+            return None
+        if len(ids) == 0:
+            log.error("Candidate generation returned no rows.")
+            return None
+        combined_score = np.zeros(len(ids), dtype=SCORE_DTYPE)
+        all_scores, timings = self._run_matchers(
+            list(norm_weights), lambda matcher: self.matchers[matcher].match_ids(query, ids)
+        )
+        for matcher, weight in norm_weights.items():
+            combined_score += all_scores[matcher] * weight
+        if not combined_score.any():
             log.error("No valid matcher results to combine.")
+            return None
+        log.debug(f"Staged ranking reranked {len(ids)} candidates.")
+        order = top_k_indices(combined_score, top_k)
+        return Ranking(
+            ids[order],
+            combined_score[order],
+            {matcher: scores[order] for matcher, scores in all_scores.items()},
+            timings,
+        )
+
+    def _column(self, column: str) -> np.ndarray:
+        """
+        Return the dataset column as a numpy array, converted once and then cached.
+        """
+        values = self._columns.get(column)
+        if values is None:
+            if column not in self.dataset.df.columns:
+                raise ValueError(f"Column '{column}' not found in dataset.")
+            values = self._columns[column] = self.dataset.df[column].to_numpy()
+        return values
+
+    def _project(self, ranking: Ranking | None, columns: list[str] = None) -> list[dict]:
+        """
+        Build result records for a ranking with only the given columns (all non-embedding
+        columns if None) followed by the rounded matcher and combined scores.
+        """
+        if ranking is None:
+            return []
+        if columns is None:
+            columns = [c for c in self.dataset.df.columns if not c.endswith("_embedding")]
+        fields = {column: self._column(column)[ranking.ids].tolist() for column in columns}
+        for matcher, scores in ranking.scores.items():
+            fields[matcher + "_score"] = np.round(scores.astype(float), 3).tolist()
+        fields["combined_score"] = np.round(ranking.combined.astype(float), 3).tolist()
+        return [dict(zip(fields, values)) for values in zip(*fields.values())]
+
+    def _build_results(self, ranking: Ranking | None) -> pd.DataFrame:
+        """
+        Build the results DataFrame for a ranking, with each matcher's score and the
+        combined score rounded for display.
+        """
+        if ranking is None:
             return pd.DataFrame()
-        # Get top_k indices
-        top_idx = np.argsort(combined_score)[::-1][:top_k]
-        results = self.dataset.df.iloc[top_idx].copy()
+        results = self.dataset.df.iloc[ranking.ids].copy()
         # Add each individual matcher score column
-        for col, arr in all_scores.items():
-            results[col] = np.round(arr[top_idx], 3)
-        results["combined_score"] = np.round(combined_score[top_idx], 3)
+        for matcher, scores in ranking.scores.items():
+            results[matcher + "_score"] = np.round(scores.astype(float), 3)
+        results["combined_score"] = np.round(ranking.combined.astype(float), 3)
         results = results.reset_index(drop=True)
-        log.info(f"Multi-matcher search complete. Returning {len(results)} results.")
+        results.attrs["timings"] = ranking.timings or {}
         return results
@@ -4,14 +4,20 @@ import numpy as np
 from .transformers import TransformerBase
 
 # For fuzzy matching
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 # For semantic matching
 
 import faiss
 
 import logging
-from typing import Sequence
+from collections import defaultdict
+from typing import NamedTuple
+
+log = logging.getLogger(__name__)
+
+
+SCORE_DTYPE = np.float32
 
 
 class MatcherError(Exception):
@@ -25,6 +31,75 @@ def get_column_safe(df: pd.DataFrame, column: str) -> pd.Series:
     return df[column]
 
 
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first. Ties are broken by lowest index so
+    that every search path ranks identical scores identically.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        kth = scores[np.argpartition(scores, n - k)[n - k]]
+        idx = np.flatnonzero(scores >= kth)
+    else:
+        idx = np.arange(n)
+    order = np.lexsort((idx, -scores[idx]))[:k]
+    return idx[order]
+
+
+class Candidates(NamedTuple):
+    """
+    Sparse top-candidate list returned by MatcherBase.match_top.
+    ids: row ids of the candidates, best first.
+    scores: the matcher's exact scores for those rows.
+    bound: upper bound on the score of any row not in ids (-inf when ids covers every row).
+    """
+
+    ids: np.ndarray
+    scores: np.ndarray
+    bound: float
+
+
+class RowGroups:
+    __slots__ = ("codes", "order", "offsets", "first")
+    """
+    Rows grouped by identical key values (e.g. model_name). Matchers whose score depends
+    only on the key store and score each distinct value once, then broadcast the group
+    scores back to rows with `codes`.
+    """
+
+    def __init__(self, values):
+        """
+        Args:
+            values (array-like): Key value of each row. Missing values form one group.
+        """
+        codes, uniques = pd.factorize(pd.Series(values).fillna(""), sort=False)
+        self.codes = codes.astype(np.int64)
+        self.order = np.argsort(self.codes, kind="stable")
+        counts = np.bincount(self.codes, minlength=len(uniques))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        # First row of each group, in group order
+        self.first = self.order[self.offsets[:-1]]
+
+    def __len__(self) -> int:
+        return len(self.first)
+
+    def rows(self, groups: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Expand groups to their rows, keeping the order of groups.
+        Args:
+            groups (np.ndarray): Group ids.
+        Returns:
+            tuple: (row ids, position in groups of each row's group)
+        """
+        starts = self.offsets[groups]
+        counts = self.offsets[groups + 1] - starts
+        positions = np.repeat(np.arange(len(groups)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.order[starts[positions] + within], positions
+
+
 class MatcherBase(ABC):
     __slots__ = ("df",)
     """
@@ -40,72 +115,221 @@ class MatcherBase(ABC):
         self.df = df
 
     @abstractmethod
-    def match(self, query: str) -> list[float]:
+    def match(self, query: str) -> np.ndarray:
         """
-        Compute a list of scores for the query against the DataFrame.
+        Compute scores for the query against the DataFrame.
         Args:
             query (str): The search query.
         Returns:
-            list[float]: Scores for each row in the DataFrame.
+            np.ndarray: 1D float32 array of scores for each row in the DataFrame.
+                Static scorers may return a read-only view of a precomputed array,
+                so callers must not modify the result in place.
         """
         pass
 
+    def match_many(self, queries: list[str]) -> np.ndarray:
+        """
+        Compute scores for several queries at once.
+        Subclasses override this when they can score a batch in one native call.
+        Args:
+            queries (list[str]): The search queries.
+        Returns:
+            np.ndarray: 2D float32 array of shape (len(queries), rows). May be read-only.
+        """
+        if not queries:
+            return np.zeros((0, len(self.df)), dtype=SCORE_DTYPE)
+        return np.stack([self.match(query) for query in queries])
+
+    def match_ids(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """
+        Compute scores for the query against the given rows only.
+        Subclasses override this when they can score a subset without a full scan.
+        Args:
+            query (str): The search query.
+            ids (np.ndarray): Row ids to score.
+        Returns:
+            np.ndarray: float32 scores aligned with ids.
+        """
+        return self.match(query)[ids]
+
+    def match_top(self, query: str, k: int) -> Candidates:
+        """
+        Return the k best rows for the query and an upper bound for all other rows.
+        Subclasses override this when they can find the head without scoring every row.
+        Args:
+            query (str): The search query.
+            k (int): Number of candidates to return.
+        Returns:
+            Candidates: Top row ids, their scores and the bound for unseen rows.
+        """
+        scores = self.match(query)
+        ids = top_k_indices(scores, k)
+        if len(ids) == len(scores):
+            bound = -np.inf
+        else:
+            bound = float(scores[ids[-1]]) if len(ids) else float(scores.max())
+        return Candidates(ids, scores[ids], bound)
+
 
 class FuzzyMatcher(MatcherBase):
-    __slots__ = ("column", "choices")
+    __slots__ = ("column", "choices", "groups", "workers", "score_cutoff")
     """
     Fuzzy matcher using rapidfuzz to match query against a text column (e.g., 'blob').
-    Returns a list of scores (float), same length and order as df.
-    Stores the choices at initialization for speed.
+    Returns a float32 numpy array of scores, same length and order as df.
+    Stores the distinct column values at initialization and scores them all in a single
+    batched rapidfuzz call; rows sharing a value share its score.
     """
 
-    def __init__(self, column: str, df: pd.DataFrame):
+    def __init__(
+        self,
+        column: str,
+        df: pd.DataFrame,
+        workers: int = 1,
+        score_cutoff: float = 0.0,
+    ):
         """
         Args:
             column (str): The column to match against.
             df (pd.DataFrame): The data.
+            workers (int): Number of threads rapidfuzz uses to score the choices.
+                -1 uses all available cores.
+            score_cutoff (float): Scores (0-1) below this threshold are returned as 0.0.
+                Higher cutoffs let rapidfuzz exit early on non-matching rows.
         Raises:
             ValueError: If the column is not in the DataFrame.
         """
         super().__init__(df)
+        if not 0.0 <= score_cutoff <= 1.0:
+            raise ValueError("score_cutoff must be between 0 and 1.")
         self.column = column
-        self.choices = get_column_safe(df, column).astype(str).fillna("").tolist()
+        values = get_column_safe(df, column).astype(str).fillna("")
+        self.groups = RowGroups(values)
+        self.choices = values.iloc[self.groups.first].tolist()
+        self.workers = workers
+        self.score_cutoff = score_cutoff
 
-    def match(self, query: str) -> Sequence[float]:
+    def match(self, query: str) -> np.ndarray:
         logging.debug(f"FuzzyMatcher: Matching query '{query}' against column '{self.column}'")
         """
         Args:
             query (str): The search query.
         Returns:
-            list[float]: Fuzzy match scores for each row.
+            np.ndarray: Fuzzy match scores (float32, 0-1) for each row.
         """
         if not isinstance(query, str):
             raise TypeError("Query must be a string.")
         # Defensive: handle empty DataFrame
         if not self.choices:
-            return []
-        return [
-            round(fuzz.WRatio(query, choice) / 100.0, 3) for choice in self.choices
-        ]
+            return np.zeros(0, dtype=SCORE_DTYPE)
+        return self._score(query, self.choices)[self.groups.codes]
+
+    def match_many(self, queries: list[str]) -> np.ndarray:
+        """
+        Args:
+            queries (list[str]): The search queries.
+        Returns:
+            np.ndarray: (queries x rows) fuzzy match scores from a single cdist call.
+        """
+        if not all(isinstance(query, str) for query in queries):
+            raise TypeError("Queries must be strings.")
+        if not queries or not self.choices:
+            return np.zeros((len(queries), len(self.groups.codes)), dtype=SCORE_DTYPE)
+        scores = process.cdist(
+            queries,
+            self.choices,
+            scorer=fuzz.WRatio,
+            dtype=SCORE_DTYPE,
+            workers=self.workers,
+            score_cutoff=self.score_cutoff * 100.0 or None,
+        )
+        scores /= 100.0
+        return np.round(scores, 3, out=scores)[:, self.groups.codes]
+
+    def match_ids(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            query (str): The search query.
+            ids (np.ndarray): Row ids to score.
+        Returns:
+            np.ndarray: Fuzzy match scores for the given rows only.
+        """
+        if not isinstance(query, str):
+            raise TypeError("Query must be a string.")
+        groups, inverse = np.unique(self.groups.codes[ids], return_inverse=True)
+        return self._score(query, [self.choices[g] for g in groups])[inverse]
+
+    def _score(self, query: str, choices: list[str]) -> np.ndarray:
+        if not choices:
+            return np.zeros(0, dtype=SCORE_DTYPE)
+        scores = process.cdist(
+            [query],
+            choices,
+            scorer=fuzz.WRatio,
+            dtype=SCORE_DTYPE,
+            workers=self.workers,
+            score_cutoff=self.score_cutoff * 100.0 or None,
+        )[0]
+        scores /= 100.0
+        return np.round(scores, 3, out=scores)
+
+
+class IndexSpec(NamedTuple):
+    """
+    FAISS index type and tuning parameters used by FaissIndexManager.
+    kind: "flat" (exact brute force), "hnsw", "ivf_flat" or "ivf_pq".
+    hnsw_m / ef_construction / ef_search: HNSW graph degree, build and search breadth.
+    nlist / nprobe: IVF cell count (None picks ~4*sqrt(n)) and cells visited per query.
+    pq_m / pq_bits: IVF-PQ sub-quantizers (must divide the dimension) and bits per code.
+    """
+
+    kind: str = "flat"
+    hnsw_m: int = 32
+    ef_construction: int = 40
+    ef_search: int = 64
+    nlist: int | None = None
+    nprobe: int = 8
+    pq_m: int = 16
+    pq_bits: int = 8
+
+    @property
+    def name(self) -> str:
+        if self.kind == "hnsw":
+            return f"HNSW{self.hnsw_m},efSearch={self.ef_search}"
+        if self.kind == "ivf_flat":
+            return f"IVF{self.nlist or 'auto'},Flat,nprobe={self.nprobe}"
+        if self.kind == "ivf_pq":
+            return f"IVF{self.nlist or 'auto'},PQ{self.pq_m}x{self.pq_bits},nprobe={self.nprobe}"
+        return "Flat"
 
 
 class FaissIndexManager:
-    __slots__ = ("index", "id_map")
+    __slots__ = ("index", "id_map", "spec")
     """
     Handles FAISS index creation, normalization, and search for embeddings.
+    The index type is chosen by an IndexSpec. Non-flat indexes are approximate: they
+    trade recall for latency, and the k-th returned similarity is then no longer a
+    strict bound on unseen rows (see core.benchmarks.benchmark_index_specs).
     """
 
-    def __init__(self, emb_matrix: np.ndarray):
+    KINDS = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+    def __init__(self, emb_matrix: np.ndarray, spec: IndexSpec | None = None):
         """
         Args:
             emb_matrix (np.ndarray): 2D array of embeddings.
+            spec (IndexSpec): Index type and parameters. Defaults to an exact flat index.
         Raises:
-            ValueError: If emb_matrix is not 2D or is empty.
+            ValueError: If emb_matrix is not 2D or is empty, or the spec is invalid.
         """
         if emb_matrix.ndim != 2:
             raise ValueError("Embedding matrix must be 2-dimensional.")
         if emb_matrix.shape[0] == 0:
             raise ValueError("Embedding matrix is empty.")
+        self.spec = spec or IndexSpec()
+        if self.spec.kind not in self.KINDS:
+            raise ValueError(
+                f"Unknown index kind '{self.spec.kind}'. Expected one of {self.KINDS}."
+            )
         self.index = None
         self.id_map = None
         self._build_index(emb_matrix)
@@ -113,8 +337,38 @@ class FaissIndexManager:
     def _build_index(self, emb_matrix: np.ndarray):
         emb_matrix = emb_matrix.astype(np.float32)
         faiss.normalize_L2(emb_matrix)
-        index = faiss.IndexFlatIP(emb_matrix.shape[1])
+        n, dim = emb_matrix.shape
+        spec = self.spec
+        metric = faiss.METRIC_INNER_PRODUCT
+        if spec.kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, spec.hnsw_m, metric)
+            index.hnsw.efConstruction = spec.ef_construction
+            index.hnsw.efSearch = spec.ef_search
+        elif spec.kind in ("ivf_flat", "ivf_pq"):
+            nlist = min(spec.nlist or max(1, int(4 * np.sqrt(n))), n)
+            quantizer = faiss.IndexFlatIP(dim)
+            if spec.kind == "ivf_flat":
+                index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+            else:
+                if dim % spec.pq_m != 0:
+                    raise ValueError(
+                        f"pq_m={spec.pq_m} must divide the embedding dimension {dim}."
+                    )
+                if n < 2**spec.pq_bits:
+                    raise ValueError(
+                        f"IVF-PQ with {spec.pq_bits} bits needs at least {2**spec.pq_bits} rows to train."
+                    )
+                index = faiss.IndexIVFPQ(quantizer, dim, nlist, spec.pq_m, spec.pq_bits, metric)
+            index.nprobe = min(spec.nprobe, nlist)
+        else:
+            index = faiss.IndexFlatIP(dim)
+        if not index.is_trained:
+            log.info(f"Training FAISS index {spec.name} on {n} embeddings")
+            index.train(emb_matrix)
         index.add(emb_matrix)
+        if spec.kind in ("ivf_flat", "ivf_pq"):
+            # Needed for reconstruct_batch in score_ids
+            index.make_direct_map()
         self.index = index
         self.id_map = np.arange(len(emb_matrix))
 
@@ -134,58 +388,245 @@ class FaissIndexManager:
         distances, indices = self.index.search(query_emb, k)
         return distances, indices
 
+    def search_all(self, query_emb: np.ndarray):
+        """
+        Score the query embedding(s) against every indexed row, bypassing the
+        approximate search of non-flat indexes: HNSW scans its flat storage and IVF
+        probes every list. IVF-PQ scores are still computed from the compressed codes.
+        Args:
+            query_emb (np.ndarray): Query embedding, or a (queries x dim) matrix.
+        Returns:
+            tuple: (distances, indices), each (queries x rows)
+        """
+        if query_emb.ndim == 1:
+            query_emb = query_emb.reshape(1, -1)
+        query_emb = query_emb.astype(np.float32)
+        faiss.normalize_L2(query_emb)
+        n = len(self.id_map)
+        if self.spec.kind == "hnsw":
+            return faiss.downcast_index(self.index.storage).search(query_emb, n)
+        if self.spec.kind in ("ivf_flat", "ivf_pq"):
+            params = faiss.SearchParametersIVF(nprobe=self.index.nlist)
+            return self.index.search(query_emb, n, params=params)
+        return self.index.search(query_emb, n)
+
+    def score_ids(self, query_emb: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """
+        Inner-product scores of the query embedding against the given indexed rows only.
+        Args:
+            query_emb (np.ndarray): Query embedding.
+            ids (np.ndarray): Row ids to score.
+        Returns:
+            np.ndarray: float32 scores aligned with ids.
+        """
+        query_emb = query_emb.reshape(1, -1).astype(np.float32)
+        faiss.normalize_L2(query_emb)
+        vectors = self.index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+        return vectors @ query_emb[0]
+
 
 class SemanticMatcher(MatcherBase):
-    __slots__ = ("embedding_column", "encoder", "faiss_manager")
+    __slots__ = ("embedding_column", "encoder", "faiss_manager", "groups")
     """
     Semantic matcher using cosine similarity on embedding columns.
     Uses FAISS for fast nearest neighbor search if available.
-    Returns a list of scores (float), same length and order as df.
+    Returns a float32 numpy array of scores, same length and order as df.
     Now delegates FAISS index management to FaissIndexManager.
+    With a key_column, rows sharing a key value (e.g. the same model_name in several
+    markets) share one indexed vector.
     """
 
     def __init__(
-        self, embedding_column: str, encoder: TransformerBase, df: pd.DataFrame
+        self,
+        embedding_column: str,
+        encoder: TransformerBase,
+        df: pd.DataFrame,
+        index_spec: IndexSpec | None = None,
+        emb_matrix: np.ndarray | None = None,
+        key_column: str | None = None,
     ):
         """
         Args:
             embedding_column (str): The embedding column in the DataFrame.
             encoder (TransformerBase): The encoder for queries.
             df (pd.DataFrame): The data.
+            index_spec (IndexSpec): FAISS index type and parameters. Defaults to flat.
+            emb_matrix (np.ndarray): Precomputed (rows x dim) embeddings, e.g. from
+                Dataset.compact(). Read from embedding_column if not given.
+            key_column (str): Column the embeddings were computed from. Rows with equal
+                values are indexed once. Every row is indexed if None.
         Raises:
-            ValueError: If the embedding column is not in the DataFrame.
+            ValueError: If the embedding column is not in the DataFrame, or emb_matrix
+                does not have one row per DataFrame row.
         """
         super().__init__(df)
         self.embedding_column = embedding_column
         self.encoder = encoder
-        emb_matrix = np.stack(get_column_safe(df, embedding_column).values)
-        self.faiss_manager = FaissIndexManager(emb_matrix)
-
-    def match(self, query: str) -> Sequence[float]:
+        self.groups = RowGroups(
+            get_column_safe(df, key_column) if key_column else np.arange(len(df))
+        )
+        if emb_matrix is None:
+            emb_matrix = np.stack(get_column_safe(df, embedding_column).values[self.groups.first])
+        elif len(emb_matrix) != len(df):
+            raise ValueError(
+                f"emb_matrix has {len(emb_matrix)} rows for a DataFrame of {len(df)} rows."
+            )
+        else:
+            emb_matrix = emb_matrix[self.groups.first]
+        self.faiss_manager = FaissIndexManager(emb_matrix, spec=index_spec)
+        if len(self.groups) < len(df):
+            log.info(
+                f"SemanticMatcher indexed {len(self.groups)} distinct '{key_column}' "
+                f"vectors for {len(df)} rows."
+            )
+
+    def match(self, query: str) -> np.ndarray:
         logging.debug(f"SemanticMatcher: Matching query '{query}' against embedding column '{self.embedding_column}'")
         """
         Args:
             query (str): The search query.
         Returns:
-            list[float]: Semantic similarity scores for each row.
+            np.ndarray: Semantic similarity scores (float32) for each row.
+        """
+        if not isinstance(query, str):
+            raise TypeError("Query must be a string.")
+        query_emb = np.asarray(self.encoder.encode_one(query))
+        # Every row is scored, so an approximate index must not truncate the results
+        distances, indices = self.faiss_manager.search_all(query_emb)
+        scores = np.zeros(len(self.faiss_manager.id_map), dtype=SCORE_DTYPE)
+        # FAISS pads missing results with -1
+        valid = indices[0] >= 0
+        scores[indices[0][valid]] = distances[0][valid]
+        return scores[self.groups.codes]
+
+    def match_many(self, queries: list[str]) -> np.ndarray:
+        """
+        Args:
+            queries (list[str]): The search queries.
+        Returns:
+            np.ndarray: (queries x rows) similarity scores, encoded in one transformer
+                batch and searched in one multi-query FAISS call.
+        """
+        if not all(isinstance(query, str) for query in queries):
+            raise TypeError("Queries must be strings.")
+        if not queries:
+            return np.zeros((0, len(self.df)), dtype=SCORE_DTYPE)
+        n = len(self.faiss_manager.id_map)
+        scores = np.zeros((len(queries), n), dtype=SCORE_DTYPE)
+        query_embs = self.encoder.encode_many(queries)
+        distances, indices = self.faiss_manager.search_all(query_embs)
+        rows, cols = np.nonzero(indices >= 0)
+        scores[rows, indices[rows, cols]] = distances[rows, cols]
+        return scores[:, self.groups.codes]
+
+    def match_ids(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            query (str): The search query.
+            ids (np.ndarray): Row ids to score.
+        Returns:
+            np.ndarray: Semantic similarity scores for the given rows only.
         """
         if not isinstance(query, str):
             raise TypeError("Query must be a string.")
-        query_emb = np.array(self.encoder.encode_one(query))
-        k = len(self.faiss_manager.id_map)
-        distances, indices = self.faiss_manager.search(query_emb, k)
-        scores = np.zeros(len(self.faiss_manager.id_map), dtype=float)
-        for arr_idx, score in zip(indices[0], distances[0]):
-            if arr_idx < len(self.faiss_manager.id_map):
-                scores[arr_idx] = score
-        return scores.tolist()
+        query_emb = np.asarray(self.encoder.encode_one(query))
+        return self.faiss_manager.score_ids(query_emb, self.groups.codes[ids])
+
+    def match_top(self, query: str, k: int) -> Candidates:
+        """
+        Ask FAISS for the k nearest vectors only; the k-th similarity bounds every other
+        row. Rows sharing a vector are all returned, so there may be more than k.
+        Args:
+            query (str): The search query.
+            k (int): Number of candidates to return.
+        Returns:
+            Candidates: Top row ids, their similarities and the bound for unseen rows.
+        """
+        if not isinstance(query, str):
+            raise TypeError("Query must be a string.")
+        query_emb = np.asarray(self.encoder.encode_one(query))
+        n = len(self.faiss_manager.id_map)
+        distances, indices = self.faiss_manager.search(query_emb, min(k, n))
+        valid = indices[0] >= 0
+        groups, scores = indices[0][valid], distances[0][valid].astype(SCORE_DTYPE)
+        bound = float(scores[-1]) if 0 < len(groups) < n else -np.inf
+        ids, positions = self.groups.rows(groups)
+        return Candidates(ids, scores[positions], bound)
+
+
+class TrigramIndex:
+    __slots__ = ("texts", "postings")
+    """
+    Inverted index from every 1-3 character gram to the sorted row ids containing it.
+    Used for literal, case-insensitive substring search without scanning every row.
+    """
+
+    GRAM_SIZE = 3
+
+    def __init__(self, texts: list[str]):
+        """
+        Args:
+            texts (list[str]): The values to index, one per row.
+        """
+        self.texts = [text.lower() for text in texts]
+        postings = defaultdict(list)
+        for row, text in enumerate(self.texts):
+            grams = {
+                text[i : i + size]
+                for size in range(1, self.GRAM_SIZE + 1)
+                for i in range(len(text) - size + 1)
+            }
+            for gram in grams:
+                postings[gram].append(row)
+        self.postings = {
+            gram: np.array(rows, dtype=np.int64) for gram, rows in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query: str) -> np.ndarray:
+        """
+        Find the rows containing the query as a literal substring (case-insensitive).
+        Args:
+            query (str): The substring to look for.
+        Returns:
+            np.ndarray: Sorted row ids of the matching rows.
+        """
+        query = query.lower()
+        if not query:
+            return np.arange(len(self.texts))
+        if len(query) <= self.GRAM_SIZE:
+            # The query is itself a gram, so its postings are the exact answer
+            return self.postings.get(query, np.empty(0, dtype=np.int64))
+        grams = {
+            query[i : i + self.GRAM_SIZE]
+            for i in range(len(query) - self.GRAM_SIZE + 1)
+        }
+        lists = []
+        for gram in grams:
+            rows = self.postings.get(gram)
+            if rows is None:
+                return np.empty(0, dtype=np.int64)
+            lists.append(rows)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for rows in lists[1:]:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            if len(candidates) == 0:
+                return candidates
+        # Shared grams do not guarantee a contiguous match, so verify each candidate
+        return np.array(
+            [row for row in candidates if query in self.texts[row]], dtype=np.int64
+        )
 
 
 class ExactMatcher(MatcherBase):
-    __slots__ = ("column", "col_values")
+    __slots__ = ("column", "index")
     """
     Exact matcher that returns 1.0 if the query is a substring of the column value (case-insensitive), 0.0 otherwise.
-    Returns a list of scores (float), same length and order as df.
+    Returns a float32 numpy array of scores, same length and order as df.
+    Backed by a TrigramIndex built at initialization, so lookups cost roughly O(hits).
     """
 
     def __init__(self, column: str, df: pd.DataFrame):
@@ -198,28 +639,77 @@ class ExactMatcher(MatcherBase):
         """
         super().__init__(df)
         self.column = column
-        self.col_values = get_column_safe(df, column)
+        self.index = TrigramIndex(get_column_safe(df, column).astype(str).tolist())
 
-    def match(self, query: str) -> Sequence[float]:
-        logging.debug(f"ExactMatcher: Matching query '{query}' against column '{self.column}'")
+    def hits(self, query: str) -> np.ndarray:
         """
         Args:
             query (str): The search query.
         Returns:
-            list[float]: 1.0 if query is substring, else 0.0.
+            np.ndarray: Sorted row ids whose value contains the query.
         """
         if not isinstance(query, str):
             raise TypeError("Query must be a string.")
-        query_lower = query.lower()
-        matches = self.col_values.astype(str).str.contains(query_lower, case=False, na=False)
-        return matches.astype(float).tolist()
+        logging.debug(f"ExactMatcher: Looking up query '{query}' in column '{self.column}'")
+        return self.index.search(query)
+
+    def match(self, query: str) -> np.ndarray:
+        """
+        Args:
+            query (str): The search query.
+        Returns:
+            np.ndarray: 1.0 if query is substring, else 0.0 (float32).
+        """
+        scores = np.zeros(len(self.index), dtype=SCORE_DTYPE)
+        scores[self.hits(query)] = 1.0
+        return scores
+
+    def match_many(self, queries: list[str]) -> np.ndarray:
+        """
+        Args:
+            queries (list[str]): The search queries.
+        Returns:
+            np.ndarray: (queries x rows) array, 1.0 where the query is a substring.
+        """
+        scores = np.zeros((len(queries), len(self.index)), dtype=SCORE_DTYPE)
+        for row, query in enumerate(queries):
+            scores[row, self.hits(query)] = 1.0
+        return scores
+
+    def match_ids(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            query (str): The search query.
+            ids (np.ndarray): Row ids to score.
+        Returns:
+            np.ndarray: 1.0 for the given rows containing the query, else 0.0.
+        """
+        return np.isin(ids, self.hits(query)).astype(SCORE_DTYPE)
+
+    def match_top(self, query: str, k: int) -> Candidates:
+        """
+        Args:
+            query (str): The search query.
+            k (int): Number of candidates to return.
+        Returns:
+            Candidates: Up to k matching rows; unseen rows score 1.0 only if hits were cut.
+        """
+        hits = self.hits(query)
+        ids = hits[:k]
+        if len(hits) > k:
+            bound = 1.0
+        elif len(hits) < len(self.index):
+            bound = 0.0
+        else:
+            bound = -np.inf
+        return Candidates(ids, np.ones(len(ids), dtype=SCORE_DTYPE), bound)
 
 
 class PopularMatcher(MatcherBase):
-    __slots__ = ("popularity_column", "scores")
+    __slots__ = ("popularity_column", "scores", "order")
     """
-    Popular matcher that returns normalized popularity as a list of scores.
-    Returns a list of scores (float), same length and order as df.
+    Popular matcher that returns normalized popularity as scores.
+    Returns a read-only float32 numpy array, same length and order as df.
     Stores the popularity column as a numpy array for fast access.
     """
 
@@ -235,14 +725,123 @@ class PopularMatcher(MatcherBase):
         self.popularity_column = popularity_column
         raw_scores = get_column_safe(df, popularity_column).to_numpy(dtype=float)
         max_score = raw_scores.max() if len(raw_scores) > 0 else 1.0
-        self.scores = (np.log1p(raw_scores) / np.log1p(max_score)).round(3) if max_score > 0 else raw_scores
-
-    def match(self, query: str) -> Sequence[float]:
+        scores = (np.log1p(raw_scores) / np.log1p(max_score)).round(3) if max_score > 0 else raw_scores
+        self.scores = scores.astype(SCORE_DTYPE)
+        # Shared across queries, so hand out a read-only array
+        self.scores.setflags(write=False)
+        # Popularity is query independent, so the ranking is computed once
+        self.order = top_k_indices(self.scores, len(self.scores))
+
+    def match(self, query: str) -> np.ndarray:
         logging.debug(f"PopularMatcher: Returning popularity scores for query '{query}' (query ignored)")
         """
         Args:
             query (str): The search query (ignored).
         Returns:
-            list[float]: Normalized popularity scores.
+            np.ndarray: Read-only normalized popularity scores (float32).
+        """
+        return self.scores
+
+    def match_many(self, queries: list[str]) -> np.ndarray:
+        """
+        Args:
+            queries (list[str]): The search queries (ignored).
+        Returns:
+            np.ndarray: Read-only (queries x rows) broadcast of the popularity scores.
+        """
+        return np.broadcast_to(self.scores, (len(queries), len(self.scores)))
+
+    def match_ids(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            query (str): The search query (ignored).
+            ids (np.ndarray): Row ids to score.
+        Returns:
+            np.ndarray: Normalized popularity scores for the given rows.
+        """
+        return self.scores[ids]
+
+    def match_top(self, query: str, k: int) -> Candidates:
+        """
+        Args:
+            query (str): The search query (ignored).
+            k (int): Number of candidates to return.
+        Returns:
+            Candidates: The k most popular rows and the popularity of the next row.
+        """
+        ids = self.order[:k]
+        bound = float(self.scores[self.order[k]]) if k < len(self.order) else -np.inf
+        return Candidates(ids, self.scores[ids], bound)
+
+
+class SubsetMatcher(MatcherBase):
+    __slots__ = ("matcher", "row_ids", "local_ids")
+    """
+    View of another matcher restricted to a subset of its rows (e.g. one market of a
+    multi-market dataset), renumbered 0..len(row_ids)-1. The wrapped matcher, its
+    choices and its indexes are shared by every view; a view only holds the row ids
+    and the reverse map that filters the wrapped matcher's candidates.
+    """
+
+    def __init__(self, matcher: MatcherBase, row_ids: np.ndarray, df: pd.DataFrame):
+        """
+        Args:
+            matcher (MatcherBase): The matcher over all rows.
+            row_ids (np.ndarray): Rows of the wrapped matcher in the subset, in view order.
+            df (pd.DataFrame): The subset's data, one row per entry of row_ids.
+        Raises:
+            ValueError: If df does not have one row per entry of row_ids.
+        """
+        super().__init__(df)
+        if len(row_ids) != len(df):
+            raise ValueError(f"{len(row_ids)} row ids for a DataFrame of {len(df)} rows.")
+        self.matcher = matcher
+        self.row_ids = np.asarray(row_ids, dtype=np.int64)
+        # Wrapped row id -> view row id, -1 outside the subset
+        self.local_ids = np.full(len(matcher.df), -1, dtype=np.int64)
+        self.local_ids[self.row_ids] = np.arange(len(self.row_ids))
+
+    def match(self, query: str) -> np.ndarray:
+        """
+        Args:
+            query (str): The search query.
+        Returns:
+            np.ndarray: The wrapped matcher's scores for the subset rows.
+        """
+        return self.matcher.match(query)[self.row_ids]
+
+    def match_many(self, queries: list[str]) -> np.ndarray:
+        """
+        Args:
+            queries (list[str]): The search queries.
+        Returns:
+            np.ndarray: (queries x subset rows) scores of the wrapped matcher.
+        """
+        return self.matcher.match_many(queries)[:, self.row_ids]
+
+    def match_ids(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            query (str): The search query.
+            ids (np.ndarray): View row ids to score.
+        Returns:
+            np.ndarray: The wrapped matcher's scores for the given rows.
+        """
+        return self.matcher.match_ids(query, self.row_ids[ids])
+
+    def match_top(self, query: str, k: int) -> Candidates:
+        """
+        Ask the wrapped matcher for its head, scaled up by the subset's share of the rows,
+        and keep the subset rows. The wrapped bound still bounds every unseen subset row.
+        Args:
+            query (str): The search query.
+            k (int): Number of candidates to return.
+        Returns:
+            Candidates: Top view row ids (possibly fewer than k), their scores and the bound.
         """
-        return self.scores.tolist()
+        total = len(self.local_ids)
+        fetch = min(total, -(-k * total // max(len(self.row_ids), 1)))
+        candidates = self.matcher.match_top(query, fetch)
+        local = self.local_ids[candidates.ids]
+        keep = local >= 0
+        return Candidates(local[keep], candidates.scores[keep], candidates.bound)
@@ -1,5 +1,16 @@
-from typing import Callable
+from typing import Callable, Iterable, Iterator, NamedTuple
+from pathlib import Path
+from queue import Empty, Full, Queue
+from types import CodeType, FunctionType
+import hashlib
+import os
+import threading
+import time
+import tracemalloc
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import logging
 from .transforms import (
     normalise,
@@ -10,44 +21,379 @@ from .transforms import (
     log_normalise,
 )
 from .transformers import SentenceTransformerWrapper
-from config.settings import SCHEMA_COLUMNS, TEXT_COLUMNS, NOISE_WORDS
+from config.settings import (
+    SCHEMA_COLUMNS,
+    TEXT_COLUMNS,
+    NOISE_WORDS,
+    EMBEDDING_COLUMNS,
+)
 
 log = logging.getLogger(__name__)
 
 
+class StepReport(NamedTuple):
+    step: str
+    fingerprint: str
+    cached: bool
+    seconds: float
+    rows_in: int
+    rows_out: int
+    peak_mb: float
+
+
+def _stable_repr(value) -> str:
+    """repr that does not depend on set order or on dict insertion order."""
+    if isinstance(value, (set, frozenset)):
+        return "{" + ", ".join(sorted(_stable_repr(v) for v in value)) + "}"
+    if isinstance(value, dict):
+        items = sorted((_stable_repr(k), _stable_repr(v)) for k, v in value.items())
+        return "{" + ", ".join(f"{k}: {v}" for k, v in items) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_stable_repr(v) for v in value) + "]"
+    if isinstance(value, CodeType):
+        # Nested functions and comprehensions; their repr holds a memory address
+        return f"<code {value.co_name} {value.co_code.hex()} {_stable_repr(value.co_names)} {_stable_repr(value.co_consts)}>"
+    return repr(value)
+
+
+def _code_names(code: CodeType) -> set[str]:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _helpers(func: FunctionType) -> list[FunctionType]:
+    """
+    Module-level functions of func's top-level package that func calls, directly or
+    through other helpers (e.g. _words for remove_stopwords), ordered by name.
+    """
+    package = func.__module__.partition(".")[0]
+    found, stack = {func}, [func]
+    while stack:
+        current = stack.pop()
+        for name in _code_names(current.__code__):
+            value = current.__globals__.get(name)
+            if (
+                isinstance(value, FunctionType)
+                and value not in found
+                and value.__module__.partition(".")[0] == package
+            ):
+                found.add(value)
+                stack.append(value)
+    found.discard(func)
+    return sorted(found, key=lambda helper: (helper.__module__, helper.__qualname__))
+
+
+def step_identity(func: Callable) -> str:
+    """
+    Identity of a step function: its qualified name and bytecode, and those of the
+    helpers it calls from its own package, so editing a transform invalidates its
+    checkpoints, plus the `fingerprint` of the object a bound method belongs to (e.g.
+    the encoder of embed_columns).
+    """
+    function = getattr(func, "__func__", func)
+    parts = [f"{func.__module__}.{func.__qualname__}"]
+    if isinstance(function, FunctionType):
+        parts += [function.__code__.co_code.hex(), _stable_repr(function.__code__.co_consts)]
+        for helper in _helpers(function):
+            code = helper.__code__
+            parts += [
+                f"{helper.__module__}.{helper.__qualname__}",
+                code.co_code.hex(),
+                _stable_repr(code.co_consts),
+            ]
+    owner = getattr(func, "__self__", None)
+    if owner is not None:
+        parts.append(str(getattr(owner, "fingerprint", type(owner).__qualname__)))
+    return "\0".join(parts)
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame, including columns holding arrays (embeddings).
+    """
+    schema = _stable_repr([list(df.columns), [str(dtype) for dtype in df.dtypes]])
+    digest = hashlib.sha256(schema.encode())
+    for col in df.columns:
+        values = df[col]
+        if len(values) and isinstance(values.iloc[0], np.ndarray):
+            digest.update(np.ascontiguousarray(np.stack(values.to_numpy())).tobytes())
+        else:
+            hashed = pd.util.hash_pandas_object(values, index=False)
+            digest.update(hashed.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _prefetch(items: Iterator, maxsize: int) -> Iterator:
+    """
+    Iterate items in a background thread, running up to maxsize items ahead of the
+    consumer. Exceptions are re-raised in the consumer; closing the returned generator
+    stops the thread.
+    """
+    queue: Queue = Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((None, e))
+
+    threading.Thread(target=produce, name="pipeline-prefetch", daemon=True).start()
+    try:
+        while True:
+            try:
+                item, error = queue.get(timeout=0.1)
+            except Empty:
+                continue
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
 class Pipeline:
     """
     Base pipeline for chaining DataFrame transformations.
     Each step is a (function, kwargs) tuple.
+
+    With a checkpoint_dir, each step's output is saved to Parquet under a fingerprint
+    chained from the input data hash and every step's function identity and kwargs up
+    to it. A run resumes after the last step whose checkpoint is still valid, so editing
+    one step or its kwargs re-runs from that step only. Each run records a StepReport per
+    step (wall time, rows in/out, peak traced memory) in `report`.
     """
 
-    def __init__(self, steps: list = None):
+    def __init__(
+        self,
+        steps: list = None,
+        checkpoint_dir: str | Path | None = None,
+        trace_memory: bool = True,
+    ):
+        """
+        Args:
+            steps (list): (function, kwargs) tuples.
+            checkpoint_dir (str | Path): Directory of step checkpoints. None disables them.
+            trace_memory (bool): Measure each step's peak Python/NumPy allocations with
+                tracemalloc (slows allocation-heavy Python code).
+        """
         self.steps = steps or []
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir else None
+        self.trace_memory = trace_memory
+        self.report: list[StepReport] = []
 
     def add_step(self, func: Callable, **kwargs):
         log.info(f"Adding step: {func.__name__} with kwargs: {kwargs}")
         self.steps.append((func, kwargs))
         return self
 
+    def fingerprints(self, df: pd.DataFrame) -> list[str]:
+        """
+        Fingerprint of each step's output when the pipeline runs on df.
+        """
+        fingerprint, result = frame_fingerprint(df), []
+        for func, kwargs in self.steps:
+            key = "\0".join([fingerprint, step_identity(func), _stable_repr(kwargs)])
+            fingerprint = hashlib.sha256(key.encode()).hexdigest()
+            result.append(fingerprint)
+        return result
+
+    def _checkpoint(self, index: int, fingerprint: str) -> Path:
+        func = self.steps[index][0]
+        return self.checkpoint_dir / f"{index:02d}_{func.__name__}_{fingerprint[:16]}.parquet"
+
+    def _save_checkpoint(self, index: int, fingerprint: str, df: pd.DataFrame) -> None:
+        path = self._checkpoint(index, fingerprint)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        for stale in self.checkpoint_dir.glob(f"{index:02d}_*.parquet"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        df.to_parquet(tmp_path, index=False)
+        tmp_path.replace(path)
+
     def run(self, df: pd.DataFrame) -> pd.DataFrame:
         log.info(f"Running pipeline with {len(self.steps)} steps.")
-        for i, (func, kwargs) in enumerate(self.steps):
-            log.info(f"Step {i + 1}/{len(self.steps)}: {func.__name__}")
-            df = func(df, **kwargs)
+        self.report = []
+        start_step = 0
+        fingerprints = (
+            self.fingerprints(df) if self.checkpoint_dir else [""] * len(self.steps)
+        )
+        if self.checkpoint_dir:
+            for i in reversed(range(len(self.steps))):
+                path = self._checkpoint(i, fingerprints[i])
+                if path.exists():
+                    log.info(f"Resuming after step {i + 1} from checkpoint {path}")
+                    rows_in = len(df)
+                    df = pd.read_parquet(path)
+                    start_step = i + 1
+                    self.report.append(
+                        StepReport(
+                            f"checkpoint:{path.name}", fingerprints[i], True, 0.0,
+                            rows_in, len(df), 0.0,
+                        )
+                    )
+                    break
+
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            for i in range(start_step, len(self.steps)):
+                func, kwargs = self.steps[i]
+                log.info(f"Step {i + 1}/{len(self.steps)}: {func.__name__}")
+                rows_in = len(df)
+                if self.trace_memory:
+                    tracemalloc.reset_peak()
+                start = time.perf_counter()
+                df = func(df, **kwargs)
+                seconds = time.perf_counter() - start
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1e6 if self.trace_memory else 0.0
+                if self.checkpoint_dir:
+                    self._save_checkpoint(i, fingerprints[i], df)
+                self.report.append(
+                    StepReport(
+                        func.__name__, fingerprints[i], False, seconds, rows_in, len(df), peak_mb
+                    )
+                )
+                log.info(
+                    f"Step {func.__name__}: {seconds:.2f}s, rows {rows_in} -> {len(df)}, "
+                    f"peak {peak_mb:.1f} MB"
+                )
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
         log.info("Pipeline run complete.")
         return df
 
+    def run_stream(
+        self, batches: Iterable[pd.DataFrame], save_path: str | Path, prefetch: int = 2
+    ) -> pd.DataFrame:
+        """
+        Run the pipeline over a stream of DataFrame batches and write the result to
+        save_path as Parquet, one row group per batch.
+
+        The leading row_wise steps run batch by batch, each in its own thread with up to
+        `prefetch` batches queued between stages, so downloading, transforming and
+        embedding overlap and only a few batches are in flight at once. The remaining
+        steps (e.g. log_normalise, which needs the global maximum) then run once on the
+        streamed result. Checkpoints do not apply to streamed steps.
+        Args:
+            batches (Iterable[pd.DataFrame]): Input batches, e.g. query result pages.
+            save_path (str | Path): Parquet file written, replaced atomically at the end.
+            prefetch (int): Batches queued ahead of each stage.
+        Returns:
+            pd.DataFrame: The processed dataset.
+        """
+        head = []
+        for func, kwargs in self.steps:
+            if not getattr(func, "row_wise", False):
+                break
+            head.append((func, kwargs))
+        tail = Pipeline(self.steps[len(head):], trace_memory=self.trace_memory)
+        log.info(
+            f"Streaming pipeline: {len(head)} batched steps, {len(tail.steps)} steps after."
+        )
+        # Per streamed step: seconds, rows in, rows out (each stage runs in one thread)
+        totals = [[0.0, 0, 0] for _ in head]
+
+        def stage(i: int, func: Callable, kwargs: dict) -> Callable:
+            def apply(df: pd.DataFrame) -> pd.DataFrame:
+                start = time.perf_counter()
+                out = func(df, **kwargs)
+                totals[i][0] += time.perf_counter() - start
+                totals[i][1] += len(df)
+                totals[i][2] += len(out)
+                return out
+
+            return apply
+
+        stream = _prefetch(iter(batches), prefetch)
+        for i, (func, kwargs) in enumerate(head):
+            stream = _prefetch(map(stage(i, func, kwargs), stream), prefetch)
+
+        save_path = Path(save_path)
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        spool = save_path.with_name(f"{save_path.name}.{os.getpid()}.tmp")
+        writer, rows, batch_count = None, 0, 0
+        try:
+            for df in stream:
+                batch_count += 1
+                if df.empty:
+                    continue
+                table = pa.Table.from_pandas(
+                    df, schema=writer.schema if writer else None, preserve_index=False
+                )
+                if writer is None:
+                    writer = pq.ParquetWriter(spool, table.schema)
+                writer.write_table(table)
+                rows += len(df)
+                log.info(f"Streamed batch {batch_count}: {rows} rows written.")
+        except BaseException:
+            spool.unlink(missing_ok=True)
+            raise
+        finally:
+            stream.close()
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            raise ValueError("The stream produced no rows.")
+
+        self.report = [
+            StepReport(func.__name__, "", False, seconds, rows_in, rows_out, 0.0)
+            for (func, _), (seconds, rows_in, rows_out) in zip(head, totals)
+        ]
+        df = pd.read_parquet(spool)
+        if tail.steps:
+            df = tail.run(df)
+            self.report += tail.report
+            df.to_parquet(spool, index=False)
+        os.replace(spool, save_path)
+        log.info(f"Streaming pipeline complete: {len(df)} rows written to {save_path}.")
+        return df
+
+    def report_frame(self) -> pd.DataFrame:
+        """The last run's step reports as a DataFrame."""
+        return pd.DataFrame(self.report, columns=StepReport._fields)
+
 
-def build_pipeline(model: SentenceTransformerWrapper) -> Pipeline:
+def build_pipeline(
+    model: SentenceTransformerWrapper,
+    count_scale: float | None = None,
+    embed: bool = True,
+    checkpoint_dir: str | Path | None = None,
+) -> Pipeline:
     """
     Build and return the default search pipeline.
+    count_scale: log_normalise scale for the counts; pass the full dataset's when the
+    pipeline runs on a delta. embed: set False to embed separately (e.g. reusing vectors).
+    checkpoint_dir: where step outputs are checkpointed for resuming (None disables it).
     """
-    pipeline = Pipeline()
+    pipeline = Pipeline(checkpoint_dir=checkpoint_dir)
     pipeline.add_step(drop_na, columns=SCHEMA_COLUMNS)
     pipeline.add_step(remove_stopwords, columns=TEXT_COLUMNS, stopwords=NOISE_WORDS)
     pipeline.add_step(normalise, columns=TEXT_COLUMNS)
     pipeline.add_step(blob, columns_to_blob=TEXT_COLUMNS, blob_column="blob")
     pipeline.add_step(remove_duplicates, columns=["blob"])
-    pipeline.add_step(model.embed_columns, columns=["model_name", "blob"])
-    pipeline.add_step(log_normalise, columns=["count_of_buy_products"])
+    if embed:
+        pipeline.add_step(model.embed_columns, columns=EMBEDDING_COLUMNS)
+    pipeline.add_step(log_normalise, columns=["count_of_buy_products"], scale=count_scale)
     return pipeline
@@ -1,19 +1,57 @@
 from sentence_transformers import SentenceTransformer
+import torch
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
+import functools
+import hashlib
 import logging
+import threading
 from abc import ABC, abstractmethod
-from typing import List
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, NamedTuple
+from .embedding_store import EmbeddingStore
+from .transforms import row_wise
 
 log = logging.getLogger(__name__)
 
 
+class EmbeddingCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
 class TransformerBase(ABC):
     """
     Abstract base class for text embedding transformers.
     Subclasses must implement encode(texts: List[str], **kwargs) -> List or np.ndarray.
+
+    encode_one keeps a thread-safe, size-bounded LRU cache of query embeddings keyed by
+    the normalised query. Concurrent requests for the same key share one encode.
+    embed_columns reads and appends catalog embeddings through an optional persistent
+    EmbeddingStore, keyed by `fingerprint`.
     """
 
+    def __init__(self, cache_size: int = 1024, embedding_store: EmbeddingStore | None = None):
+        """
+        Args:
+            cache_size (int): Maximum number of query embeddings kept by encode_one.
+                0 disables the cache.
+            embedding_store (EmbeddingStore): Persistent store of catalog embeddings used
+                by embed_columns. None encodes every text not otherwise known.
+        """
+        self.cache_size = cache_size
+        self.embedding_store = embedding_store
+        self._cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
     @abstractmethod
     def encode(self, texts: List[str], **kwargs):
         """
@@ -21,29 +59,157 @@ class TransformerBase(ABC):
         """
         pass
 
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identity of the model weights, keying persisted embeddings. Subclasses must
+        return a value that changes whenever their embeddings would.
+        """
+        return type(self).__name__
+
+    @row_wise
     def embed_columns(
-        self, df: pd.DataFrame, columns: List[str], batch_size: int = 64
+        self,
+        df: pd.DataFrame,
+        columns: List[str],
+        batch_size: int = 64,
+        known: pd.DataFrame | None = None,
     ) -> pd.DataFrame:
         """
         Embed specified columns in the DataFrame and add new columns with _embedding suffix.
+        Each distinct text is encoded once. Texts already embedded in `known` (a frame with
+        the same columns and their _embedding columns) reuse those vectors, then the
+        embedding store is consulted; only the remaining texts are encoded, and stored.
         """
         for col in tqdm(columns, desc="Embedding columns"):
             if col not in df.columns:
                 log.error(f"Column '{col}' not found in DataFrame.")
                 raise ValueError(f"Column '{col}' not found in DataFrame.")
             log.info(f"Embedding column: {col}")
-            texts = df[col].fillna("").astype(str).tolist()
-            embeddings = self.encode(texts, batch_size=batch_size)
-            df[col + "_embedding"] = list(embeddings)
+            texts = df[col].fillna("").astype(str)
+            vectors = {}
+            if known is not None and col + "_embedding" in known.columns:
+                known_texts = known[col].fillna("").astype(str)
+                needed = known_texts.isin(set(texts))
+                vectors = dict(
+                    zip(known_texts[needed], known.loc[needed, col + "_embedding"])
+                )
+            missing = [text for text in texts.unique() if text not in vectors]
+            if missing and self.embedding_store is not None:
+                vectors.update(self.embedding_store.get_many(self.fingerprint, missing))
+                missing = [text for text in missing if text not in vectors]
+            # With a store, encode in chunks so an interrupted run keeps what it encoded
+            chunk_size = batch_size * 64 if self.embedding_store is not None else len(missing)
+            for start in range(0, len(missing), max(chunk_size, 1)):
+                chunk = missing[start : start + chunk_size]
+                embeddings = np.asarray(self.encode(chunk, batch_size=batch_size))
+                vectors.update(zip(chunk, embeddings))
+                if self.embedding_store is not None:
+                    self.embedding_store.add_many(self.fingerprint, chunk, embeddings)
+            log.info(
+                f"Encoded {len(missing)} texts for column '{col}', reused "
+                f"{texts.nunique() - len(missing)}."
+            )
+            df[col + "_embedding"] = [vectors[text] for text in texts]
             log.info(f"Completed embedding for column: {col}")
         log.info("All embeddings complete.")
         return df
 
+    def cache_key(self, text: str) -> str:
+        """
+        Normalise a query for caching: lowercase with collapsed whitespace. This does not
+        change the embedding for uncased models such as all-MiniLM-L6-v2; override it for
+        case-sensitive models.
+        """
+        return " ".join(text.lower().split())
+
     def encode_one(self, text: str, **kwargs):
         """
-        Encode a single string into an embedding.
+        Encode a single string into an embedding, served from the query cache when
+        possible. The returned array is shared and read-only.
         """
-        return self.encode([text], **kwargs)[0]
+        if kwargs or self.cache_size <= 0:
+            return self.encode([text], **kwargs)[0]
+        key = self.cache_key(text)
+        with self._cache_lock:
+            embedding = self._cache.get(key)
+            if embedding is not None:
+                self._cache.move_to_end(key)
+                self._cache_hits += 1
+                return embedding
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self._cache_misses += 1
+            else:
+                self._cache_hits += 1
+        if not owner:
+            # Another thread is already encoding this query
+            return future.result()
+        try:
+            embedding = np.asarray(self.encode([key])[0])
+            embedding.setflags(write=False)
+        except BaseException as e:
+            with self._cache_lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._cache_lock:
+            self._cache[key] = embedding
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._inflight.pop(key, None)
+        future.set_result(embedding)
+        return embedding
+
+    def encode_many(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """
+        Encode several queries at once. Cached queries are served from the query cache and
+        all misses are encoded together in a single batch, then cached.
+        Returns a 2D float32 array with one row per text.
+        """
+        if self.cache_size <= 0:
+            return np.asarray(self.encode(texts, batch_size=batch_size), dtype=np.float32)
+        keys = [self.cache_key(text) for text in texts]
+        found = {}
+        with self._cache_lock:
+            for key in dict.fromkeys(keys):
+                embedding = self._cache.get(key)
+                if embedding is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = embedding
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            self._cache_hits += len(found)
+            self._cache_misses += len(missing)
+        if missing:
+            embeddings = np.asarray(self.encode(missing, batch_size=batch_size))
+            with self._cache_lock:
+                for key, embedding in zip(missing, embeddings):
+                    embedding = embedding.copy()
+                    embedding.setflags(write=False)
+                    found[key] = self._cache[key] = embedding
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+
+    def cache_info(self) -> EmbeddingCacheInfo:
+        """
+        Return hit/miss counters and the size of the query embedding cache.
+        """
+        with self._cache_lock:
+            return EmbeddingCacheInfo(
+                self._cache_hits, self._cache_misses, self.cache_size, len(self._cache)
+            )
+
+    def clear_cache(self) -> None:
+        """
+        Drop all cached query embeddings and reset the counters.
+        """
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_hits = 0
+            self._cache_misses = 0
 
 
 class SentenceTransformerWrapper(TransformerBase):
@@ -51,25 +217,198 @@ class SentenceTransformerWrapper(TransformerBase):
     Wrapper for HuggingFace SentenceTransformer.
     """
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        cache_size: int = 1024,
+        revision: str | None = None,
+        embedding_store: EmbeddingStore | None = None,
+    ):
+        super().__init__(cache_size=cache_size, embedding_store=embedding_store)
+        self.model_name = model_name
+        self.revision = revision
         log.info(f"Loading transformer model: {model_name}")
         try:
-            self.model = SentenceTransformer(model_name)
+            self.model = SentenceTransformer(model_name, revision=revision)
             log.info(f"Successfully loaded transformer model: {model_name}")
         except Exception as e:
             log.error(f"Failed to load transformer model '{model_name}': {e}")
             raise RuntimeError(f"Failed to load transformer model '{model_name}': {e}")
 
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """
+        Content hash of the loaded weights, so persisted embeddings are invalidated when
+        an unpinned `revision` resolves to a new hub commit, or a local model changes.
+        """
+        digest = hashlib.sha256()
+        for name, tensor in self.model.state_dict().items():
+            digest.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)}".encode())
+            # Raw bytes, as numpy has no bfloat16
+            digest.update(tensor.detach().cpu().reshape(-1).view(torch.uint8).numpy())
+        max_seq_length = self.model.max_seq_length
+        return f"sentence-transformers:{digest.hexdigest()[:16]}:max_seq_length={max_seq_length}"
+
     def encode(self, texts: List[str], batch_size: int = 64, **kwargs):
         """
         Encode a list of texts using the underlying SentenceTransformer model.
         """
         return self.model.encode(
-            texts, show_progress_bar=True, batch_size=batch_size, **kwargs
+            texts,
+            show_progress_bar=len(texts) > batch_size,
+            batch_size=batch_size,
+            **kwargs,
         )
 
-    def encode_one(self, text: str, **kwargs):
+
+class OnnxTransformerWrapper(TransformerBase):
+    """
+    Sentence embedding encoder running an exported (optionally int8-quantized) ONNX
+    transformer through ONNX Runtime on CPU, with mean pooling and L2 normalisation to
+    match sentence-transformers' all-MiniLM-L6-v2 pipeline.
+    onnxruntime is imported lazily, so it is only needed when this backend is selected;
+    it and onnx (for `export`) come with the `onnx` extra. Use `export` to produce the
+    model directory.
+    """
+
+    MODEL_FILE = "model.onnx"
+    QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+    MISSING_ONNX = "The onnx encoder backend needs the `onnx` extra: uv sync --extra onnx"
+
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = True,
+        intra_op_threads: int = 1,
+        max_length: int = 256,
+        cache_size: int = 1024,
+        embedding_store: EmbeddingStore | None = None,
+    ):
+        """
+        Args:
+            model_dir (str): Directory written by OnnxTransformerWrapper.export.
+            quantized (bool): Load the int8-quantized model instead of the fp32 one.
+            intra_op_threads (int): ONNX Runtime threads used within each operator.
+            max_length (int): Maximum tokens per text (256 for all-MiniLM-L6-v2).
+            cache_size (int): Maximum number of query embeddings kept by encode_one.
+            embedding_store (EmbeddingStore): Persistent store of catalog embeddings.
+        """
+        super().__init__(cache_size=cache_size, embedding_store=embedding_store)
+        model_path = Path(model_dir) / (
+            self.QUANTIZED_MODEL_FILE if quantized else self.MODEL_FILE
+        )
+        log.info(f"Loading ONNX transformer model: {model_path}")
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(self.MISSING_ONNX) from e
+        try:
+            from transformers import AutoTokenizer
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = 1
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = ort.InferenceSession(
+                str(model_path), options, providers=["CPUExecutionProvider"]
+            )
+            self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+            log.info(f"Successfully loaded ONNX transformer model: {model_path}")
+        except Exception as e:
+            log.error(f"Failed to load ONNX transformer model '{model_path}': {e}")
+            raise RuntimeError(f"Failed to load ONNX transformer model '{model_path}': {e}")
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_length = max_length
+        self.model_path = model_path
+
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """
+        Content hash of the ONNX model file, so a re-export or re-quantization gets new
+        persisted embeddings.
+        """
+        digest = hashlib.sha256()
+        with open(self.model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return f"onnx:{digest.hexdigest()[:16]}:max_length={self.max_length}"
+
+    def encode(self, texts: List[str], batch_size: int = 64, **kwargs) -> np.ndarray:
         """
-        Encode a single string using the underlying SentenceTransformer model.
+        Encode a list of texts with the ONNX model, returning normalised float32 embeddings.
         """
-        return self.encode([text], **kwargs)[0]
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start : start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {
+                name: value.astype(np.int64)
+                for name, value in tokens.items()
+                if name in self.input_names
+            }
+            token_embeddings = self.session.run(None, feeds)[0]
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(
+                mask.sum(axis=1), 1e-9, None
+            )
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        if not batches:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(batches)
+
+    @classmethod
+    def export(
+        cls,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        output_dir: str = "models/all-MiniLM-L6-v2-onnx",
+        quantize: bool = True,
+        opset: int = 17,
+    ) -> Path:
+        """
+        Export a HuggingFace transformer and its tokenizer to ONNX in output_dir, and
+        optionally write an int8 dynamically quantized copy next to it.
+        Returns the output directory.
+        """
+        from transformers import AutoModel, AutoTokenizer
+
+        try:
+            import onnx  # noqa: F401 (needed by torch.onnx.export)
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as e:
+            raise ImportError(cls.MISSING_ONNX) from e
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        dummy = tokenizer(["export sample"], return_tensors="pt")
+        input_names = list(dummy.keys())
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        log.info(f"Exporting {model_name} to ONNX in {output_dir}")
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(dummy[name] for name in input_names),
+                str(output_dir / cls.MODEL_FILE),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=opset,
+            )
+        tokenizer.save_pretrained(output_dir)
+        if quantize:
+            log.info("Quantizing ONNX model weights to int8")
+            quantize_dynamic(
+                str(output_dir / cls.MODEL_FILE),
+                str(output_dir / cls.QUANTIZED_MODEL_FILE),
+                weight_type=QuantType.QInt8,
+            )
+        log.info(f"ONNX export complete: {output_dir}")
+        return output_dir
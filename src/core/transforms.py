@@ -1,49 +1,177 @@
 import pandas as pd
 import logging
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 
 log = logging.getLogger(__name__)
 
+# Word separator, typed to match the large_string arrays the transforms work on
+_SPACE = pa.scalar(" ", pa.large_string())
 
+
+def row_wise(func):
+    """
+    Mark a transform whose output rows depend only on the matching input rows, so it
+    can run batch by batch in Pipeline.run_stream.
+    """
+    func.row_wise = True
+    return func
+
+
+def normalise_text(text: str) -> str:
+    """Scalar form of the `normalise` transform: lowercase and strip."""
+    return text.lower().strip()
+
+
+def strip_stopwords(text: str, stopwords: set[str]) -> str:
+    """Scalar form of the `remove_stopwords` transform."""
+    return " ".join(word for word in text.split() if word.lower() not in stopwords)
+
+
+def _to_arrow(series: pd.Series) -> pa.Array:
+    """Column as a single Arrow large_string array, nulls kept."""
+    array = pa.array(series, type=pa.large_string(), from_pandas=True)
+    # Arrow-backed columns (e.g. after a concat) convert to several chunks
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array
+
+
+def _column(values: pa.Array | np.ndarray, like: pd.Series) -> pd.Series:
+    """Strings as a Series with the index, dtype and null markers of like."""
+    if isinstance(values, pa.Array):
+        values = values.to_numpy(zero_copy_only=False)
+    if like.dtype == object:
+        values = pd.Series(values, index=like.index, name=like.name, dtype=object)
+        return values.where(like.notna(), like)
+    return pd.Series(values, index=like.index, name=like.name).astype(like.dtype)
+
+
+def _words(array: pa.Array) -> tuple[pa.Array, np.ndarray, np.ndarray]:
+    """
+    Whitespace-separated words of every string, as str.split() finds them: the
+    flattened words, the row of each word, and a mask dropping the single empty word an
+    empty value splits into.
+    """
+    # The ASCII kernels are faster but, unlike str.split, do not split on \x1c-\x1f
+    ascii = pc.all(pc.string_is_ascii(array)).as_py() is not False
+    if ascii and not pc.any(pc.match_substring_regex(array, "[\\x1c-\\x1f]")).as_py():
+        trimmed = pc.ascii_trim_whitespace(array)
+        lists = pc.ascii_split_whitespace(trimmed)
+    else:
+        trimmed = pc.utf8_trim_whitespace(array)
+        lists = pc.utf8_split_whitespace(trimmed)
+    words = pc.list_flatten(lists)
+    rows = pc.list_parent_indices(lists).to_numpy()
+    nonempty = pc.fill_null(pc.greater(pc.binary_length(trimmed), 0), False)
+    return words, rows, nonempty.to_numpy(zero_copy_only=False)[rows]
+
+
+def _join_words(
+    array: pa.Array, words: pa.Array, rows: np.ndarray, keep: np.ndarray
+) -> pa.Array:
+    """Join the kept words of each row with single spaces; null rows stay null."""
+    counts = np.bincount(rows[keep], minlength=len(array))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    lists = pa.LargeListArray.from_arrays(
+        pa.array(offsets), words.filter(pa.array(keep)), mask=array.is_null()
+    )
+    return pc.binary_join(lists, _SPACE)
+
+
+def _map_distinct(array: pa.Array, func) -> pa.Array:
+    """
+    Apply an array -> array function to the distinct values only. Catalog columns repeat
+    a lot (the same model in every market), so this shrinks the work several times.
+    """
+    encoded = pc.dictionary_encode(array)
+    return pc.take(func(encoded.dictionary), encoded.indices)
+
+
+def _first_occurrences(rows: np.ndarray, words: pa.Array) -> np.ndarray:
+    """Mask of the words not already seen earlier in their row."""
+    codes = pc.dictionary_encode(words).indices.to_numpy().astype(np.int64)
+    keys = rows * (codes.max(initial=0) + 1) + codes
+    # A stable sort keeps equal keys in position order, so the first of each run is the
+    # first occurrence
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    first = np.empty(len(keys), dtype=bool)
+    first[order] = np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]])
+    return first
+
+
+@row_wise
 def normalise(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
     log.info(f"Normalising columns: {columns}")
+
+    def lower_strip(array: pa.Array) -> pa.Array:
+        values = pc.utf8_trim_whitespace(pc.utf8_lower(array)).to_numpy(zero_copy_only=False)
+        # Arrow's Unicode case mapping differs from str.lower for a few characters (e.g.
+        # "İ", a final "Σ"), so non-ASCII values take the scalar path
+        ascii = pc.fill_null(pc.string_is_ascii(array), True).to_numpy(zero_copy_only=False)
+        other = np.flatnonzero(~ascii)
+        values[other] = [normalise_text(text) for text in array.take(other).to_pylist()]
+        return pa.array(values, type=pa.large_string())
+
     for col in columns:
-        df[col] = df[col].str.lower().str.strip()
+        df[col] = _column(_map_distinct(_to_arrow(df[col]), lower_strip), df[col])
     log.info(f"Normalisation complete for columns: {columns}")
     return df
 
 
+@row_wise
 def blob(
     df: pd.DataFrame, columns_to_blob: list[str], blob_column: str = "blob"
 ) -> pd.DataFrame:
     log.info(f"Creating blob column '{blob_column}' from columns: {columns_to_blob}")
-    df[blob_column] = df[columns_to_blob].astype(str).agg(" ".join, axis=1)
+    parts = [_to_arrow(df[col].astype(str)) for col in columns_to_blob]
+    joined = pc.binary_join_element_wise(*parts, _SPACE)
+    df[blob_column] = pd.Series(joined.to_numpy(zero_copy_only=False), index=df.index)
     log.info(f"Blob column '{blob_column}' created.")
     return df
 
 
+@row_wise
 def remove_stopwords(
     df: pd.DataFrame, columns: list[str], stopwords: set[str]
 ) -> pd.DataFrame:
     log.info(f"Removing stopwords from columns: {columns}")
+    value_set = pa.array(sorted(stopwords), type=pa.large_string())
+
+    def strip(array: pa.Array) -> pa.Array:
+        words, rows, keep = _words(array)
+        is_stopword = pc.is_in(pc.utf8_lower(words), value_set=value_set)
+        keep &= ~is_stopword.to_numpy(zero_copy_only=False)
+        return _join_words(array, words, rows, keep)
+
     for col in columns:
-        df[col] = df[col].apply(
-            lambda x: " ".join(
-                word for word in x.split() if word.lower() not in stopwords
-            )
-        )
+        df[col] = _column(_map_distinct(_to_arrow(df[col]), strip), df[col])
     log.info(f"Stopwords removed from columns: {columns}")
     return df
 
 
+@row_wise
 def remove_duplicates(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """
+    Drop repeated words within each value, keeping the first occurrence of each word in
+    its original position.
+    """
     log.info(f"Removing duplicate words in columns: {columns}")
+
+    def dedupe(array: pa.Array) -> pa.Array:
+        words, rows, keep = _words(array)
+        keep &= _first_occurrences(rows, words)
+        return _join_words(array, words, rows, keep)
+
     for col in columns:
-        df[col] = df[col].apply(lambda x: " ".join(set(x.split())))
+        df[col] = _column(_map_distinct(_to_arrow(df[col]), dedupe), df[col])
     log.info(f"Duplicates removed in columns: {columns}")
     return df
 
 
+@row_wise
 def drop_na(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
     log.info(f"Dropping rows with NA in columns: {columns}")
     result = df.dropna(subset=columns)
@@ -51,16 +179,21 @@ def drop_na(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
     return result
 
 
-def log_normalise(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+def log_normalise(
+    df: pd.DataFrame, columns: list[str], scale: float | None = None
+) -> pd.DataFrame:
     """
     Normalises specified columns in the DataFrame by log1p and scales to [0,1], rounded to 3 decimal places.
+    scale: divisor applied after log1p, e.g. log1p of the full dataset's largest count when
+    normalising a delta. Defaults to each column's own log1p maximum.
     """
     log.info(f"Normalising columns: {columns}")
     for col in columns:
         log.info(
             f"Original range for column '{col}': {df[col].min()} - {df[col].max()}"
         )
-        df[col] = (np.log1p(df[col]) / np.log1p(df[col]).max()).round(3)
+        col_scale = scale if scale is not None else np.log1p(df[col]).max()
+        df[col] = (np.log1p(df[col]) / col_scale).round(3)
         log.info(
             f"Normalised range for column '{col}': {df[col].min()} - {df[col].max()}"
         )
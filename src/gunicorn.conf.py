@@ -0,0 +1,41 @@
+"""
+Gunicorn configuration for pre-fork serving. Run from src/:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app (dataset, encoder, matchers, FAISS index) is imported once in the master and the
+workers inherit it copy-on-write instead of each building their own copy.
+
+That sharing only lasts until the first dataset refresh (REFRESH_INTERVAL). A refresh
+builds the new engine state inside each worker, after the fork, so from then on every
+worker holds a private copy of the full engine: plan memory for `workers` copies, not
+one. To get the shared layout back, restart the server (a new master preloads the
+refreshed dataset file) instead of, or in addition to, refreshing in place.
+"""
+import gc
+import logging
+import os
+
+# Workers are the unit of parallelism: one native thread each avoids oversubscribing
+# cores, and tokenizer thread pools are not fork-safe. Must be set before the app import.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+timeout = 120
+preload_app = True
+
+log = logging.getLogger(__name__)
+
+
+def when_ready(server):
+    """
+    Runs in the master after the app is loaded and before the workers are forked.
+    Freezing moves every object into the permanent GC generation, so the workers'
+    collections never write to (and so never copy) the inherited pages.
+    """
+    gc.collect()
+    gc.freeze()
+    log.info(f"Preloaded app; froze {gc.get_freeze_count()} objects before forking.")
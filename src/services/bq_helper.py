@@ -1,15 +1,21 @@
 import functools
+import re
+import threading
 import time
 import warnings
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from queue import Empty, Full, Queue
+from typing import Any, Literal, NamedTuple
 import logging
 import pandas as pd
+import pyarrow as pa
 from google.api_core.exceptions import DeadlineExceeded
-from google.cloud import bigquery
+from google.cloud import bigquery, bigquery_storage
 from google.cloud.bigquery import QueryJob
+from services.query_cache import QueryCache
 log = logging.getLogger(__name__)
 
 warnings.filterwarnings(
@@ -17,9 +23,19 @@ warnings.filterwarnings(
 )
 
 
-def make_schema(job: QueryJob) -> pd.DataFrame:
-    df = job.to_dataframe()
-    schema = job.result().schema
+Output = Literal["pandas", "arrow", "batches"]
+
+# Parallel read streams return rows in no particular order
+_ORDER_BY = re.compile(r"\border\s+by\b", re.IGNORECASE)
+# Functions whose result changes between runs of the same SQL on the same tables
+_NONDETERMINISTIC = re.compile(
+    r"\b(current_date|current_datetime|current_time|current_timestamp|rand|generate_uuid"
+    r"|session_user)\b",
+    re.IGNORECASE,
+)
+
+
+def make_schema(df: pd.DataFrame, schema: list[bigquery.SchemaField]) -> pd.DataFrame:
     data_dict = {
         "columns": df.columns.tolist(),
         "example_values": (df.iloc[0].tolist() if not df.empty else []),
@@ -29,7 +45,17 @@ def make_schema(job: QueryJob) -> pd.DataFrame:
     return pd.DataFrame(data_dict)
 
 
-def time_summary(query_job: QueryJob) -> str:
+class JobStats(NamedTuple):
+    """
+    Duration and data volumes of a query job, or the totals of a batch of jobs.
+    """
+
+    elapsed_sec: float = 0.0
+    bytes_processed: int = 0
+    bytes_billed: int = 0
+
+
+def job_stats(query_job: QueryJob) -> JobStats:
     # Initialize elapsed time
     elapsed_sec = 0.0
 
@@ -43,15 +69,25 @@ def time_summary(query_job: QueryJob) -> str:
         )
 
     # Access data processed and billed, handling None values
-    total_bytes_processed = query_job.total_bytes_processed or 0
-    total_bytes_billed = query_job.total_bytes_billed or 0
+    return JobStats(
+        elapsed_sec, query_job.total_bytes_processed or 0, query_job.total_bytes_billed or 0
+    )
+
+
+def sum_stats(stats: Iterable[JobStats]) -> JobStats:
+    """
+    Total duration and data volumes of several jobs.
+    """
+    return JobStats(*(sum(values) for values in zip(JobStats(), *stats)))
+
 
+def format_stats(stats: JobStats) -> str:
     # Convert bytes to gigabytes (GB)
-    processed_gb = total_bytes_processed / 1_073_741_824  # 1 GB = 1,073,741,824 bytes
-    billed_gb = total_bytes_billed / 1_073_741_824
+    processed_gb = stats.bytes_processed / 1_073_741_824  # 1 GB = 1,073,741,824 bytes
+    billed_gb = stats.bytes_billed / 1_073_741_824
 
     # Format each component of the summary
-    duration_str = f"Duration: {elapsed_sec:.2f} seconds"
+    duration_str = f"Duration: {stats.elapsed_sec:.2f} seconds"
     processed_str = f"Data Processed: {processed_gb:.2f} GB"
     billed_str = f"Data Billed: {billed_gb:.2f} GB"
 
@@ -59,6 +95,41 @@ def time_summary(query_job: QueryJob) -> str:
     return f"{duration_str}\n\t{processed_str}\n\t{billed_str}"
 
 
+def time_summary(query_job: QueryJob) -> str:
+    return format_stats(job_stats(query_job))
+
+
+def as_output(table: pa.Table, output: Output) -> pd.DataFrame | pa.Table | Iterator[pa.RecordBatch]:
+    """
+    Convert an Arrow table to the requested output.
+    """
+    if output == "batches":
+        return iter(table.to_batches())
+    return table if output == "arrow" else table.to_pandas()
+
+
+def _check_acyclic(depends_on: Mapping[str, set[str]]) -> None:
+    """
+    Raise ValueError if the script dependencies contain a cycle.
+    """
+    remaining = {script: set(parents) for script, parents in depends_on.items()}
+    while remaining:
+        ready = [script for script, parents in remaining.items() if not parents]
+        if not ready:
+            raise ValueError(f"Circular dependencies between scripts: {sorted(remaining)}")
+        for script in ready:
+            del remaining[script]
+        for parents in remaining.values():
+            parents.difference_update(ready)
+
+
+def table_path(table: bigquery.TableReference) -> str:
+    """
+    Storage Read API resource name of a table.
+    """
+    return f"projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}"
+
+
 def make_custom_error_message(e, job):
     location = job.location or "US"
     project_id = job.project
@@ -122,6 +193,10 @@ class BQHelper:
         validate: bool = False,
         timeout: int = 3600,
         client: bigquery.Client | None = None,
+        bqstorage_client: bigquery_storage.BigQueryReadClient | None = None,
+        use_storage_api: bool = True,
+        max_read_streams: int = 8,
+        query_cache: QueryCache | None = None,
     ) -> None:
         """
         Initialize the Helper instance.
@@ -141,6 +216,13 @@ class BQHelper:
             validate (bool): If True, enables validation mode for the Helper instance.
             timeout (int): The timeout duration for BigQuery operations in seconds.
             client (bigquery.Client): Optional BigQuery client. If not provided, a new client will be created.
+            bqstorage_client (bigquery_storage.BigQueryReadClient): Optional Storage Read API client.
+                If not provided, one is created on the first read.
+            use_storage_api (bool): If True, download results through the Storage Read API as Arrow
+                instead of paging them through the REST API.
+            max_read_streams (int): Maximum number of Storage Read API streams read in parallel.
+            query_cache (QueryCache): Optional on-disk cache of query results, keyed by the rendered
+                SQL and the last-modified times of the tables it reads.
 
         """
         self.billing_project_id = billing_project_id
@@ -154,6 +236,10 @@ class BQHelper:
         self.validate = validate
         self.timeout = timeout
         self.client = client or bigquery.Client(project=self.billing_project_id)
+        self.use_storage_api = use_storage_api
+        self.max_read_streams = max_read_streams
+        self._bqstorage_client = bqstorage_client
+        self.query_cache = query_cache
 
     def _read_sql(self, script: str) -> str:
         sql_path = Path(self.sql_folder) / f"{script}.sql"
@@ -189,27 +275,65 @@ class BQHelper:
         return df  # Return empty df in dry run
 
     def _run_query(
-        self, sql: str, *, return_df: bool = False, return_schema: bool = False
-    ) -> pd.DataFrame:
+        self,
+        sql: str,
+        *,
+        return_df: bool = False,
+        return_schema: bool = False,
+        output: Output = "pandas",
+    ) -> pd.DataFrame | pa.Table | Iterator[pa.RecordBatch]:
+        return self._run_job(
+            sql, return_df=return_df, return_schema=return_schema, output=output
+        )[0]
+
+    def _run_job(
+        self,
+        sql: str,
+        *,
+        return_df: bool = False,
+        return_schema: bool = False,
+        output: Output = "pandas",
+    ) -> tuple[pd.DataFrame | pa.Table | Iterator[pa.RecordBatch], JobStats]:
+        """
+        Run sql and wait for it. Returns the result (an empty df unless return_df or
+        return_schema) and the job's stats, which are zero for a dry run or cache hit.
+        """
         df = pd.DataFrame()  # Return empty df if return_df=False
 
         if self.validate:
-            return self._validate_query(df, sql)
+            return self._validate_query(df, sql), JobStats()
+
+        cache_key = None
+        if return_df and not return_schema:
+            cache_key = self._cache_key(sql)
+            cached = self.query_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                return as_output(cached, output), JobStats()
 
         job = self.client.query(sql)
 
         try:
-            job.result(timeout=self.timeout)
-            summary = time_summary(job)
-
-            if return_df:
-                df = job.to_dataframe()
-                summary = (
-                    summary + f"\nReturned {df.shape[0]} rows, {df.shape[1]} columns"
-                )
+            # Wait once and download from the same result
+            rows = job.result(timeout=self.timeout)
+            stats = job_stats(job)
+            summary = format_stats(stats)
+
+            if return_df or return_schema:
+                df = self._download(job, rows, sql, streaming=output == "batches")
+                if cache_key and output == "batches":
+                    df = self.query_cache.put_batches(cache_key, df)
+                elif cache_key:
+                    self.query_cache.put(cache_key, df)
+                if output == "batches":
+                    summary = summary + f"\nStreaming {rows.total_rows} rows"
+                else:
+                    df = as_output(df, output)
+                    summary = (
+                        summary + f"\nReturned {df.shape[0]} rows, {df.shape[1]} columns"
+                    )
 
             if return_schema:
-                df = make_schema(job)
+                df = make_schema(df, rows.schema)
 
             log.info("\n\t" + summary + "\n")
 
@@ -222,7 +346,139 @@ class BQHelper:
             log.error(msg)
             raise
         else:
-            return df
+            return df, stats
+
+    def _storage_client(self) -> bigquery_storage.BigQueryReadClient:
+        if self._bqstorage_client is None:
+            self._bqstorage_client = bigquery_storage.BigQueryReadClient()
+        return self._bqstorage_client
+
+    def _cache_key(self, sql: str) -> str | None:
+        """
+        Query cache key of sql, or None if the cache is off or the result may change
+        without any source table changing. The tables read by the query come from a
+        (free) dry run, their last-modified times from the table metadata.
+        """
+        if self.query_cache is None or _NONDETERMINISTIC.search(sql):
+            return None
+        try:
+            job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+            job = self.client.query(sql, job_config=job_config)
+            sources = {}
+            for ref in job.referenced_tables:
+                table = self.client.get_table(ref)
+                # Rows still in the streaming buffer do not move the last-modified time
+                if table.modified is None or table.streaming_buffer is not None:
+                    return None
+                sources[table_path(ref)] = table.modified.isoformat()
+        except Exception:
+            log.warning("Could not read the source tables of the query; not caching it.", exc_info=True)
+            return None
+        return QueryCache.key(sql, sources)
+
+    def _download(
+        self, job: QueryJob, rows: bigquery.table.RowIterator, sql: str, *, streaming: bool = False
+    ) -> pa.Table | Iterator[pa.RecordBatch]:
+        """
+        Download a finished query's result once, as Arrow, through the Storage Read API
+        from the job's destination table, or page by page over REST if the Storage Read
+        API is disabled or the job has no destination table. With streaming=True, the
+        record batches are yielded as they download.
+        """
+        if self.use_storage_api and job.destination is not None:
+            schema, batches = self._read_storage(
+                table_path(job.destination), preserve_order=bool(_ORDER_BY.search(sql))
+            )
+            return batches if streaming else pa.Table.from_batches(batches, schema=schema)
+        return rows.to_arrow_iterable() if streaming else rows.to_arrow()
+
+    def _read_storage(
+        self, path: str, *, preserve_order: bool = False
+    ) -> tuple[pa.Schema, Iterator[pa.RecordBatch]]:
+        """
+        Open a Storage Read API session on a table and read it as Arrow record batches.
+
+        Args:
+            path (str): Table resource name, see `table_path`.
+            preserve_order (bool): If True, read a single stream so rows keep the table's
+                order. Otherwise up to max_read_streams streams are read in parallel.
+
+        Returns:
+            tuple[pa.Schema, Iterator[pa.RecordBatch]]: The table schema and its batches.
+        """
+        client = self._storage_client()
+        session = client.create_read_session(
+            parent=f"projects/{self.billing_project_id}",
+            read_session=bigquery_storage.types.ReadSession(
+                table=path, data_format=bigquery_storage.types.DataFormat.ARROW
+            ),
+            max_stream_count=1 if preserve_order else self.max_read_streams,
+        )
+        schema = pa.ipc.read_schema(pa.py_buffer(session.arrow_schema.serialized_schema))
+        log.info(f"Reading {path} over {len(session.streams)} Storage Read API stream(s)")
+        return schema, self._read_streams(client, list(session.streams), schema)
+
+    @staticmethod
+    def _read_streams(
+        client: bigquery_storage.BigQueryReadClient, streams: list, schema: pa.Schema
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Yield the record batches of read streams, reading every stream in its own thread
+        and yielding batches as they arrive. Closing the generator stops the readers.
+        """
+
+        def batches(stream) -> Iterator[pa.RecordBatch]:
+            for response in client.read_rows(stream.name):
+                yield pa.ipc.read_record_batch(
+                    pa.py_buffer(response.arrow_record_batch.serialized_record_batch), schema
+                )
+
+        if len(streams) <= 1:
+            for stream in streams:
+                yield from batches(stream)
+            return
+
+        queue: Queue = Queue(2 * len(streams))
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def read(stream) -> None:
+            try:
+                for batch in batches(stream):
+                    if not put((batch, None)):
+                        return
+                put((done, None))
+            except BaseException as e:
+                put((None, e))
+
+        pool = ThreadPoolExecutor(len(streams), thread_name_prefix="bq-read")
+        try:
+            for stream in streams:
+                pool.submit(read, stream)
+            remaining = len(streams)
+            while remaining:
+                try:
+                    item, error = queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                if error is not None:
+                    raise error
+                if item is done:
+                    remaining -= 1
+                else:
+                    yield item
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
 
     def _write(self, df: pd.DataFrame, table: str) -> None:
         if self.validate:
@@ -291,17 +547,192 @@ class BQHelper:
         self._run_query(sql=sql)
 
     @handle_silent
-    def get(self, script: str, **kwargs: Any) -> pd.DataFrame:
+    def get(
+        self, script: str, output: Output = "pandas", **kwargs: Any
+    ) -> pd.DataFrame | pa.Table | Iterator[pa.RecordBatch]:
         """
         Execute an SQL script located in the SQL queries folder. Returns df.
 
         Keyword Arguments:
             script: provide the name of the script in sql queries folder to open.
+            output: "pandas" for a DataFrame, "arrow" for a pyarrow.Table, "batches" for an
+                iterator of pyarrow.RecordBatch.
             **kwargs: enter the parameter names that are contained in your script. e.g. start_date = start_date.
 
         """
         sql = self._prepare_sql(script=script, **kwargs)
-        return self._run_query(sql=sql, return_df=True)
+        return self._run_query(sql=sql, return_df=True, output=output)
+
+    @handle_silent
+    def iter_batches(
+        self, script: str, page_size: int | None = None, **kwargs: Any
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Execute an SQL script located in the SQL queries folder and yield its result as
+        Arrow record batches as they download.
+
+        Args:
+            script (str): Name of the SQL script file (without .sql extension).
+            page_size (int, optional): Rows per page when paging over REST. Storage Read
+                API batches are sized by the API.
+            **kwargs: Additional parameters to interpolate into the SQL script.
+
+        """
+        sql = self._prepare_sql(script=script, **kwargs)
+        if self.validate:
+            self._validate_query(pd.DataFrame(), sql)
+            return
+
+        cache_key = self._cache_key(sql)
+        cached = self.query_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            yield from cached.to_batches()
+            return
+
+        job = self.client.query(sql)
+        try:
+            rows = job.result(timeout=self.timeout, page_size=page_size)
+        except DeadlineExceeded:
+            job.cancel()
+            log.exception("Timeout limit reached!")
+            raise
+        except Exception as e:
+            log.error(make_custom_error_message(e, job))
+            raise
+        log.info("\n\t" + time_summary(job) + f"\n\tStreaming {rows.total_rows} rows\n")
+        batches = self._download(job, rows, sql, streaming=True)
+        yield from self.query_cache.put_batches(cache_key, batches) if cache_key else batches
+
+    def iter_many(
+        self,
+        scripts: Mapping[str, Mapping[str, Any] | None] | Iterable[str],
+        depends_on: Mapping[str, Iterable[str]] | None = None,
+        *,
+        return_df: bool = True,
+        output: Output = "pandas",
+        max_concurrent: int | None = None,
+    ) -> Iterator[tuple[str, pd.DataFrame | pa.Table | Iterator[pa.RecordBatch]]]:
+        """
+        Execute several SQL scripts concurrently and yield (script, result) pairs as the
+        scripts complete.
+
+        Every script is rendered before any is submitted. A script is submitted as soon as
+        the scripts it depends on have completed, with at most max_concurrent jobs running
+        at once. If a script fails, no further scripts are submitted, the running ones are
+        waited for and the first error is raised. The summed stats of the completed jobs
+        are logged at the end.
+
+        Args:
+            scripts (Mapping | Iterable[str]): Script names (without .sql extension), or a
+                mapping of script name to the parameters to interpolate into it.
+            depends_on (Mapping[str, Iterable[str]], optional): Scripts each script must wait for.
+            return_df (bool): If False, results are empty dfs, as from run.
+            output (str): "pandas", "arrow" or "batches", as for get.
+            max_concurrent (int, optional): Maximum jobs running at once. Defaults to all.
+
+        """
+        if not isinstance(scripts, Mapping):
+            scripts = dict.fromkeys(scripts)
+        pending = {script: set() for script in scripts}
+        for script, parents in (depends_on or {}).items():
+            unknown = {script, *parents} - pending.keys()
+            if unknown:
+                raise ValueError(f"Dependencies name scripts not in the batch: {sorted(unknown)}")
+            pending[script].update(parents)
+        _check_acyclic(pending)
+        sqls = {
+            script: self._prepare_sql(script=script, **(kwargs or {}))
+            for script, kwargs in scripts.items()
+        }
+
+        start = time.perf_counter()
+        stats, error = [], None
+        with ThreadPoolExecutor(
+            max_concurrent or len(sqls) or 1, thread_name_prefix="bq-job"
+        ) as pool:
+            running = {}
+
+            def submit_ready() -> None:
+                for script in [script for script, parents in pending.items() if not parents]:
+                    del pending[script]
+                    future = pool.submit(
+                        self._run_job, sqls[script], return_df=return_df, output=output
+                    )
+                    running[future] = script
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    script = running.pop(future)
+                    try:
+                        result, job_stats = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    stats.append(job_stats)
+                    for parents in pending.values():
+                        parents.discard(script)
+                    yield script, result
+                if error is None:
+                    submit_ready()
+
+        total = sum_stats(stats)
+        log.info(
+            f"\n\t{len(stats)} of {len(sqls)} scripts completed in "
+            f"{time.perf_counter() - start:.2f} seconds\n\tSummed job "
+            + format_stats(total)
+            + "\n"
+        )
+        if error is not None:
+            if pending:
+                log.error(f"Not run after the failure: {sorted(pending)}")
+            raise error
+
+    @handle_silent
+    def run_many(
+        self,
+        scripts: Mapping[str, Mapping[str, Any] | None] | Iterable[str],
+        depends_on: Mapping[str, Iterable[str]] | None = None,
+        max_concurrent: int | None = None,
+    ) -> None:
+        """
+        Execute several SQL scripts concurrently, respecting dependencies between them.
+        See iter_many.
+
+        Args:
+            scripts (Mapping | Iterable[str]): Script names, or a mapping of script name to parameters.
+            depends_on (Mapping[str, Iterable[str]], optional): Scripts each script must wait for.
+            max_concurrent (int, optional): Maximum jobs running at once. Defaults to all.
+
+        """
+        for _ in self.iter_many(
+            scripts, depends_on, return_df=False, max_concurrent=max_concurrent
+        ):
+            pass
+
+    @handle_silent
+    def get_many(
+        self,
+        scripts: Mapping[str, Mapping[str, Any] | None] | Iterable[str],
+        depends_on: Mapping[str, Iterable[str]] | None = None,
+        output: Output = "pandas",
+        max_concurrent: int | None = None,
+    ) -> dict[str, pd.DataFrame | pa.Table | Iterator[pa.RecordBatch]]:
+        """
+        Execute several SQL scripts concurrently, respecting dependencies between them.
+        Returns the result of each script, keyed by script name. See iter_many.
+
+        Args:
+            scripts (Mapping | Iterable[str]): Script names, or a mapping of script name to parameters.
+            depends_on (Mapping[str, Iterable[str]], optional): Scripts each script must wait for.
+            output (str): "pandas", "arrow" or "batches", as for get.
+            max_concurrent (int, optional): Maximum jobs running at once. Defaults to all.
+
+        """
+        return dict(
+            self.iter_many(scripts, depends_on, output=output, max_concurrent=max_concurrent)
+        )
 
     @handle_silent
     def run_string(self, string: str) -> None:
@@ -353,28 +784,46 @@ class BQHelper:
 
     @handle_silent
     def get_table(
-        self, table: str, project_id: str | None = None, dataset: str | None = None
-    ) -> pd.DataFrame:
+        self,
+        table: str,
+        project_id: str | None = None,
+        dataset: str | None = None,
+        output: Output = "pandas",
+    ) -> pd.DataFrame | pa.Table | Iterator[pa.RecordBatch]:
         """
         Retrieve all rows from a specified BigQuery table.
 
+        With the Storage Read API the table is read directly, in parallel streams,
+        without running a query.
+
         Args:
             table (str): The name of the BigQuery table to select data from.
             project_id (str, optional): The ID of the project containing the table.
             dataset (str, optional): The ID of the dataset containing the table.
+            output (str, optional): "pandas" for a DataFrame, "arrow" for a pyarrow.Table,
+                "batches" for an iterator of pyarrow.RecordBatch.
 
         """
         table = self._make_full_table(
             table=table, write_project_id=project_id, write_dataset=dataset
         )
-        sql = f"select * from {table}"  # NOQA: S608
-
         log.info("Getting table: " + table)
 
+        if self.use_storage_api and not self.validate:
+            path = table_path(bigquery.TableReference.from_string(table.strip("`")))
+            schema, batches = self._read_storage(path)
+            if output == "batches":
+                return batches
+            arrow = pa.Table.from_batches(batches, schema=schema)
+            log.info(f"Read {arrow.num_rows} rows, {arrow.num_columns} columns")
+            return as_output(arrow, output)
+
+        sql = f"select * from {table}"  # NOQA: S608
+
         if self.sql_log_folder:
             self._log_file(text=sql, query_name=table)
 
-        return self._run_query(sql=sql, return_df=True)
+        return self._run_query(sql=sql, return_df=True, output=output)
 
     @handle_silent
     def get_table_data_dict(self, table: str) -> pd.DataFrame:
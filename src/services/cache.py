@@ -0,0 +1,389 @@
+"""
+Result caching for the service layer: pluggable cache backends (an in-process LRU and a
+SQLite store shared by every worker on a node) and query canonicalisation for cache keys.
+"""
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from pathlib import Path
+from typing import Any, NamedTuple
+from config.settings import NOISE_WORDS, RESULT_CACHE_TOUCH_INTERVAL
+from core.transforms import normalise_text, strip_stopwords
+
+log = logging.getLogger(__name__)
+
+
+def canonicalise_query(query: str) -> str:
+    """
+    Canonical form of a search query, using the same stopword and normalise rules the
+    pipeline applies to the catalog text. "Canon  R5 camera" and "canon r5" map to the
+    same string. Falls back to the normalised query if only stopwords remain.
+    """
+    canonical = normalise_text(strip_stopwords(query, NOISE_WORDS))
+    return canonical or " ".join(normalise_text(query).split())
+
+
+class CacheKey(NamedTuple):
+    """
+    Key of a cached result: the cached function, the dataset version the result was
+    computed from, and the (hashable, repr-stable) call parameters.
+    """
+
+    namespace: str
+    version: str
+    params: tuple
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    currsize: int
+    maxsize: int
+    bytes: int
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires_at: float | None
+    nbytes: int
+
+
+class CacheBackend(ABC):
+    """
+    Interface for result cache stores used by the `cached` decorator. Keys are CacheKey
+    tuples and values are picklable. Implementations must be thread-safe.
+    """
+
+    @abstractmethod
+    def get(self, key: CacheKey, default: Any = None) -> Any:
+        """
+        Return the cached value for key, or default if it is missing or expired.
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: CacheKey, value: Any) -> None:
+        """
+        Store value under key, evicting entries as needed to stay within bounds.
+        """
+        pass
+
+    @abstractmethod
+    def invalidate(self, version: str) -> None:
+        """
+        Drop every entry computed from a dataset version other than version.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Drop all entries.
+        """
+        pass
+
+    @abstractmethod
+    def info(self) -> CacheInfo:
+        """
+        Return hit/miss/eviction counters and current size.
+        """
+        pass
+
+
+class LRUCache(CacheBackend):
+    """
+    Thread-safe, in-process least-recently-used cache with an optional time-to-live and
+    an optional bound on the total pickled size of the stored values.
+    """
+
+    def __init__(
+        self, maxsize: int = 256, ttl: float | None = None, max_bytes: int | None = None
+    ):
+        """
+        Args:
+            maxsize (int): Maximum number of entries.
+            ttl (float): Seconds after which an entry expires. None keeps entries forever.
+            max_bytes (int): Maximum total pickled size of the values. None disables it.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the cached value for key, or default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Store value under key, evicting least recently used entries to stay in bounds.
+        Values larger than max_bytes on their own are not cached.
+        """
+        nbytes = (
+            len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            if self.max_bytes is not None
+            else 0
+        )
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            log.debug(f"Not caching value of {nbytes} bytes (max_bytes={self.max_bytes}).")
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, expires_at, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.maxsize or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.nbytes
+
+    def invalidate(self, version: str) -> None:
+        """
+        Drop every entry computed from a dataset version other than version.
+        """
+        with self._lock:
+            stale = [
+                key for key in self._entries if getattr(key, "version", version) != version
+            ]
+            for key in stale:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """
+        Drop all entries. Counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self) -> CacheInfo:
+        """
+        Return hit/miss/eviction counters and current size.
+        """
+        with self._lock:
+            return CacheInfo(
+                self._hits,
+                self._misses,
+                self._evictions,
+                len(self._entries),
+                self.maxsize,
+                self._bytes,
+            )
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Result cache stored in a SQLite database on local disk, shared by every worker
+    process on the node, so a result computed by one worker serves them all.
+
+    Values are pickled and zlib-compressed. Eviction is least-recently-used by entry
+    count and total compressed size, with an optional TTL. A hit only records its read
+    time when the recorded one is touch_interval seconds old, so reads rarely write. Each thread (and each forked
+    process) opens its own connection; WAL mode lets readers proceed during writes.
+    Hit/miss/eviction counters are per process.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        maxsize: int = 10_000,
+        ttl: float | None = None,
+        max_bytes: int | None = None,
+        timeout: float = 5.0,
+        touch_interval: float = RESULT_CACHE_TOUCH_INTERVAL,
+    ):
+        """
+        Args:
+            path (str | Path): SQLite database file, created if missing.
+            maxsize (int): Maximum number of entries.
+            ttl (float): Seconds after which an entry expires. None keeps entries forever.
+            max_bytes (int): Maximum total compressed size of the values. None disables it.
+            timeout (float): Seconds to wait for another process's write lock.
+            touch_interval (float): Seconds before a hit updates an entry's read time.
+        """
+        self.path = Path(path)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, version TEXT, value BLOB, nbytes INTEGER, "
+                "expires_at REAL, accessed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(key: CacheKey) -> str:
+        return hashlib.sha256(repr(tuple(key)).encode()).hexdigest()
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get(self, key: CacheKey, default: Any = None) -> Any:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?",
+            (self._key(key),),
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            self._count("_misses")
+            return default
+        if now - row[2] >= self.touch_interval:
+            conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, self._key(key))
+            )
+        self._count("_hits")
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def set(self, key: CacheKey, value: Any) -> None:
+        blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if self.max_bytes is not None and len(blob) > self.max_bytes:
+            log.debug(f"Not caching value of {len(blob)} bytes (max_bytes={self.max_bytes}).")
+            return
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(key), getattr(key, "version", None), blob, len(blob), expires_at, now),
+            )
+            evicted = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,)).rowcount
+            evicted += conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            ).rowcount
+            if self.max_bytes is not None:
+                evicted += conn.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    "SELECT key FROM (SELECT key, SUM(nbytes) OVER ("
+                    "ORDER BY accessed_at DESC, key) AS running FROM entries) WHERE running > ?)",
+                    (self.max_bytes,),
+                ).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if evicted:
+            self._count("_evictions", evicted)
+
+    def invalidate(self, version: str) -> None:
+        deleted = self._connect().execute(
+            "DELETE FROM entries WHERE version IS NOT ?", (version,)
+        ).rowcount
+        log.info(f"Invalidated {deleted} cached results not from dataset version {version}.")
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM entries")
+
+    def info(self) -> CacheInfo:
+        count, nbytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries"
+        ).fetchone()
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions, count, self.maxsize, nbytes)
+
+
+def create_cache(
+    backend: str,
+    maxsize: int,
+    ttl: float | None = None,
+    max_bytes: int | None = None,
+    path: str | Path | None = None,
+) -> CacheBackend:
+    """
+    Create a result cache backend by name: "memory" (per process) or "sqlite" (shared
+    by the workers on the node, stored at path).
+    """
+    if backend == "memory":
+        return LRUCache(maxsize=maxsize, ttl=ttl, max_bytes=max_bytes)
+    if backend == "sqlite":
+        if path is None:
+            raise ValueError("The sqlite cache backend needs a path.")
+        return SQLiteCache(path, maxsize=maxsize, ttl=ttl, max_bytes=max_bytes)
+    raise ValueError(f"Unknown cache backend '{backend}'.")
+
+
+def cached(
+    cache: CacheBackend,
+    key_func: Callable[..., tuple],
+    version_func: Callable[[], str],
+) -> Callable:
+    """
+    Decorator caching a function's results in cache under
+    CacheKey(function name, version_func(), key_func(*args, **kwargs)).
+    """
+    _missing = object()
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = CacheKey(func.__name__, version_func(), key_func(*args, **kwargs))
+            result = cache.get(key, _missing)
+            if result is not _missing:
+                log.debug(f"Cache hit for {func.__name__} with key: {key}")
+                return result
+            log.debug(f"Cache miss for {func.__name__} with key: {key}")
+            result = func(*args, **kwargs)
+            cache.set(key, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
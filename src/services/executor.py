@@ -0,0 +1,86 @@
+"""
+Bounded thread pool for running CPU-bound search calls from async code.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+from core.engine import cancel_event
+
+log = logging.getLogger(__name__)
+
+
+class ExecutorBusy(Exception):
+    """Raised when the executor already holds its maximum number of calls."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a bound on queued plus running calls. A call submitted while the
+    bound is reached fails fast with ExecutorBusy instead of queueing without limit, so
+    the server can shed load. Calls may pass a threading.Event that the search engine
+    checks between matchers (see core.engine.cancel_event).
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        """
+        Args:
+            max_workers (int): Number of threads running calls.
+            max_pending (int): Most calls queued or running at once.
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of calls queued or running."""
+        return self._pending
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(
+        self,
+        func: Callable,
+        *args,
+        cancel: threading.Event | None = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Run func(*args, **kwargs) on the pool and await its result.
+        Args:
+            func (Callable): The blocking call.
+            cancel (threading.Event): Set to make a search inside func stop at its next
+                matcher boundary with SearchCancelled.
+        Raises:
+            ExecutorBusy: If max_pending calls are already queued or running.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ExecutorBusy(f"{self._pending} calls already pending.")
+            self._pending += 1
+        context = contextvars.copy_context()
+        context.run(cancel_event.set, cancel)
+        try:
+            future = self._pool.submit(context.run, functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._release(None)
+            raise
+        # The slot is freed when the thread finishes, not when the awaiting task is
+        # cancelled, so abandoned calls still count until they stop
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        """
+        Stop accepting calls and drop the queued ones.
+        """
+        self._pool.shutdown(wait=False, cancel_futures=True)
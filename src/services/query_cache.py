@@ -0,0 +1,168 @@
+"""
+On-disk cache of BigQuery query results, so rebuilds and restarts read unchanged results
+from local disk instead of re-running (and re-billing) the query.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+import pyarrow as pa
+
+log = logging.getLogger(__name__)
+
+
+class QueryCache:
+    """
+    Query results stored as Arrow IPC files, one per key, in a cache directory.
+
+    A key hashes the rendered SQL together with the last-modified time of every table
+    the query reads, so an entry goes stale as soon as a source table changes. Entries
+    are written to a temporary file and moved into place with os.replace, so readers in
+    other processes see either no entry or a complete one. Writes and evictions are
+    serialised across processes by a file lock. When the entries outgrow max_bytes, the
+    least recently read ones are deleted.
+    """
+
+    SUFFIX = ".arrow"
+    LOCK_FILE = "lock"
+
+    def __init__(self, path: str | Path, max_bytes: int | None = None):
+        """
+        Args:
+            path (str | Path): Cache directory, created if missing.
+            max_bytes (int): Maximum total size of the cached files. None disables it.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(sql: str, sources: dict[str, str]) -> str:
+        """
+        Key of the result of sql when its source tables were last modified at sources.
+        Args:
+            sql (str): Fully rendered SQL.
+            sources (dict[str, str]): Last-modified time of each referenced table.
+        """
+        digest = hashlib.sha256(sql.encode())
+        digest.update(b"\0")
+        digest.update(json.dumps(sources, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}{self.SUFFIX}"
+
+    def get(self, key: str) -> pa.Table | None:
+        """
+        Return the cached result for key, or None if there is none.
+        """
+        file = self._file(key)
+        try:
+            with pa.memory_map(str(file)) as source:
+                table = pa.ipc.open_file(source).read_all()
+            # Reads count as use for eviction
+            os.utime(file)
+        except FileNotFoundError:
+            return None
+        log.info(f"Query cache hit: {key[:12]} ({table.num_rows} rows).")
+        return table
+
+    def _tmp(self, file: Path) -> Path:
+        return file.with_name(f"{file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _commit(self, tmp: Path, file: Path) -> None:
+        with open(self.path / self.LOCK_FILE, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                os.replace(tmp, file)
+                self._evict()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def put(self, key: str, table: pa.Table) -> None:
+        """
+        Store table under key, then evict least recently read entries to stay within
+        max_bytes. Tables larger than max_bytes on their own are not cached.
+        """
+        if self.max_bytes is not None and table.nbytes > self.max_bytes:
+            log.info(f"Not caching query result of {table.nbytes} bytes (max_bytes={self.max_bytes}).")
+            return
+        file = self._file(key)
+        tmp = self._tmp(file)
+        try:
+            with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            self._commit(tmp, file)
+        finally:
+            tmp.unlink(missing_ok=True)
+        log.info(f"Cached query result {key[:12]} ({table.num_rows} rows).")
+
+    def put_batches(self, key: str, batches: Iterator[pa.RecordBatch]) -> Iterator[pa.RecordBatch]:
+        """
+        Yield batches unchanged while writing them to the cache, so a streamed result is
+        cached without holding it in memory. The entry is stored only once every batch
+        has been yielded; a stream closed early or failing, or outgrowing max_bytes,
+        leaves the cache unchanged. Empty results are not cached.
+        """
+        file = self._file(key)
+        tmp = self._tmp(file)
+        sink, writer, nbytes, rows = None, None, 0, 0
+        try:
+            for batch in batches:
+                if writer is None and sink is None:
+                    sink = pa.OSFile(str(tmp), "wb")
+                    writer = pa.ipc.new_file(sink, batch.schema)
+                nbytes += batch.nbytes
+                rows += batch.num_rows
+                if writer is not None and self.max_bytes is not None and nbytes > self.max_bytes:
+                    log.info(f"Not caching streamed query result over max_bytes={self.max_bytes}.")
+                    writer.close()
+                    writer = None
+                if writer is not None:
+                    writer.write_batch(batch)
+                yield batch
+            if writer is not None:
+                writer.close()
+                writer = None
+                sink.close()
+                self._commit(tmp, file)
+                log.info(f"Cached query result {key[:12]} ({rows} rows).")
+        finally:
+            if writer is not None:
+                writer.close()
+            if sink is not None:
+                sink.close()
+            tmp.unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        """
+        Delete least recently read entries until the cache fits max_bytes. Caller holds
+        the file lock.
+        """
+        if self.max_bytes is None:
+            return
+        entries = []
+        for file in self.path.glob(f"*{self.SUFFIX}"):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file))
+        total = sum(size for _, size, _ in entries)
+        for _, size, file in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            file.unlink(missing_ok=True)
+            total -= size
+            log.info(f"Evicted cached query result {file.stem[:12]}.")
+
+    def clear(self) -> None:
+        """
+        Drop all entries.
+        """
+        for file in self.path.glob(f"*{self.SUFFIX}"):
+            file.unlink(missing_ok=True)
@@ -0,0 +1,279 @@
+"""
+Incremental dataset refresh. A background thread pulls the rows changed since the
+dataset's report_date, runs the pipeline on that delta only, embeds only texts not seen
+before, rebuilds the engine state next to the live one and swaps it in atomically.
+Requests keep being served from the old state until the swap.
+
+Every worker on a node runs a refresher, but only the one holding the lock on the saved
+dataset queries BigQuery and patches the file; the others reload the file it writes.
+Each process builds its own new engine state, so after the first refresh the workers
+no longer share the state preloaded before the fork (see gunicorn.conf.py).
+"""
+import fcntl
+import logging
+import os
+import threading
+from typing import IO, TYPE_CHECKING
+import numpy as np
+import pandas as pd
+from config.settings import (
+    DELTA_QUERY_FILE,
+    EMBEDDING_COLUMNS,
+    MARKET_COLUMN,
+    NOISE_WORDS,
+    PROD_DB_SAVE_PATH,
+    QUERY_FILE,
+    RAW_DB_SAVE_PATH,
+    TEXT_COLUMNS,
+)
+from core.dataset import Dataset
+from core.pipeline import build_pipeline
+from core.transformers import TransformerBase
+from core.transforms import normalise, remove_stopwords
+from services.bq_helper import BQHelper
+
+if TYPE_CHECKING:
+    from bootstrap.bootstrap import EngineHolder
+
+log = logging.getLogger(__name__)
+
+KEY_COLUMNS = ["model_id", MARKET_COLUMN]
+COUNT_COLUMN = "count_of_buy_products"
+# Columns of the delta query that are not part of the dataset
+DELTA_COLUMNS = ["change_type", "previous_max_count", "current_max_count"]
+
+
+def apply_delta(
+    processed: pd.DataFrame, delta: pd.DataFrame, model: TransformerBase
+) -> pd.DataFrame:
+    """
+    Apply a delta from DELTA_QUERY_FILE to a processed dataset (with embedding columns).
+
+    Changed and deleted (model_id, market) rows are dropped, changed and new rows are run
+    through the pipeline and appended. Unchanged rows whose text columns (brand and
+    categories, edited in SMV) differ from the served ones count as changed. Kept counts
+    are rescaled when the largest count moved, so every row stays log_normalised against
+    the same maximum. Embeddings of
+    texts already in the processed dataset are reused. A dataset already at the delta's
+    report_date is returned unchanged, so applying a delta twice equals applying it once.
+    Args:
+        processed (pd.DataFrame): The dataset currently served.
+        delta (pd.DataFrame): Rows returned by DELTA_QUERY_FILE.
+        model (TransformerBase): Encoder for texts not embedded yet.
+    Returns:
+        pd.DataFrame: The refreshed processed dataset.
+    """
+    previous_max = delta["previous_max_count"].iloc[0]
+    current_max = float(delta["current_max_count"].iloc[0])
+    report_date = delta["report_date"].iloc[0]
+    if (
+        "report_date" in processed.columns
+        and pd.to_datetime(processed["report_date"]).max() >= pd.to_datetime(report_date)
+    ):
+        log.info(f"Dataset already at report_date {report_date}; delta not applied.")
+        return processed
+    keys = pd.MultiIndex.from_frame(delta[KEY_COLUMNS])
+    changed = (delta["change_type"] != "unchanged").to_numpy(copy=True)
+    changed[~changed] = _edited(processed, delta[~changed])
+    if pd.isna(previous_max):
+        # The served snapshot is gone from history: the delta holds every current row
+        log.warning("Previous snapshot not found; replacing the whole dataset.")
+        kept = processed.iloc[0:0]
+    else:
+        changed_keys = keys[changed]
+        kept = processed[~pd.MultiIndex.from_frame(processed[KEY_COLUMNS]).isin(changed_keys)]
+        if float(previous_max) != current_max:
+            kept = kept.assign(
+                **{
+                    COUNT_COLUMN: (
+                        kept[COUNT_COLUMN] * np.log1p(float(previous_max)) / np.log1p(current_max)
+                    ).round(3)
+                }
+            )
+        # Unchanged rows are part of the new snapshot too; this advances the watermark
+        kept = kept.assign(report_date=report_date)
+
+    upserts = delta[changed & (delta["change_type"] != "delete").to_numpy()]
+    upserts = upserts.drop(columns=DELTA_COLUMNS)
+    pipeline = build_pipeline(model=model, count_scale=np.log1p(current_max), embed=False)
+    upserts = pipeline.run(upserts.reset_index(drop=True))
+    upserts = model.embed_columns(upserts, columns=EMBEDDING_COLUMNS, known=processed)
+    log.info(
+        f"Delta applied: kept {len(kept)} of {len(processed)} rows, "
+        f"upserted {len(upserts)}, deleted {(delta['change_type'] == 'delete').sum()}."
+    )
+    return pd.concat([kept, upserts[processed.columns]], ignore_index=True)
+
+
+def _edited(processed: pd.DataFrame, rows: pd.DataFrame) -> np.ndarray:
+    """
+    Mask of the rows (raw, from the delta) whose text columns, cleaned as the pipeline
+    cleans them, differ from the served row with the same key. Rows not served are
+    never edited.
+    """
+    if rows.empty:
+        return np.zeros(0, dtype=bool)
+    cleaned = remove_stopwords(
+        rows[KEY_COLUMNS + TEXT_COLUMNS].copy(), columns=TEXT_COLUMNS, stopwords=NOISE_WORDS
+    )
+    cleaned = normalise(cleaned, columns=TEXT_COLUMNS)
+    served = cleaned[KEY_COLUMNS].merge(
+        processed[KEY_COLUMNS + TEXT_COLUMNS].drop_duplicates(KEY_COLUMNS),
+        on=KEY_COLUMNS,
+        how="left",
+        indicator=True,
+    )
+    edited = np.zeros(len(rows), dtype=bool)
+    for col in TEXT_COLUMNS:
+        edited |= cleaned[col].to_numpy() != served[col].to_numpy()
+    return edited & (served["_merge"] == "both").to_numpy()
+
+
+def _report_date(df: pd.DataFrame) -> pd.Timestamp | None:
+    if "report_date" not in df.columns or df.empty:
+        return None
+    return pd.to_datetime(df["report_date"]).max()
+
+
+class DatasetRefresher:
+    """
+    Periodically refreshes the dataset served through an EngineHolder.
+
+    One refresher per node, the one holding an exclusive lock on `<save_path>.lock`,
+    fetches the rows changed since the report_date of the dataset at save_path, patches
+    that file and swaps in a new engine state built from it (matchers and FAISS indexes
+    are rebuilt from the reused vectors while the old state keeps serving). Refreshers in
+    the other processes only reload the file once its report_date is past the one they
+    serve. If the lock holder exits, the next refresher to try takes the lock over.
+    """
+
+    def __init__(
+        self,
+        holder: "EngineHolder",
+        bq_helper: BQHelper,
+        model: TransformerBase,
+        interval: float,
+        query_file: str = DELTA_QUERY_FILE,
+        save_path: str = PROD_DB_SAVE_PATH,
+    ):
+        """
+        Args:
+            holder (EngineHolder): Holder of the live engine state.
+            bq_helper (BQHelper): BigQuery helper used to fetch the delta.
+            model (TransformerBase): Encoder for new texts.
+            interval (float): Seconds between refreshes.
+            query_file (str): SQL file returning the delta since `since_report_date`.
+            save_path (str): Parquet file holding the processed dataset.
+        """
+        self.holder = holder
+        self.bq_helper = bq_helper
+        self.model = model
+        self.interval = interval
+        self.query_file = query_file
+        self.save_path = save_path
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock_file: IO | None = None
+
+    def start(self) -> None:
+        """
+        Start refreshing in a daemon thread. Does nothing if already running.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="dataset-refresh", daemon=True)
+        self._thread.start()
+        log.info(f"Dataset refresher started (every {self.interval}s).")
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Stop the refresh thread, waiting up to timeout seconds for a running refresh.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("Dataset refresh failed; still serving the previous version.")
+
+    def _acquire(self) -> bool:
+        """
+        Take the node's refresh lock without waiting, keeping it until stop().
+        Returns:
+            bool: True if this refresher holds the lock.
+        """
+        if self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.save_path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        log.info(f"Process {os.getpid()} now refreshes the dataset for this node.")
+        return True
+
+    def refresh(self) -> bool:
+        """
+        In the process holding the refresh lock, fetch and apply the delta since the
+        saved dataset's report_date and write it back. In every process, swap in the
+        saved dataset if it is newer than the served one.
+        Returns:
+            bool: True if a new state was swapped in.
+        """
+        if not self._acquire():
+            return self._swap_if_newer(
+                pd.read_parquet(self.save_path, columns=["report_date"]), reload=True
+            )
+        # The served DataFrame has been compacted, so patch the embeddings on disk
+        processed = pd.read_parquet(self.save_path)
+        since = _report_date(processed)
+        if since is None:
+            log.warning(
+                "Saved dataset has no report_date column; rebuild it to enable refreshes."
+            )
+            return False
+        since = since.date()
+        delta = self.bq_helper.get(self.query_file, since_report_date=since.isoformat())
+        refreshed = processed
+        if delta is not None and not delta.empty:
+            refreshed = apply_delta(processed, delta, self.model)
+        if refreshed is processed:
+            log.info(f"No changes since report_date {since}.")
+            # A previous lock holder may have patched the file after this process loaded it
+            return self._swap_if_newer(processed)
+
+        processed = refreshed
+        tmp_path = f"{self.save_path}.{os.getpid()}.tmp"
+        processed.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.save_path)
+        return self._swap_if_newer(processed)
+
+    def _swap_if_newer(self, df: pd.DataFrame, reload: bool = False) -> bool:
+        """
+        Build and swap in an engine state from df (or, with reload, from the file at
+        save_path) if its report_date is past the served one.
+        """
+        saved = _report_date(df)
+        served = _report_date(self.holder.current.dataset.df)
+        if saved is None or (served is not None and saved <= served):
+            return False
+        if reload:
+            log.info(f"Reloading dataset at report_date {saved.date()} from {self.save_path}.")
+            df = pd.read_parquet(self.save_path)
+        # Imported here: importing bootstrap builds the default engine
+        from bootstrap.bootstrap import build_engine_state
+
+        dataset = Dataset(QUERY_FILE, self.bq_helper, RAW_DB_SAVE_PATH, market=None)
+        dataset._df = df
+        self.holder.swap(build_engine_state(dataset, self.model))
+        return True
@@ -2,73 +2,213 @@
 Business logic for search and suggestion endpoints.
 """
 import logging
-import functools
-import hashlib
-from bootstrap.bootstrap import search_engine, matcher_weights, dataset
+import os
+import pandas as pd
+from bootstrap.bootstrap import bq_helper, encoder, engine
+from config.settings import (
+    BATCH_SEARCH_MAX_QUERIES,
+    DISPLAY_COLUMNS,
+    MARKET,
+    Market,
+    RESULT_CACHE_BACKEND,
+    RESULT_CACHE_PATH,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_BYTES,
+    REFRESH_INTERVAL,
+    SEARCH_MAX_TOP_K,
+)
+from core.completion import normalise_prefix
+from core.engine import SearchCancelled
+from services.cache import cached, canonicalise_query, create_cache
+from services.refresh import DatasetRefresher
 
 log = logging.getLogger(__name__)
 
-def _make_cache_key(*args, **kwargs):
-    """Create a cache key from args/kwargs, robust to unhashable types."""
-    key = str(args) + str(sorted(kwargs.items()))
-    return hashlib.sha256(key.encode()).hexdigest()
-
-def cached_search(maxsize=128):
-    """Decorator for caching search results with custom key."""
-    def decorator(func):
-        cache = {}
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            key = _make_cache_key(*args, **kwargs)
-            if key in cache:
-                log.debug(f"Cache hit for {func.__name__} with key: {key}")
-                return cache[key]
-            log.debug(f"Cache miss for {func.__name__} with key: {key}")
-            result = func(*args, **kwargs)
-            if len(cache) >= maxsize:
-                cache.pop(next(iter(cache)))  # Remove oldest
-            cache[key] = result
-            return result
-        return wrapper
-    return decorator
-
-def get_popular_results(top_k: int = 10):
-    """Return top_k most popular products as a list of dicts."""
-    pop_df = dataset.df.sort_values("count_of_buy_products", ascending=False)
+# Searches and suggestions share one backend; the function name in each key keeps them apart
+result_cache = create_cache(
+    RESULT_CACHE_BACKEND,
+    maxsize=RESULT_CACHE_SIZE,
+    ttl=RESULT_CACHE_TTL,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    path=RESULT_CACHE_PATH,
+)
+# Entries left by an earlier dataset (e.g. in a shared store) can never hit again
+result_cache.invalidate(engine.current.dataset.version)
+# and so can entries of a dataset version a refresh replaced
+engine.subscribe(lambda state: result_cache.invalidate(state.dataset.version))
+
+_refresher: DatasetRefresher | None = None
+_refresher_pid: int | None = None
+
+
+class UnknownMarket(ValueError):
+    """Raised when a request names a market the engine does not serve."""
+
+
+class InvalidRequest(ValueError):
+    """Raised for a malformed search request body; status is the HTTP status to answer."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _check_top_k(top_k) -> None:
+    if isinstance(top_k, bool) or not 1 <= top_k <= SEARCH_MAX_TOP_K:
+        raise InvalidRequest(f"top_k must be between 1 and {SEARCH_MAX_TOP_K}.")
+
+
+def parse_search(data) -> tuple[str, int]:
+    """
+    Query and top_k of a JSON search request body.
+    Raises:
+        InvalidRequest: If the body is not {'query': str, 'top_k': int} (top_k optional).
+    """
+    data = data if isinstance(data, dict) else {}
+    query, top_k = data.get("query"), data.get("top_k", 10)
+    if not isinstance(query, str) or not isinstance(top_k, int):
+        raise InvalidRequest("Expected {'query': str, 'top_k': int}.")
+    _check_top_k(top_k)
+    return query, top_k
+
+
+def parse_search_batch(data) -> tuple[list[str], int]:
+    """
+    Queries and top_k of a JSON batch search request body.
+    Raises:
+        InvalidRequest: If the body is not {'queries': [str, ...], 'top_k': int} (top_k
+            optional), or holds more than BATCH_SEARCH_MAX_QUERIES queries (status 413).
+    """
+    data = data if isinstance(data, dict) else {}
+    queries, top_k = data.get("queries"), data.get("top_k", 10)
+    if (
+        not isinstance(queries, list)
+        or not all(isinstance(q, str) for q in queries)
+        or not isinstance(top_k, int)
+    ):
+        raise InvalidRequest("Expected {'queries': [str, ...], 'top_k': int}.")
+    _check_top_k(top_k)
+    if len(queries) > BATCH_SEARCH_MAX_QUERIES:
+        raise InvalidRequest(f"At most {BATCH_SEARCH_MAX_QUERIES} queries per request.", 413)
+    return queries, top_k
+
+
+def resolve_market(market: str | Market | None) -> Market:
+    """
+    Market a request is routed to: the given Market or market code (e.g. "US"), or
+    MARKET if none is given.
+    Raises:
+        UnknownMarket: If the market is not served.
+    """
+    if market is None or market == "":
+        return MARKET
+    try:
+        market = Market(market)
+    except ValueError:
+        market = None
+    search_engines = engine.current.search_engines
+    if market not in search_engines:
+        raise UnknownMarket(
+            f"Unknown market. Expected one of {[m.value for m in search_engines]}."
+        )
+    return market
+
+
+def _dataset_version() -> str:
+    return engine.current.dataset.version
+
+
+def start_refresher() -> None:
+    """
+    Start the background dataset refresher of this process if REFRESH_INTERVAL is set.
+    Safe to call on every request: it starts once per process, so each pre-forked worker
+    runs its own refresher thread (threads do not survive a fork). Only the worker holding
+    the refresh lock queries BigQuery; the others reload the dataset file it writes.
+    """
+    global _refresher, _refresher_pid
+    if REFRESH_INTERVAL is None or _refresher_pid == os.getpid():
+        return
+    _refresher_pid = os.getpid()
+    _refresher = DatasetRefresher(engine, bq_helper, encoder, interval=REFRESH_INTERVAL)
+    _refresher.start()
+
+
+def _search_key(query: str, top_k: int = 10, market: str | Market | None = None):
+    """Cache key parameters for searches: canonical query, top_k and market."""
+    return (canonicalise_query(query), top_k, resolve_market(market).value)
+
+
+def _suggestion_key(partial: str, top_k: int = 10, market: str | Market | None = None):
+    """Cache key parameters for suggestions: normalised prefix, top_k and market."""
+    return (normalise_prefix(partial), top_k, resolve_market(market).value)
+
+
+def cache_stats() -> dict:
+    """Hit/miss/eviction counters of the result cache."""
+    return {"backend": RESULT_CACHE_BACKEND, **result_cache.info()._asdict()}
+
+def get_popular_results(top_k: int = 10, market: str | Market | None = None):
+    """Return top_k most popular products of the market as a list of dicts."""
+    market_df = engine.current.search_engines[resolve_market(market)].dataset.df
+    pop_df = market_df.sort_values("count_of_buy_products", ascending=False)
     return pop_df.head(top_k).to_dict(orient="records")
 
 
-@cached_search(maxsize=256)
-def perform_search(query: str, top_k: int = 10):
-    """Perform a multi-matcher search and return results as a list of dicts. Cached."""
-    results = search_engine.search_multi(query, matcher_weights=matcher_weights, top_k=top_k)
-    # Drop columns not needed for display
-    results.drop(
-        columns=[
-            "model_name_embedding",
-            "blob_embedding",
-            "blob",
-            "model_id",
-            "performance_group",
-            "market",
-            "count_of_buy_products",
-        ],
-        inplace=True,
-        errors="ignore",
+@cached(result_cache, key_func=_search_key, version_func=_dataset_version)
+def perform_search(query: str, top_k: int = 10, market: str | Market | None = None):
+    """
+    Perform a multi-matcher search in the market and return results as a list of dicts.
+    Cached. The query is canonicalised first, so equivalent queries share one cache entry.
+    """
+    state = engine.current
+    return state.search_engines[resolve_market(market)].search_records(
+        canonicalise_query(query), matcher_weights=state.matcher_weights, top_k=top_k, columns=DISPLAY_COLUMNS
+    )
+
+
+def perform_search_many(
+    queries: list[str], top_k: int = 10, market: str | Market | None = None
+):
+    """
+    Search many queries in the market in one engine call. Returns one list of result
+    dicts per query, in the same order as the queries. Queries are canonicalised as in
+    perform_search, so both return the same results for the same query.
+    """
+    state = engine.current
+    return state.search_engines[resolve_market(market)].search_many_records(
+        [canonicalise_query(query) for query in queries], matcher_weights=state.matcher_weights, top_k=top_k, columns=DISPLAY_COLUMNS
     )
-    return results.to_dict(orient="records")
 
 
-@cached_search(maxsize=256)
-def get_suggestions(partial: str, top_k: int = 10):
-    """Return a list of suggestions for the given partial query. Cached."""
+@cached(result_cache, key_func=_suggestion_key, version_func=_dataset_version)
+def get_suggestions(partial: str, top_k: int = 10, market: str | Market | None = None):
+    """
+    Return a list of suggestions in the market for the given partial query. Cached.
+    Prefix completions come from the market's completion index; the full search engine
+    is only used when nothing starts with the partial query.
+    """
+    state = engine.current
+    market = resolve_market(market)
+    search_engine = state.search_engines[market]
+    # As in the cache key, so every partial sharing an entry gets the same suggestions
+    prefix = normalise_prefix(partial)
     try:
-        if not partial:
-            pop_df = dataset.df.sort_values("count_of_buy_products", ascending=False)
+        if not prefix:
+            pop_df = search_engine.dataset.df.sort_values(
+                "count_of_buy_products", ascending=False
+            )
             suggestions = pop_df["model_name"].dropna().astype(str).head(top_k).tolist()
         else:
-            results = search_engine.search_multi(partial, matcher_weights=matcher_weights, top_k=top_k)
-            suggestions = results["model_name"].dropna().astype(str).tolist()
+            suggestions = state.completion_indexes[market].complete(prefix, top_k=top_k)
+            if not suggestions:
+                log.debug(f"No prefix completions for '{prefix}', using search engine.")
+                results = search_engine.search_records(
+                    prefix, matcher_weights=state.matcher_weights, top_k=top_k, columns=["model_name"]
+                )
+                suggestions = [str(r["model_name"]) for r in results if pd.notna(r["model_name"])]
+    except SearchCancelled:
+        raise
     except Exception as e:
         log.error(f"Error in get_suggestions: {e}")
         suggestions = []
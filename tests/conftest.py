@@ -0,0 +1,117 @@
+import importlib
+import sys
+import types
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+# Modules import from src/ as the app does (e.g. `from core.engine import SearchEngine`)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from core.transformers import TransformerBase  # noqa: E402
+
+BRANDS = ["Canon", "Sony", "Nikon", "Fujifilm", "Panasonic", "Leica", "Sigma", "Tamron"]
+MODELS = ["EOS R5", "A7 III", "Z6 II", "X-T4", "GH5", "M10", "50mm f/1.4 Art", "28-75mm f/2.8"]
+
+
+class HashEncoder(TransformerBase):
+    """
+    Deterministic stand-in encoder: each text maps to a fixed random unit vector.
+    """
+
+    dim = 16
+
+    def encode(self, texts, **kwargs):
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(text.encode()[:8].ljust(8, b"\0"), "little") ^ len(text)
+            vector = np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return np.stack(vectors) if vectors else np.zeros((0, self.dim), dtype=np.float32)
+
+
+@pytest.fixture
+def encoder() -> HashEncoder:
+    return HashEncoder(cache_size=0)
+
+
+@pytest.fixture
+def catalog() -> pd.DataFrame:
+    """
+    Small multi-market catalog in the shape of the processed dataset, without embeddings.
+    """
+    rng = np.random.default_rng(0)
+    rows = []
+    for model_id in range(300):
+        brand = BRANDS[model_id % len(BRANDS)]
+        model_name = f"{brand} {MODELS[rng.integers(len(MODELS))]} {model_id}"
+        for market in rng.choice(["UK", "US", "EU"], size=rng.integers(1, 4), replace=False):
+            rows.append(
+                {
+                    "model_id": model_id,
+                    "model_name": model_name.lower(),
+                    "market": market,
+                    "performance_group": "Top 100",
+                    "count_of_buy_products": int(rng.integers(0, 500)),
+                    "primary_category": "cameras",
+                    "secondary_category": "mirrorless",
+                    "product_type": "body",
+                    "product_system": "x",
+                    "brand": brand.lower(),
+                    "report_date": pd.Timestamp("2026-01-01"),
+                }
+            )
+    df = pd.DataFrame(rows)
+    df["blob"] = df["brand"] + " " + df["model_name"] + " " + df["primary_category"]
+    return df
+
+
+@pytest.fixture
+def search_service(catalog, encoder, monkeypatch):
+    """
+    services.search_service serving the catalog. bootstrap.bootstrap, which would load the
+    dataset from BigQuery on import, is replaced by a module holding engines built here.
+    """
+    from config.settings import MARKETS
+    from core.completion import PrefixIndex
+    from core.dataset import Dataset
+    from core.engine import SearchEngine
+    from core.matchers import ExactMatcher, FuzzyMatcher, PopularMatcher, SemanticMatcher
+
+    dataset = Dataset("query", None, None, market=None)
+    dataset._df = encoder.embed_columns(catalog, columns=["model_name"])
+    search_engines, completion_indexes = {}, {}
+    for market in MARKETS:
+        view = dataset.market_view(market)
+        matchers = {
+            "fuzzy_model": FuzzyMatcher(column="model_name", df=view.df),
+            "semantic_model": SemanticMatcher(
+                embedding_column="model_name_embedding",
+                encoder=encoder,
+                df=view.df,
+                key_column="model_name",
+            ),
+            "exact_model": ExactMatcher(column="model_name", df=view.df),
+            "popular": PopularMatcher("count_of_buy_products", view.df),
+        }
+        search_engines[market] = SearchEngine(view, matchers)
+        completion_indexes[market] = PrefixIndex.from_df(view.df)
+    state = types.SimpleNamespace(
+        search_engines=search_engines,
+        matcher_weights={"fuzzy_model": 0.5, "semantic_model": 0.4, "exact_model": 0.1, "popular": 0.1},
+        dataset=dataset,
+        completion_indexes=completion_indexes,
+    )
+    bootstrap = types.ModuleType("bootstrap.bootstrap")
+    bootstrap.bq_helper = None
+    bootstrap.encoder = encoder
+    bootstrap.engine = types.SimpleNamespace(current=state, subscribe=lambda listener: None)
+    monkeypatch.setitem(sys.modules, "bootstrap.bootstrap", bootstrap)
+    # Imported afresh against this engine, and dropped again after the test
+    modules = ["services.search_service", "asgi", "app"]
+    for module in modules:
+        sys.modules.pop(module, None)
+    yield importlib.import_module("services.search_service")
+    for module in modules:
+        sys.modules.pop(module, None)
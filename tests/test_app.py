@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.fixture
+def client(search_service):
+    import app
+
+    return app.app.test_client()
+
+
+def test_search_batch_matches_single_searches(client, search_service):
+    queries = ["Canon  EOS", "sony a7", "zzz"]
+    response = client.post("/search/batch", json={"queries": queries, "top_k": 4, "market": "US"})
+    assert response.status_code == 200
+    expected = [search_service.perform_search(query, top_k=4, market="US") for query in queries]
+    assert response.get_json()["results"] == expected
+
+
+@pytest.mark.parametrize(
+    "body, status",
+    [
+        ({"queries": ["sony"], "top_k": 0}, 400),
+        ({"queries": ["sony"], "top_k": False}, 400),
+        ({"queries": [1]}, 400),
+        ({"queries": ["sony"] * 1001}, 413),
+        ({"queries": ["sony"], "market": "XX"}, 400),
+    ],
+)
+def test_search_batch_rejects_invalid_requests(client, body, status):
+    response = client.post("/search/batch", json=body)
+    assert response.status_code == status
+    assert "error" in response.get_json()
@@ -0,0 +1,96 @@
+import pytest
+from starlette.testclient import TestClient
+
+ORIGIN = {"Origin": "https://example.com"}
+
+
+@pytest.fixture
+def asgi(search_service):
+    import asgi
+
+    return asgi
+
+
+@pytest.fixture
+def client(asgi):
+    with TestClient(asgi.app, raise_server_exceptions=False) as client:
+        yield client
+
+
+def test_search_routes_answer_in_json(client):
+    response = client.post("/search", json={"query": "canon eos", "top_k": 3}, headers=ORIGIN)
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "*"
+    assert len(response.json()["results"]) == 3
+    response = client.post("/search/batch", json={"queries": ["sony", "nikon"], "market": "US"})
+    assert [len(results) for results in response.json()["results"]] == [10, 10]
+    response = client.post("/suggest", json={"partial": "can"})
+    assert all(s.startswith("can") for s in response.json()["suggestions"])
+
+
+def test_cors_preflight(client):
+    headers = {
+        **ORIGIN,
+        "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "content-type",
+    }
+    response = client.options("/search", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "*"
+    assert "content-type" in response.headers["access-control-allow-headers"].lower()
+
+
+@pytest.mark.parametrize(
+    "path, body, status",
+    [
+        ("/search", {"query": "canon", "top_k": 0}, 400),
+        ("/search", {"query": "canon", "top_k": 101}, 400),
+        ("/search", {"query": "canon", "top_k": True}, 400),
+        ("/search", {"top_k": 5}, 400),
+        ("/search", None, 400),
+        ("/search/batch", {"queries": "canon"}, 400),
+        ("/search/batch", {"queries": ["canon"] * 1001}, 413),
+        ("/search", {"query": "canon", "market": "XX"}, 400),
+    ],
+)
+def test_invalid_requests_are_rejected(client, path, body, status):
+    response = client.post(path, json=body)
+    assert response.status_code == status
+    assert "error" in response.json()
+
+
+def test_pages_render(client):
+    response = client.get("/")
+    assert response.status_code == 200 and "<html" in response.text
+    response = client.post("/", data={"query": "sony a7", "market": "US"})
+    assert response.status_code == 200 and "sony" in response.text
+    response = client.get("/", params={"market": "XX"})
+    assert response.status_code == 400 and "Unknown market" in response.text
+    assert client.get("/static/css/style.css").status_code == 200
+
+
+def test_errors_are_json_on_json_routes(client, search_service, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(search_service, "perform_search_many", fail)
+    monkeypatch.setattr(search_service, "perform_search", fail)
+    response = client.post("/search/batch", json={"queries": ["sony"]})
+    assert response.status_code == 500
+    assert response.json() == {"error": "Internal server error."}
+    # The page falls back to the popular products
+    response = client.post("/", data={"query": "sony"})
+    assert response.status_code == 200
+    assert "An error occurred during search." in response.text
+
+
+def test_full_executor_sheds_load(client, asgi):
+    asgi.executor.max_pending = 0
+    response = client.post("/search", json={"query": "sony"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert client.get("/").status_code == 503
+    # An error page is still shown, without the popular products
+    response = client.post("/", data={"query": ""})
+    assert response.status_code == 200
+    assert "Please enter a search query." in response.text
@@ -0,0 +1,271 @@
+import threading
+import time
+import types
+from datetime import datetime, timedelta, timezone
+import pyarrow as pa
+import pytest
+from google.cloud import bigquery
+from services.bq_helper import BQHelper, table_path
+from services.query_cache import QueryCache
+
+SOURCE = bigquery.TableReference.from_string("project.daw.source")
+TABLE = pa.table({"model_id": range(100), "brand": [f"brand {i % 7}" for i in range(100)]})
+
+
+class FakeJob:
+    """Finished query job writing its result to a destination table."""
+
+    def __init__(self, client, sql, destination):
+        self.client = client
+        self.sql = sql
+        self.destination = destination
+        self.referenced_tables = [SOURCE]
+        self.timeline = []
+        self.total_bytes_processed = 10
+        self.total_bytes_billed = 10
+        self.location, self.project, self.job_id = "US", "project", "job"
+
+    def result(self, timeout=None, page_size=None):
+        self.client.run(self.sql)
+        table = self.client.tables[table_path(self.destination)]
+        return types.SimpleNamespace(
+            total_rows=table.num_rows,
+            schema=[],
+            to_arrow=lambda: table,
+            to_arrow_iterable=lambda: iter(table.to_batches(max_chunksize=10)),
+        )
+
+    def cancel(self):
+        pass
+
+
+class FakeClient:
+    """bigquery.Client stand-in: each query writes `result` to a new destination table."""
+
+    def __init__(self, result: pa.Table = TABLE):
+        self.result = result
+        self.tables = {}
+        self.jobs = []
+        self.modified = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def query(self, sql, job_config=None):
+        name = f"project.tmp.result{len(self.tables)}"
+        destination = bigquery.TableReference.from_string(name)
+        job = FakeJob(self, sql, destination)
+        if job_config is None or not job_config.dry_run:
+            self.tables[table_path(destination)] = self.result
+            self.jobs.append(job)
+        return job
+
+    def run(self, sql):
+        """Runs while a job is waited for."""
+
+    def get_table(self, ref):
+        return types.SimpleNamespace(modified=self.modified, streaming_buffer=None)
+
+
+class ScriptClient(FakeClient):
+    """Records when each script's job runs; scripts in `fail` raise."""
+
+    def __init__(self, fail=()):
+        super().__init__()
+        self.fail = set(fail)
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def run(self, sql):
+        script = sql.split()[-1]
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.events.append(("start", script))
+        time.sleep(0.05)
+        with self._lock:
+            self.running -= 1
+            self.events.append(("end", script))
+        if script in self.fail:
+            raise RuntimeError(f"400 {script} failed: bad query")
+
+
+class FakeReadClient:
+    """BigQueryReadClient stand-in splitting each table into `streams` Arrow streams."""
+
+    def __init__(self, client: FakeClient, streams: int = 4):
+        self.client = client
+        self.streams = streams
+        self.sessions = []
+        self.read = []
+
+    def create_read_session(self, parent, read_session, max_stream_count):
+        table = self.client.tables[read_session.table]
+        count = min(self.streams, max_stream_count)
+        step = -(-table.num_rows // count)
+        self.sessions.append(max_stream_count)
+        return types.SimpleNamespace(
+            arrow_schema=types.SimpleNamespace(serialized_schema=table.schema.serialize()),
+            streams=[
+                types.SimpleNamespace(name=(read_session.table, start, step))
+                for start in range(0, table.num_rows, step)
+            ],
+        )
+
+    def read_rows(self, name):
+        self.read.append(name)
+        path, start, step = name
+        for batch in self.client.tables[path].slice(start, step).to_batches(max_chunksize=5):
+            record_batch = types.SimpleNamespace(serialized_record_batch=batch.serialize())
+            yield types.SimpleNamespace(arrow_record_batch=record_batch)
+
+
+def _helper(tmp_path, client=None, read_client=None, **kwargs) -> BQHelper:
+    return BQHelper(
+        billing_project_id="project",
+        write_project_id="project",
+        read_project_id="project",
+        write_dataset="tmp",
+        read_dataset="tmp",
+        daw_dataset="daw",
+        sql_folder=tmp_path,
+        client=client,
+        bqstorage_client=read_client,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+def test_storage_read_fans_out_over_streams(tmp_path, client):
+    read_client = FakeReadClient(client, streams=4)
+    helper = _helper(tmp_path, client, read_client, max_read_streams=3)
+    result = helper.get_string("select * from `project.daw.source`")
+    assert read_client.sessions == [3]
+    assert len(read_client.read) == 3
+    assert sorted(result["model_id"]) == list(range(100))
+
+
+def test_storage_read_keeps_order_of_ordered_queries(tmp_path, client):
+    read_client = FakeReadClient(client, streams=4)
+    helper = _helper(tmp_path, client, read_client)
+    result = helper.get_string("select * from `project.daw.source` order by model_id")
+    assert read_client.sessions == [1]
+    assert result["model_id"].tolist() == list(range(100))
+
+
+@pytest.mark.parametrize("use_storage_api", [True, False], ids=["storage", "rest"])
+def test_outputs_convert_the_arrow_result(tmp_path, client, use_storage_api):
+    (tmp_path / "models.sql").write_text("select * from `{read_project}.{daw_dataset}.source`")
+    helper = _helper(tmp_path, client, FakeReadClient(client), use_storage_api=use_storage_api)
+
+    def rows(table: pa.Table) -> list[dict]:
+        return sorted(table.to_pylist(), key=lambda row: row["model_id"])
+
+    arrow = helper.get("models", output="arrow")
+    assert isinstance(arrow, pa.Table) and rows(arrow) == rows(TABLE)
+    df = helper.get("models", output="pandas")
+    assert df.sort_values("model_id", ignore_index=True).equals(TABLE.to_pandas())
+    batches = list(helper.get("models", output="batches"))
+    assert all(isinstance(batch, pa.RecordBatch) for batch in batches)
+    assert rows(pa.Table.from_batches(batches)) == rows(TABLE)
+    streamed = pa.Table.from_batches(list(helper.iter_batches("models")))
+    assert rows(streamed) == rows(TABLE)
+
+
+def test_query_cache_hit_miss_and_expiry(tmp_path, client):
+    cache = QueryCache(tmp_path / "cache")
+    helper = _helper(tmp_path, client, FakeReadClient(client), query_cache=cache)
+    sql = "select * from `project.daw.source`"
+    first = helper.get_string(sql)
+    assert len(client.jobs) == 1
+    # Same SQL, source unchanged: served from the cache without a job
+    assert helper.get_string(sql).equals(first)
+    assert len(client.jobs) == 1
+    # The source table changed: the entry no longer applies
+    client.modified += timedelta(days=1)
+    helper.get_string(sql)
+    assert len(client.jobs) == 2
+    helper.get_string(sql)
+    assert len(client.jobs) == 2
+    # Results that change between runs are never cached
+    for _ in range(2):
+        helper.get_string(sql + " where report_date = current_date()")
+    assert len(client.jobs) == 4
+
+
+def test_query_cache_evicts_least_recently_read(tmp_path, client):
+    cache = QueryCache(tmp_path / "cache")
+    helper = _helper(tmp_path, client, FakeReadClient(client), query_cache=cache)
+    queries = [f"select * from `project.daw.source` limit {n}" for n in range(3)]
+    helper.get_string(queries[0])
+    # Room for two entries
+    (entry,) = cache.path.glob(f"*{cache.SUFFIX}")
+    cache.max_bytes = int(2.5 * entry.stat().st_size)
+    helper.get_string(queries[1])
+    helper.get_string(queries[0])
+    helper.get_string(queries[2])
+    assert len(client.jobs) == 3
+    # queries[1] was read least recently, so it made room for queries[2]
+    helper.get_string(queries[0])
+    assert len(client.jobs) == 3
+    helper.get_string(queries[1])
+    assert len(client.jobs) == 4
+
+
+@pytest.fixture
+def scripts(tmp_path):
+    names = ["a", "b", "c", "d", "e"]
+    for name in names:
+        (tmp_path / f"{name}.sql").write_text(f"select * from {name}")
+    return names
+
+
+def _order(events, kind):
+    return [script for event, script in events if event == kind]
+
+
+def test_iter_many_waits_for_dependencies(tmp_path, scripts):
+    client = ScriptClient()
+    helper = _helper(tmp_path, client, FakeReadClient(client))
+    results = helper.get_many(scripts, depends_on={"b": ["a"], "c": ["a", "b"]})
+    assert sorted(results) == scripts
+    assert all(len(df) == TABLE.num_rows for df in results.values())
+    position = {event: i for i, event in enumerate(client.events)}
+    assert position[("start", "b")] > position[("end", "a")]
+    assert position[("start", "c")] > position[("end", "b")]
+    # Scripts without dependencies run alongside the first one
+    assert position[("start", "d")] < position[("end", "a")]
+
+
+def test_iter_many_limits_concurrent_jobs(tmp_path, scripts):
+    client = ScriptClient()
+    helper = _helper(tmp_path, client, FakeReadClient(client))
+    helper.run_many(scripts, max_concurrent=2)
+    assert sorted(_order(client.events, "end")) == scripts
+    assert client.max_running == 2
+    # run_many does not download results
+    assert client.tables.keys() and not helper._bqstorage_client.sessions
+
+
+def test_iter_many_stops_submitting_after_a_failure(tmp_path, scripts):
+    client = ScriptClient(fail={"a"})
+    helper = _helper(tmp_path, client, FakeReadClient(client))
+    completed = []
+    with pytest.raises(RuntimeError, match="a failed"):
+        for script, _ in helper.iter_many(scripts, depends_on={"b": ["a"], "c": ["b"]}):
+            completed.append(script)
+    # Scripts already running finish and are yielded; dependents of the failure never start
+    assert sorted(completed) == ["d", "e"]
+    assert sorted(_order(client.events, "start")) == ["a", "d", "e"]
+
+
+def test_iter_many_rejects_unknown_and_circular_dependencies(tmp_path, scripts):
+    helper = _helper(tmp_path, ScriptClient())
+    with pytest.raises(ValueError, match="not in the batch"):
+        helper.get_many(["a"], depends_on={"a": ["z"]})
+    with pytest.raises(ValueError, match="Circular"):
+        helper.get_many(["a", "b"], depends_on={"a": ["b"], "b": ["a"]})
+    assert not helper.client.jobs
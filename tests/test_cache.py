@@ -0,0 +1,173 @@
+import multiprocessing
+import threading
+import pytest
+from services import cache as cache_module
+from services.cache import CacheKey, LRUCache, SQLiteCache, cached, canonicalise_query
+
+
+def _key(name: str) -> CacheKey:
+    return CacheKey("search", "v1", (name,))
+
+
+def test_lru_evicts_least_recently_used_and_counts():
+    cache = LRUCache(maxsize=2)
+    cache.set(_key("a"), 1)
+    cache.set(_key("b"), 2)
+    assert cache.get(_key("a")) == 1
+    cache.set(_key("c"), 3)
+    assert cache.get(_key("b")) is None
+    assert cache.get(_key("a")) == 1 and cache.get(_key("c")) == 3
+    info = cache.info()
+    assert (info.hits, info.misses, info.evictions, info.currsize) == (3, 1, 1, 2)
+
+
+def test_lru_ttl_and_byte_bound(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: clock[0])
+    cache = LRUCache(maxsize=10, ttl=5)
+    cache.set(_key("a"), 1)
+    clock[0] = 4.9
+    assert cache.get(_key("a")) == 1
+    clock[0] = 5
+    assert cache.get(_key("a")) is None and cache.info().currsize == 0
+
+    value = list(range(100))
+    cache = LRUCache(maxsize=10, max_bytes=3 * len(cache_module.pickle.dumps(value)))
+    for name in "abcd":
+        cache.set(_key(name), value)
+    assert cache.get(_key("a")) is None and cache.get(_key("d")) == value
+    assert cache.info().bytes <= cache.max_bytes
+    # A value over the bound on its own is not cached
+    cache.set(_key("big"), list(range(10_000)))
+    assert cache.get(_key("big")) is None and cache.get(_key("d")) == value
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_invalidate_keeps_only_the_current_version(tmp_path, backend):
+    cache = cache_module.create_cache(backend, maxsize=10, path=tmp_path / "cache.sqlite")
+    cache.set(CacheKey("search", "v1", ("a",)), 1)
+    cache.set(CacheKey("search", "v2", ("a",)), 2)
+    cache.invalidate("v2")
+    assert cache.get(CacheKey("search", "v1", ("a",))) is None
+    assert cache.get(CacheKey("search", "v2", ("a",))) == 2
+
+
+def test_equivalent_queries_share_an_entry():
+    assert canonicalise_query("Canon  R5 camera") == canonicalise_query("canon r5") == "canon r5"
+    # Only stopwords: the normalised query rather than nothing
+    assert canonicalise_query("  Camera ") == "camera"
+    calls, version = [], ["v1"]
+
+    def key(query):
+        return (canonicalise_query(query),)
+
+    @cached(LRUCache(), key_func=key, version_func=lambda: version[0])
+    def search(query):
+        calls.append(query)
+        return len(calls)
+
+    assert search("Canon  R5") == search("canon r5 camera") == 1
+    version[0] = "v2"
+    assert search("canon r5") == 2
+    assert search.cache.info().hits == 1
+
+
+def test_lru_stays_consistent_under_threads():
+    cache = LRUCache(maxsize=50, max_bytes=50_000)
+    errors = []
+
+    def worker(seed):
+        try:
+            for i in range(2000):
+                key = _key(str((seed * 7919 + i) % 120))
+                if cache.get(key) is None:
+                    cache.set(key, [seed] * (i % 40))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    info = cache.info()
+    assert info.currsize <= 50 and info.bytes <= 50_000
+    assert info.bytes == sum(entry.nbytes for entry in cache._entries.values())
+    assert info.hits + info.misses == 8 * 2000
+
+
+def test_sqlite_hits_only_write_their_read_time_after_the_touch_interval(tmp_path, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: clock[0])
+    cache = SQLiteCache(tmp_path / "cache.sqlite", maxsize=2, touch_interval=10)
+
+    def accessed_at(name):
+        query = "SELECT accessed_at FROM entries WHERE key = ?"
+        return cache._connect().execute(query, (cache._key(_key(name)),)).fetchone()[0]
+
+    cache.set(_key("a"), 1)
+    clock[0] = 1
+    cache.set(_key("b"), 2)
+    clock[0] = 5
+    changes = cache._connect().total_changes
+    assert cache.get(_key("a")) == 1
+    assert accessed_at("a") == 0 and cache._connect().total_changes == changes
+    clock[0] = 20
+    assert cache.get(_key("a")) == 1
+    assert accessed_at("a") == 20
+    # b is now the least recently read
+    cache.set(_key("c"), 3)
+    assert cache.get(_key("b")) is None
+    assert cache.get(_key("a")) == 1 and cache.get(_key("c")) == 3
+
+
+def _read_in_child(path, name, queue):
+    queue.put(SQLiteCache(path).get(_key(name)))
+
+
+def test_sqlite_entries_are_shared_between_processes(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    value = [{"model_name": "sony a7 iii", "combined_score": 0.9}]
+    SQLiteCache(path).set(_key("a"), value)
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_read_in_child, args=(path, "a", queue))
+    process.start()
+    assert queue.get(timeout=30) == value
+    process.join()
+
+
+def test_sqlite_reopens_its_connection_after_a_fork(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.sqlite")
+    cache.set(_key("a"), 1)
+    conn = cache._connect()
+    # As in a pre-forked worker: same object, another process id
+    cache._local.pid = -1
+    assert cache._connect() is not conn
+    assert cache.get(_key("a")) == 1
+
+
+def test_sqlite_ttl_and_byte_bound(tmp_path, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: clock[0])
+    cache = SQLiteCache(tmp_path / "ttl.sqlite", ttl=5)
+    cache.set(_key("a"), 1)
+    clock[0] = 5
+    assert cache.get(_key("a")) is None
+
+    value = bytes(range(256)) * 4
+    size = len(cache_module.zlib.compress(cache_module.pickle.dumps(value, protocol=5)))
+    cache = SQLiteCache(tmp_path / "bytes.sqlite", max_bytes=int(2.5 * size), touch_interval=0)
+    for i, name in enumerate("abc"):
+        clock[0] = 10 + i
+        cache.set(_key(name), value)
+    assert cache.get(_key("a")) is None and cache.get(_key("c")) == value
+    assert cache.info().evictions == 1 and cache.info().bytes <= cache.max_bytes
+
+
+def test_create_cache_rejects_bad_configuration():
+    with pytest.raises(ValueError, match="needs a path"):
+        cache_module.create_cache("sqlite", maxsize=10)
+    with pytest.raises(ValueError, match="Unknown cache backend"):
+        cache_module.create_cache("redis", maxsize=10)
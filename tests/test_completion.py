@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from core.completion import PrefixIndex, normalise_prefix
+
+
+def _index(**kwargs) -> PrefixIndex:
+    df = pd.DataFrame(
+        {
+            "model_name": ["sony a7 iii", "sony a7 iv", "a7c", "canon eos r5", "sony a7 iii"],
+            "brand": ["sony", "sony", "sony", "canon", "sony"],
+            "count_of_buy_products": [50, 80, 20, 30, 60],
+        }
+    )
+    return PrefixIndex.from_df(df, **kwargs)
+
+
+def test_completions_rank_by_popularity():
+    index = _index()
+    # A label weighs as its most popular row
+    assert index.complete("sony a7 i") == ["sony a7 iv", "sony a7 iii"]
+    assert index.complete("sony a7 i", top_k=1) == ["sony a7 iv"]
+    assert index.complete("nikon") == []
+    assert index.complete("   ") == []
+
+
+def test_completions_match_word_suffixes_and_brands():
+    index = _index()
+    assert index.complete("iii") == ["sony a7 iii"]
+    assert index.complete("eos") == ["canon eos r5"]
+    # a7c is also found under its brand
+    assert index.complete("sony a7") == ["sony a7 iv", "sony a7 iii", "a7c"]
+    assert _index(brand_column=None).complete("sony a7") == ["sony a7 iv", "sony a7 iii"]
+
+
+def test_prefixes_are_normalised():
+    index = _index()
+    assert index.complete("  SONY   A7") == index.complete("sony a7")
+    # A trailing space ends the word
+    assert index.complete("sony a7 ") == ["sony a7 iv", "sony a7 iii"]
+    assert normalise_prefix("Sony  A7 ") == "sony a7 "
+
+
+def test_cached_and_searched_prefixes_agree_with_a_scan(catalog):
+    index = PrefixIndex.from_df(catalog, cached_prefix_len=2)
+    labels = np.array(index.labels)
+    rng = np.random.default_rng(0)
+    for key in rng.choice(index.keys, size=50):
+        for length in range(1, 6):
+            prefix = key[:length]
+            matching = {index.key_labels[i] for i, k in enumerate(index.keys) if k.startswith(prefix)}
+            expected = sorted(index.weights[list(matching)], reverse=True)[:10]
+            completions = index.complete(prefix)
+            weights = [index.weights[np.flatnonzero(labels == label)[0]] for label in completions]
+            assert weights == expected
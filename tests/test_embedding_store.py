@@ -0,0 +1,47 @@
+import multiprocessing
+import numpy as np
+import pytest
+from core.embedding_store import EmbeddingStore
+
+
+def _add(path, texts):
+    store = EmbeddingStore(path)
+    store.add_many("model", texts, np.ones((len(texts), 4), dtype=np.float32))
+
+
+def test_store_opened_empty_sees_rows_added_by_another_process(tmp_path):
+    reader = EmbeddingStore(tmp_path)
+    assert reader.get_many("model", ["a"]) == {}
+    process = multiprocessing.get_context("spawn").Process(target=_add, args=(tmp_path, ["a", "b"]))
+    process.start()
+    process.join()
+    found = reader.get_many("model", ["a", "b", "c"])
+    assert sorted(found) == ["a", "b"]
+    np.testing.assert_array_equal(found["a"], np.ones(4, dtype=np.float32))
+
+
+def test_keys_are_per_model_and_first_row_wins(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    store.add_many("model", ["a"], np.zeros((1, 4)))
+    store.add_many("model", ["a", "b"], np.ones((2, 4)))
+    assert store.get_many("other", ["a"]) == {}
+    found = store.get_many("model", ["a", "b"])
+    np.testing.assert_array_equal(found["a"], np.zeros(4))
+    np.testing.assert_array_equal(found["b"], np.ones(4))
+    assert len(EmbeddingStore(tmp_path)) == 2
+
+
+def test_first_append_respects_a_store_created_since_opening(tmp_path):
+    writer = EmbeddingStore(tmp_path)
+    process = multiprocessing.get_context("spawn").Process(target=_add, args=(tmp_path, ["a"]))
+    process.start()
+    process.join()
+    with pytest.raises(ValueError, match="does not match"):
+        writer.add_many("model", ["b"], np.ones((1, 8)))
+    assert EmbeddingStore(tmp_path).dim == 4
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        EmbeddingStore.KEYS_FILE,
+        EmbeddingStore.LOCK_FILE,
+        EmbeddingStore.META_FILE,
+        EmbeddingStore.VECTORS_FILE,
+    ]
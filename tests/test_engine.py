@@ -0,0 +1,226 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from core import engine as engine_module
+from config.settings import Market
+from core.dataset import Dataset
+from core.engine import SearchEngine
+from core.matchers import (
+    ExactMatcher,
+    FuzzyMatcher,
+    IndexSpec,
+    PopularMatcher,
+    SemanticMatcher,
+    SubsetMatcher,
+)
+
+WEIGHTS = {
+    "fuzzy_model": 0.5,
+    "fuzzy_brand": 0.1,
+    "fuzzy_blob": 0.2,
+    "semantic_model": 0.4,
+    "exact_model": 0.1,
+    "exact_blob": 0.1,
+    "popular": 0.1,
+}
+QUERIES = ["canon eos r5", "sony", "f/2.8", "c", "zzz", "nikon z6 ii 12", "50mm art"]
+
+
+def _matchers(df, encoder):
+    return {
+        "fuzzy_model": FuzzyMatcher(column="model_name", df=df),
+        "fuzzy_brand": FuzzyMatcher(column="brand", df=df),
+        "fuzzy_blob": FuzzyMatcher(column="blob", df=df),
+        "semantic_model": SemanticMatcher(
+            embedding_column="model_name_embedding",
+            encoder=encoder,
+            df=df,
+            key_column="model_name",
+        ),
+        "exact_model": ExactMatcher(column="model_name", df=df),
+        "exact_blob": ExactMatcher(column="blob", df=df),
+    }
+
+
+@pytest.fixture
+def dataset(catalog, encoder):
+    dataset = Dataset("query", None, None, market=None)
+    dataset._df = encoder.embed_columns(catalog, columns=["model_name"])
+    return dataset
+
+
+@pytest.fixture
+def engine(dataset, encoder):
+    matchers = _matchers(dataset.df, encoder)
+    matchers["popular"] = PopularMatcher("count_of_buy_products", dataset.df)
+    return SearchEngine(dataset, matchers)
+
+
+@pytest.fixture
+def market_engine(dataset, encoder):
+    # One market's view of matchers built over every market, as bootstrap builds them
+    shared = _matchers(dataset.df, encoder)
+    view = dataset.market_view(Market.US)
+    matchers = {
+        name: SubsetMatcher(matcher, view.row_ids, view.df) for name, matcher in shared.items()
+    }
+    matchers["popular"] = PopularMatcher("count_of_buy_products", view.df)
+    return SearchEngine(view, matchers)
+
+
+def _assert_same_ranking(expected, actual):
+    np.testing.assert_allclose(actual.combined, expected.combined, rtol=1e-6, atol=1e-6)
+    np.testing.assert_array_equal(actual.ids, expected.ids)
+    for matcher, scores in expected.scores.items():
+        np.testing.assert_allclose(actual.scores[matcher], scores, rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize("engine_name", ["engine", "market_engine"])
+@pytest.mark.parametrize("query", QUERIES)
+def test_staged_matches_dense_when_pools_cover_catalog(request, engine_name, query):
+    engine = request.getfixturevalue(engine_name)
+    pools = dict.fromkeys(["exact_model", "semantic_model", "popular"], len(engine.dataset.df))
+    expected = engine._rank_dense(query, WEIGHTS, 10)
+    _assert_same_ranking(expected, engine._rank_staged(query, WEIGHTS, 10, pools))
+
+
+@pytest.mark.parametrize("strategy", list(SearchEngine.STRATEGIES))
+def test_strategies_return_nothing_without_positive_weights(engine, strategy):
+    engine.candidate_pools = dict.fromkeys(["exact_model", "semantic_model"], 50)
+    ranking = getattr(engine, SearchEngine.STRATEGIES[strategy])
+    assert ranking("canon eos", {"nope": 1, "fuzzy_model": 0}, 10) is None
+
+
+def test_subset_matcher_scores_match_a_matcher_built_on_the_subset(dataset, encoder):
+    view = dataset.market_view(Market.EU)
+    shared = _matchers(dataset.df, encoder)
+    local = _matchers(view.df, encoder)
+    ids = np.arange(0, len(view.df), 3)
+    for name, matcher in shared.items():
+        subset = SubsetMatcher(matcher, view.row_ids, view.df)
+        for query in QUERIES:
+            np.testing.assert_allclose(subset.match(query), local[name].match(query), rtol=1e-6)
+            np.testing.assert_allclose(
+                subset.match_ids(query, ids), local[name].match_ids(query, ids), rtol=1e-6
+            )
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        IndexSpec(kind="hnsw", hnsw_m=4, ef_search=4),
+        IndexSpec(kind="ivf_flat", nlist=16, nprobe=1),
+    ],
+    ids=lambda spec: spec.kind,
+)
+def test_semantic_match_scores_every_row_with_approximate_indexes(dataset, encoder, spec):
+    def matcher(index_spec):
+        return SemanticMatcher("model_name_embedding", encoder, dataset.df, index_spec=index_spec)
+
+    exact, approximate = matcher(None), matcher(spec)
+    for query in QUERIES:
+        np.testing.assert_allclose(approximate.match(query), exact.match(query), atol=1e-6)
+    np.testing.assert_allclose(
+        approximate.match_many(QUERIES), exact.match_many(QUERIES), atol=1e-6
+    )
+
+
+class CountingMatcher:
+    """Wraps a matcher, recording how many rows each call scored."""
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.scored = []
+
+    def __getattr__(self, name):
+        return getattr(self.matcher, name)
+
+    def match(self, query):
+        self.scored.append(len(self.matcher.df))
+        return self.matcher.match(query)
+
+    def match_ids(self, query, ids):
+        self.scored.append(len(ids))
+        return self.matcher.match_ids(query, ids)
+
+
+def test_staged_reranks_only_the_candidate_pool(engine):
+    engine.matchers["fuzzy_blob"] = fuzzy = CountingMatcher(engine.matchers["fuzzy_blob"])
+    pools = {"exact_model": 20, "semantic_model": 20, "popular": 20}
+    ids = engine.candidate_ids("canon eos r5", pools)
+    assert 20 <= len(ids) < len(engine.dataset.df) // 4
+    ranking = engine._rank_staged("canon eos r5", WEIGHTS, 5, pools)
+    assert fuzzy.scored == [len(ids)]
+    assert len(ranking.ids) == 5 and np.isin(ranking.ids, ids).all()
+
+
+def test_recall_at_k_is_complete_when_pools_cover_the_catalog(engine):
+    n = len(engine.dataset.df)
+    full = dict.fromkeys(["exact_model", "semantic_model", "popular"], n)
+    report = engine.recall_at_k(QUERIES[:3], WEIGHTS, top_k=10, candidate_pools=full)
+    assert list(report.columns) == ["query", "candidates", "recall@10"]
+    assert (report["recall@10"] == 1.0).all()
+    small = engine.recall_at_k(QUERIES[:3], WEIGHTS, top_k=10, candidate_pools={"popular": 5})
+    assert (small["candidates"] == 5).all() and (small["recall@10"] <= 0.5).all()
+
+
+@pytest.mark.parametrize("engine_name", ["engine", "market_engine"])
+def test_search_many_matches_one_query_at_a_time(request, engine_name):
+    engine = request.getfixturevalue(engine_name)
+    # Batches of 3 split the queries unevenly
+    batch = engine.search_many_records(QUERIES, WEIGHTS, top_k=5, batch_size=3)
+    assert batch == [engine.search_records(query, WEIGHTS, top_k=5) for query in QUERIES]
+    assert engine.search_many_records([], WEIGHTS) == []
+    assert engine.search_many_records(["sony"], {"fuzzy_model": 0}) == [[]]
+
+
+class BarrierMatcher:
+    """Matcher that only returns once `parties` matchers are running at the same time."""
+
+    def __init__(self, df, barrier):
+        self.df = df
+        self.barrier = barrier
+
+    def match(self, query):
+        self.barrier.wait(timeout=1)
+        return np.ones(len(self.df), dtype=np.float32)
+
+
+def test_parallel_engine_ranks_as_the_sequential_one(engine):
+    sequential = engine._rank_dense("canon eos r5", WEIGHTS, 10)
+    engine.parallel = True
+    parallel = engine._rank_dense("canon eos r5", WEIGHTS, 10)
+    _assert_same_ranking(sequential, parallel)
+    assert list(parallel.timings) == list(WEIGHTS)
+    assert all(seconds >= 0 for seconds in parallel.timings.values())
+    batch = engine.search_many_records(QUERIES, WEIGHTS, top_k=5)
+    engine.parallel = False
+    assert batch == engine.search_many_records(QUERIES, WEIGHTS, top_k=5)
+
+
+def test_parallel_engine_runs_matchers_concurrently(dataset, monkeypatch):
+    barrier = threading.Barrier(2)
+    matchers = {name: BarrierMatcher(dataset.df, barrier) for name in ["a", "b"]}
+    engine = SearchEngine(dataset, matchers, parallel=True)
+    # The shared pool is sized to the host, which may have a single core
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        monkeypatch.setattr(engine_module, "_matcher_pool", pool)
+        ranking = engine._rank_dense("sony", {"a": 1, "b": 1}, 3)
+    np.testing.assert_allclose(ranking.combined, 1)
+    # Sequentially the first matcher would wait for the second forever
+    engine.parallel = False
+    with pytest.raises(threading.BrokenBarrierError):
+        engine._rank_dense("sony", {"a": 1, "b": 1}, 3)
+
+
+class FailingMatcher:
+    def match(self, query):
+        raise RuntimeError("matcher failed")
+
+
+def test_parallel_engine_propagates_matcher_errors(engine):
+    engine.parallel = True
+    engine.matchers["exact_blob"] = FailingMatcher()
+    with pytest.raises(RuntimeError, match="matcher failed"):
+        engine._rank_dense("sony", WEIGHTS, 10)
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import types
+import numpy as np
+import pytest
+from core.dataset import Dataset
+from core.engine import SearchCancelled, SearchEngine, check_cancelled
+from core.matchers import PopularMatcher
+from services.executor import BoundedExecutor, ExecutorBusy
+
+
+def test_full_executor_rejects_calls_until_a_slot_frees():
+    async def scenario():
+        executor = BoundedExecutor(max_workers=1, max_pending=2)
+        release = threading.Event()
+        first = asyncio.ensure_future(executor.run(release.wait))
+        second = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorBusy):
+            await executor.run(lambda: None)
+        # An abandoned call keeps its slot until its thread finishes
+        first.cancel()
+        await asyncio.sleep(0.05)
+        assert executor.pending == 2
+        release.set()
+        await second
+        await asyncio.sleep(0.05)
+        assert executor.pending == 0
+        assert await executor.run(lambda x: x + 1, 1) == 2
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+class StepMatcher:
+    """Scores nothing; sets `event` once called, as a disconnect would mid-search."""
+
+    def __init__(self, df, event=None):
+        self.df = df
+        self.event = event
+        self.calls = 0
+
+    def match(self, query):
+        self.calls += 1
+        if self.event is not None:
+            self.event.set()
+        return np.zeros(len(self.df), dtype=np.float32)
+
+
+def test_cancel_stops_a_search_at_the_next_matcher(catalog):
+    async def scenario():
+        dataset = Dataset("query", None, None, market=None)
+        dataset._df = catalog
+        cancel = threading.Event()
+        first, second = StepMatcher(catalog, cancel), StepMatcher(catalog)
+        engine = SearchEngine(
+            dataset,
+            {"a": first, "b": second, "popular": PopularMatcher("count_of_buy_products", catalog)},
+        )
+        executor = BoundedExecutor(max_workers=1, max_pending=1)
+        with pytest.raises(SearchCancelled):
+            await executor.run(engine.search, "sony", {"a": 1, "b": 1, "popular": 1}, cancel=cancel)
+        assert (first.calls, second.calls) == (1, 0)
+        # The event only reaches calls it was passed to
+        assert len(await executor.run(engine.search, "sony", {"popular": 1})) == 10
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_run_search_cancels_when_the_client_disconnects(search_service):
+    import asgi
+
+    async def scenario():
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        started, stopped = threading.Event(), threading.Event()
+
+        def search():
+            started.set()
+            while True:
+                try:
+                    check_cancelled()
+                except SearchCancelled:
+                    stopped.set()
+                    raise
+                started.wait(0.01)
+
+        request = types.SimpleNamespace(receive=receive)
+        task = asyncio.ensure_future(asgi.run_search(request, search))
+        await asyncio.sleep(0.05)
+        assert started.is_set() and not task.done()
+        disconnected.set()
+        with pytest.raises(asgi.ClientDisconnected):
+            await task
+        assert await asyncio.to_thread(stopped.wait, 5)
+
+    asyncio.run(scenario())
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from config.settings import Market
+from core.dataset import Dataset
+from core.engine import SearchEngine
+from core.matchers import (
+    SCORE_DTYPE,
+    ExactMatcher,
+    FuzzyMatcher,
+    PopularMatcher,
+    SemanticMatcher,
+    SubsetMatcher,
+)
+
+QUERIES = ["canon eos r5", "sony", "f/2.8", "zzz", ""]
+
+
+@pytest.fixture
+def dataset(catalog, encoder):
+    dataset = Dataset("query", None, None, market=None)
+    dataset._df = encoder.embed_columns(catalog, columns=["model_name"])
+    return dataset
+
+
+@pytest.fixture
+def matchers(dataset, encoder):
+    df = dataset.df
+    matchers = {
+        "fuzzy": FuzzyMatcher(column="model_name", df=df),
+        "semantic": SemanticMatcher(
+            embedding_column="model_name_embedding",
+            encoder=encoder,
+            df=df,
+            key_column="model_name",
+        ),
+        "exact": ExactMatcher(column="blob", df=df),
+        "popular": PopularMatcher("count_of_buy_products", df),
+    }
+    view = dataset.market_view(Market.US)
+    matchers["subset"] = SubsetMatcher(matchers["fuzzy"], view.row_ids, view.df)
+    return matchers
+
+
+@pytest.mark.parametrize("name", ["fuzzy", "semantic", "exact", "popular", "subset"])
+def test_matchers_return_float32_arrays(matchers, name):
+    matcher = matchers[name]
+    n = len(matcher.df)
+    for query in QUERIES:
+        scores = matcher.match(query)
+        assert isinstance(scores, np.ndarray)
+        assert scores.dtype == SCORE_DTYPE and scores.shape == (n,)
+    batch = matcher.match_many(QUERIES)
+    assert batch.dtype == SCORE_DTYPE and batch.shape == (len(QUERIES), n)
+    expected = np.stack([matcher.match(query) for query in QUERIES])
+    np.testing.assert_allclose(batch, expected, rtol=1e-5, atol=1e-6)
+    assert matcher.match_many([]).shape == (0, n)
+
+
+def test_popular_scores_are_a_shared_read_only_array(matchers):
+    popular = matchers["popular"]
+    scores = popular.match("canon")
+    assert scores is popular.match("sony")
+    with pytest.raises(ValueError):
+        scores[0] = 1
+
+
+def test_dense_fusion_reuses_its_buffers(dataset, matchers):
+    engine = SearchEngine(dataset, {name: matchers[name] for name in ["fuzzy", "popular"]})
+    weights = {"fuzzy": 0.8, "popular": 0.2}
+    popularity = matchers["popular"].scores.copy()
+    first = engine._rank_dense("canon", weights, 5)
+    buffers = engine._score_buffers(len(dataset.df))
+    second = engine._rank_dense("sony", weights, 5)
+    assert engine._score_buffers(len(dataset.df))[0] is buffers[0]
+    # Rankings hold copies, not views of the reused buffer
+    assert not np.shares_memory(first.combined, buffers[0])
+    assert not np.array_equal(first.ids, second.ids)
+    np.testing.assert_array_equal(matchers["popular"].scores, popularity)
+    expected = 0.8 * matchers["fuzzy"].match("sony") + 0.2 * popularity
+    np.testing.assert_allclose(second.combined, expected[second.ids], rtol=1e-6)
+
+
+@pytest.mark.parametrize("name", ["fuzzy", "semantic", "exact", "popular", "subset"])
+def test_subset_scores_and_top_candidates_agree_with_match(matchers, name):
+    matcher = matchers[name]
+    ids = np.arange(0, len(matcher.df), 7)
+    for query in QUERIES[:-1]:
+        scores = matcher.match(query)
+        np.testing.assert_allclose(matcher.match_ids(query, ids), scores[ids], rtol=1e-5, atol=1e-6)
+        top = matcher.match_top(query, 20)
+        np.testing.assert_allclose(top.scores, scores[top.ids], rtol=1e-5, atol=1e-6)
+        # No row left out scores above the bound
+        unseen = np.setdiff1d(np.arange(len(scores)), top.ids)
+        assert scores[unseen].max() <= top.bound + 1e-6
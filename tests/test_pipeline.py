@@ -0,0 +1,176 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from config.settings import Market
+from core.dataset import Dataset
+from core.pipeline import Pipeline, build_pipeline, step_identity
+from core.transforms import (
+    blob,
+    drop_na,
+    normalise,
+    remove_duplicates,
+    remove_stopwords,
+    row_wise,
+)
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+STEPS = [normalise, remove_stopwords, remove_duplicates, blob, drop_na]
+
+
+def _identities_in_subprocess(hash_seed: str) -> list[str]:
+    names = ", ".join(step.__name__ for step in STEPS)
+    script = (
+        "from core.pipeline import step_identity\n"
+        f"from core.transforms import {names}\n"
+        f"for step in [{names}]:\n"
+        "    print(step_identity(step).encode().hex())\n"
+    )
+    env = {**os.environ, "PYTHONPATH": str(SRC), "PYTHONHASHSEED": hash_seed}
+    out = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True)
+    return [bytes.fromhex(line).decode() for line in out.stdout.split()]
+
+
+def test_step_identity_is_stable_across_interpreters():
+    first, second = _identities_in_subprocess("1"), _identities_in_subprocess("2")
+    assert first == second == [step_identity(step) for step in STEPS]
+
+
+@pytest.mark.parametrize("step", STEPS, ids=lambda step: step.__name__)
+def test_step_identity_has_no_memory_addresses(step):
+    assert " at 0x" not in step_identity(step)
+
+
+def test_step_identity_changes_with_nested_code():
+    def outer(values):
+        return [value + 1 for value in values]
+
+    def edited(values):
+        return [value + 2 for value in values]
+
+    edited.__qualname__ = outer.__qualname__
+    assert step_identity(outer) != step_identity(edited)
+
+
+HELPER_STEP = """
+def _helper(values):
+    return [value + {increment} for value in values]
+
+def _unused(values):
+    return values
+
+def step(values):
+    return _helper(values)
+"""
+
+
+def _step(increment: int):
+    namespace = {"__name__": "steps.module"}
+    exec(HELPER_STEP.format(increment=increment), namespace)
+    return namespace["step"]
+
+
+def test_step_identity_changes_with_module_helpers():
+    assert step_identity(_step(1)) == step_identity(_step(1))
+    assert step_identity(_step(1)) != step_identity(_step(2))
+    assert "steps.module._unused" not in step_identity(_step(1))
+    assert "core.transforms._words" in step_identity(remove_stopwords)
+    assert "core.transforms._join_words" in step_identity(remove_duplicates)
+
+
+def _raw(catalog: pd.DataFrame) -> pd.DataFrame:
+    # The query result, before the pipeline adds the blob
+    return catalog.drop(columns="blob")
+
+
+def _batches(df: pd.DataFrame, size: int):
+    return [
+        df.iloc[start : start + size].reset_index(drop=True) for start in range(0, len(df), size)
+    ]
+
+
+def test_streamed_run_matches_a_full_run(tmp_path, catalog, encoder):
+    raw = _raw(catalog)
+    expected = build_pipeline(encoder).run(raw.copy())
+    pipeline = build_pipeline(encoder)
+    save_path = tmp_path / "db_prod.parquet"
+    streamed = pipeline.run_stream(_batches(raw, 100), save_path)
+    pd.testing.assert_frame_equal(streamed, expected)
+    pd.testing.assert_frame_equal(pd.read_parquet(save_path), expected)
+    # The batched steps report every row, then log_normalise runs on the whole result
+    streamed_steps = pipeline.report[:-1]
+    assert [report.rows_in for report in streamed_steps] == [len(raw)] * len(streamed_steps)
+    assert pipeline.report[-1].step == "log_normalise"
+
+
+@row_wise
+def _passthrough(df: pd.DataFrame) -> pd.DataFrame:
+    return df
+
+
+def test_streamed_batches_become_row_groups(tmp_path, catalog):
+    save_path = tmp_path / "out.parquet"
+    batches = _batches(_raw(catalog), 250)
+    batches.insert(1, batches[0].iloc[:0])
+    Pipeline().add_step(_passthrough).run_stream(batches, save_path)
+    metadata = pq.ParquetFile(save_path).metadata
+    # The empty batch writes no row group
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [
+        len(batch) for batch in batches if len(batch)
+    ]
+
+
+def test_stream_holds_a_bounded_number_of_batches(tmp_path, catalog):
+    produced = []
+    ahead = []
+
+    def batches():
+        for i, batch in enumerate(_batches(_raw(catalog), 10)):
+            produced.append(i)
+            yield batch
+
+    @row_wise
+    def consume(df: pd.DataFrame) -> pd.DataFrame:
+        ahead.append(len(produced) - len(ahead))
+        return df
+
+    pipeline = Pipeline().add_step(_passthrough).add_step(consume)
+    pipeline.run_stream(batches(), tmp_path / "out.parquet", prefetch=1)
+    assert len(ahead) > 20
+    # One queued and one in hand per stage, rather than the whole result
+    assert max(ahead) <= 6
+
+
+def test_failed_stream_leaves_no_output(tmp_path, catalog):
+    def batches():
+        yield _raw(catalog).iloc[:10]
+        raise RuntimeError("page fetch failed")
+
+    save_path = tmp_path / "out.parquet"
+    with pytest.raises(RuntimeError, match="page fetch failed"):
+        Pipeline().add_step(_passthrough).run_stream(batches(), save_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+class FakeBQHelper:
+    def __init__(self, table: pa.Table):
+        self.table = table
+
+    def iter_batches(self, query_file):
+        return iter(self.table.to_batches(max_chunksize=64))
+
+
+def test_dataset_stream_prepare_reads_query_pages(tmp_path, catalog, encoder):
+    raw = _raw(catalog)
+    helper = FakeBQHelper(pa.Table.from_pandas(raw, preserve_index=False))
+    dataset = Dataset("query", helper, None, market=Market.US)
+    save_path = tmp_path / "db_prod.parquet"
+    df = dataset.stream_prepare(build_pipeline(encoder, embed=False), save_path)
+    us = raw[raw["market"] == "US"].reset_index(drop=True)
+    expected = build_pipeline(encoder, embed=False).run(us)
+    pd.testing.assert_frame_equal(df, expected)
+    assert dataset.df is df
@@ -0,0 +1,184 @@
+import sqlite3
+import sys
+import types
+import numpy as np
+import pandas as pd
+import pytest
+from core.pipeline import build_pipeline
+from config.settings import EMBEDDING_COLUMNS, ROOT
+from services.refresh import COUNT_COLUMN, DatasetRefresher, apply_delta
+
+SNAPSHOT = pd.Timestamp("2026-01-01")
+NEXT_SNAPSHOT = pd.Timestamp("2026-01-08")
+EMBEDDINGS = [f"{column}_embedding" for column in EMBEDDING_COLUMNS]
+
+
+@pytest.fixture
+def raw(catalog):
+    # One market, so remove_duplicates keeps every row
+    return catalog[catalog["market"] == "UK"].reset_index(drop=True)
+
+
+@pytest.fixture
+def processed(raw, encoder):
+    return build_pipeline(model=encoder).run(raw.copy())
+
+
+def _delta(raw: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Next snapshot of raw (one count changed, one row deleted, one row added, a new
+    largest count) and the rows DELTA_QUERY_FILE returns for it.
+    """
+    latest = raw.copy()
+    latest.loc[0, "count_of_buy_products"] = 10_000
+    latest.loc[1, "count_of_buy_products"] += 1
+    deleted = latest.iloc[[2]]
+    latest = latest.drop(index=2)
+    added = latest.iloc[[3]].assign(model_id=9_999, model_name="sony a1 new")
+    latest = pd.concat([latest, added], ignore_index=True).assign(report_date=NEXT_SNAPSHOT)
+    changes = pd.concat(
+        [
+            latest.iloc[[0, 1]].assign(change_type="upsert"),
+            latest.iloc[[-1]].assign(change_type="upsert"),
+            deleted.assign(change_type="delete", report_date=NEXT_SNAPSHOT),
+        ],
+        ignore_index=True,
+    )
+    changes["previous_max_count"] = raw["count_of_buy_products"].max()
+    changes["current_max_count"] = latest["count_of_buy_products"].max()
+    return latest, changes
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(["model_id", "market"]).reset_index(drop=True)
+
+
+def test_apply_delta_is_idempotent(raw, processed, encoder):
+    _, delta = _delta(raw)
+    once = apply_delta(processed, delta, encoder)
+    twice = apply_delta(once, delta, encoder)
+    pd.testing.assert_frame_equal(_sorted(twice), _sorted(once))
+
+
+def test_apply_delta_matches_the_next_snapshot(raw, processed, encoder):
+    latest, delta = _delta(raw)
+    patched = _sorted(apply_delta(processed, delta, encoder))
+    expected = _sorted(build_pipeline(model=encoder).run(latest.copy()))
+    assert patched["model_id"].tolist() == expected["model_id"].tolist()
+    assert (patched["report_date"] == NEXT_SNAPSHOT).all()
+    # Kept counts are rescaled from rounded values, so allow the rounding error
+    np.testing.assert_allclose(
+        patched["count_of_buy_products"], expected["count_of_buy_products"], atol=2e-3
+    )
+    for column in EMBEDDINGS:
+        np.testing.assert_allclose(np.stack(patched[column]), np.stack(expected[column]))
+
+
+class _Holder:
+    def __init__(self, df: pd.DataFrame):
+        self.current = types.SimpleNamespace(dataset=types.SimpleNamespace(df=df))
+        self.swaps = 0
+
+    def swap(self, state):
+        self.current = state
+        self.swaps += 1
+
+
+class _Delta:
+    def __init__(self, delta: pd.DataFrame):
+        self.delta = delta
+        self.calls = 0
+
+    def get(self, script, since_report_date):
+        self.calls += 1
+        if pd.Timestamp(since_report_date) >= NEXT_SNAPSHOT:
+            return pd.DataFrame()
+        return self.delta
+
+
+def test_one_refresher_per_node_patches_the_file(
+    raw, processed, encoder, tmp_path, monkeypatch
+):
+    # Stand-in for bootstrap, whose import builds the default engine
+    bootstrap = types.SimpleNamespace(
+        build_engine_state=lambda dataset, model: types.SimpleNamespace(dataset=dataset)
+    )
+    monkeypatch.setitem(sys.modules, "bootstrap.bootstrap", bootstrap)
+    save_path = tmp_path / "db_prod.parquet"
+    processed.to_parquet(save_path, index=False)
+    _, delta = _delta(raw)
+    bq = _Delta(delta)
+    workers = [
+        DatasetRefresher(_Holder(processed), bq, encoder, interval=1, save_path=save_path)
+        for _ in range(3)
+    ]
+    try:
+        assert [worker.refresh() for worker in workers] == [True, True, True]
+        # Only the lock holder queried BigQuery; the others reloaded its file
+        assert bq.calls == 1
+        expected = _sorted(apply_delta(processed, delta, encoder))
+        pd.testing.assert_frame_equal(_sorted(pd.read_parquet(save_path)), expected)
+        for worker in workers:
+            pd.testing.assert_frame_equal(_sorted(worker.holder.current.dataset.df), expected)
+        # Nothing changed since: no refresher swaps again or re-applies the delta
+        assert [worker.refresh() for worker in workers] == [False, False, False]
+        assert bq.calls == 2
+    finally:
+        for worker in workers:
+            worker.stop()
+
+
+def _run_sql(connection, name: str, **params) -> pd.DataFrame:
+    # BigQuery's `project.dataset.table` quoting names a single table in SQLite too
+    sql = (ROOT / "sql" / f"{name}.sql").read_text()
+    sql = sql.format(read_project="project", daw_dataset="daw", **params)
+    return pd.read_sql_query(sql, connection).assign(
+        report_date=lambda df: pd.to_datetime(df["report_date"])
+    )
+
+
+def _tables(connection, history: pd.DataFrame, smv: pd.DataFrame) -> None:
+    history = history.assign(
+        market=history["market"].str.lower(),
+        report_date=history["report_date"].dt.strftime("%Y-%m-%d"),
+    )
+    history.to_sql(
+        "project.daw.model_performance_group_history", connection, if_exists="replace"
+    )
+    smv.to_sql("project.daw.SMV", connection, if_exists="replace")
+
+
+def test_delta_refresh_equals_a_full_reload(raw, encoder):
+    perf = ["model_id", "model_name", "market", "performance_group", "count_of_buy_products"]
+    brand = ["model_id", "brand", "primary_category", "secondary_category", "product_type"]
+    brand += ["product_system"]
+    history = raw[perf + ["report_date"]]
+    smv = raw[brand].drop_duplicates("model_id")
+    latest, _ = _delta(raw)
+    connection = sqlite3.connect(":memory:")
+
+    _tables(connection, history, smv)
+    processed = build_pipeline(model=encoder).run(
+        _run_sql(connection, "get_raw_model_database")
+    )
+
+    # Next snapshot, plus SMV edits: a renamed brand on a row whose counts did not change,
+    # a model gone from SMV (so from the full query) and the SMV row of the added model
+    smv = pd.concat([smv, latest[brand].iloc[[-1]]], ignore_index=True)
+    smv.loc[smv["model_id"] == latest.loc[5, "model_id"], "brand"] = "Renamed"
+    smv = smv[smv["model_id"] != latest.loc[6, "model_id"]]
+    _tables(connection, pd.concat([history, latest[perf + ["report_date"]]]), smv)
+
+    full = _sorted(
+        build_pipeline(model=encoder).run(_run_sql(connection, "get_raw_model_database"))
+    )
+    delta = _run_sql(connection, "get_model_database_delta", since_report_date="2026-01-01")
+    patched = _sorted(apply_delta(processed, delta, encoder))
+    assert set(delta["change_type"]) == {"upsert", "delete", "unchanged"}
+    assert "renamed" in patched["brand"].tolist()
+    # Kept counts are rescaled from rounded values, so allow the rounding error
+    exact = [column for column in full.columns if column not in [COUNT_COLUMN, *EMBEDDINGS]]
+    pd.testing.assert_frame_equal(patched[exact], full[exact])
+    np.testing.assert_allclose(patched[COUNT_COLUMN], full[COUNT_COLUMN], atol=2e-3)
+    for column in EMBEDDINGS:
+        np.testing.assert_allclose(np.stack(patched[column]), np.stack(full[column]))
@@ -0,0 +1,35 @@
+from config.settings import MARKET
+
+
+def test_suggestions_search_the_normalised_prefix(search_service, monkeypatch):
+    engine = search_service.engine.current.search_engines[MARKET]
+    searched = []
+    search_records = engine.search_records
+
+    def record(query, *args, **kwargs):
+        searched.append(query)
+        return search_records(query, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "search_records", record)
+    # Nothing starts with it, so the suggestions come from the search engine
+    suggestions = search_service.get_suggestions("  SONY   a7  Qqq")
+    assert searched == ["sony a7 qqq"]
+    assert suggestions
+    # The entry it shares with the normalised partial holds that partial's suggestions
+    uncached = search_service.get_suggestions.__wrapped__("sony a7 qqq")
+    assert search_service.get_suggestions("sony a7 qqq") == suggestions == uncached
+
+
+def test_suggestions_come_from_the_completion_index(search_service, monkeypatch):
+    engine = search_service.engine.current.search_engines[MARKET]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the search engine was used")
+
+    monkeypatch.setattr(engine, "search_records", fail)
+    monkeypatch.setattr(engine.matchers["semantic_model"].encoder, "encode", fail)
+    suggestions = search_service.get_suggestions("Canon")
+    assert suggestions and all(s.startswith("canon") for s in suggestions)
+    # Nothing typed yet: the market's most popular models
+    popular = engine.dataset.df.sort_values("count_of_buy_products", ascending=False)
+    assert search_service.get_suggestions("", top_k=3) == popular["model_name"].head(3).tolist()
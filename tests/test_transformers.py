@@ -0,0 +1,34 @@
+import sys
+import pytest
+import torch
+from core import transformers
+from core.transformers import OnnxTransformerWrapper, SentenceTransformerWrapper
+
+
+class FakeSentenceTransformer(torch.nn.Module):
+    """Stands in for a hub model; `commit` is the commit an unpinned revision resolves to."""
+
+    commit = 0
+    max_seq_length = 256
+
+    def __init__(self, model_name, revision=None):
+        super().__init__()
+        torch.manual_seed(self.commit)
+        self.dense = torch.nn.Linear(4, 4)
+        self.half = torch.nn.Linear(4, 4).to(torch.bfloat16)
+
+
+def test_fingerprint_follows_the_loaded_weights(monkeypatch):
+    monkeypatch.setattr(transformers, "SentenceTransformer", FakeSentenceTransformer)
+    first = SentenceTransformerWrapper("model")
+    assert SentenceTransformerWrapper("model").fingerprint == first.fingerprint
+    # A new commit was pushed to the hub
+    monkeypatch.setattr(FakeSentenceTransformer, "commit", 1)
+    assert SentenceTransformerWrapper("model").fingerprint != first.fingerprint
+
+
+def test_onnx_backend_names_the_extra_when_onnxruntime_is_missing(tmp_path, monkeypatch):
+    # None in sys.modules makes the import fail, whether or not it is installed
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    with pytest.raises(ImportError, match="--extra onnx"):
+        OnnxTransformerWrapper(tmp_path)
@@ -0,0 +1,36 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+from core.transforms import (
+    normalise,
+    normalise_text,
+    remove_duplicates,
+    remove_stopwords,
+    strip_stopwords,
+)
+
+STOPWORDS = {"camera", "body"}
+TEXTS = ["  Canon EOS R5 Camera ", "sony  a7 III body", "", None, "İstanbul Σ", "nikon\x1cz6"]
+
+
+def _columns(texts: list) -> list[pd.Series]:
+    # Object, NumPy-free string and multi-chunk Arrow-backed columns
+    chunked = pd.Series(
+        pd.arrays.ArrowExtensionArray(pa.chunked_array([texts[:2], texts[2:]], pa.string()))
+    )
+    return [pd.Series(texts, dtype=object), pd.Series(texts, dtype="string"), chunked]
+
+
+@pytest.mark.parametrize("column", _columns(TEXTS), ids=["object", "string", "arrow"])
+def test_text_transforms_match_their_scalar_forms(column):
+    df = pd.DataFrame({"text": column})
+    expected = [None if pd.isna(t) else normalise_text(t) for t in TEXTS]
+    assert [None if pd.isna(t) else t for t in normalise(df.copy(), ["text"])["text"]] == expected
+    expected = [None if pd.isna(t) else strip_stopwords(t, STOPWORDS) for t in TEXTS]
+    stripped = remove_stopwords(df.copy(), ["text"], STOPWORDS)["text"]
+    assert [None if pd.isna(t) else t for t in stripped] == expected
+
+
+def test_remove_duplicates_keeps_first_occurrence_order():
+    df = pd.DataFrame({"blob": _columns(["a b a c b", "x", None, "b b"])[2]})
+    assert remove_duplicates(df, ["blob"])["blob"].tolist()[:2] == ["a b c", "x"]